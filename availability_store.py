@@ -0,0 +1,135 @@
+# Bit-packed availability: A boolean matrix on the grid of the region stored with 1 bit per pixel (np.packbits along the
+# rows, the first pixel of a byte is its most significant bit), optionally backed by a memory-mapped .npy file. The
+# sweep keeps the fixed, unrestricted and exclusion set availability in such stores, so the worker processes share one
+# memory-mapped copy at an eighth of the size of a boolean matrix. All operations work in place and in blocks of rows.
+from typing import Iterator, Tuple, Union
+
+import numpy as np
+
+# Number of set bits of every byte value
+_popcount = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+# Another store or a boolean matrix of the same shape
+Mask = Union["AvailabilityStore", np.ndarray]
+
+
+class AvailabilityStore:
+    def __init__(self, bits: np.ndarray, cols: int, block_rows: int = 2048):
+        """
+        :param bits: Packed matrix of shape (rows, ceil(cols / 8)), e.g. a memory-mapped .npy file
+        :param cols: Number of columns of the unpacked matrix
+        :param block_rows: Number of rows processed at once, limits the memory of temporary matrices
+        """
+        self.bits = bits
+        self.shape = (bits.shape[0], cols)
+        self.block_rows = block_rows
+
+    @classmethod
+    def create(
+        cls, shape: Tuple[int, int], path: str = None, available: bool = True
+    ) -> "AvailabilityStore":
+        """
+        Creates a store with all pixels available (or excluded).
+
+        :param shape: Shape of the unpacked matrix, e.g. region.mask.shape
+        :param path: Optional path of a .npy file to memory-map the store to
+        :param available: Initial value of all pixels
+        """
+        rows, cols = shape
+        packed_shape = (rows, (cols + 7) // 8)
+        if path is None:
+            bits = np.zeros(packed_shape, dtype=np.uint8)
+        else:
+            bits = np.lib.format.open_memmap(
+                path, mode="w+", dtype=np.uint8, shape=packed_shape
+            )
+        store = cls(bits, cols)
+        if available:
+            for block in store._blocks():
+                store.bits[block] = 0xFF
+            # The bits padding the last byte of every row are always 0
+            if cols % 8:
+                store.bits[:, -1] = (0xFF << (8 - cols % 8)) & 0xFF
+        return store
+
+    @classmethod
+    def from_array(cls, available: np.ndarray, path: str = None) -> "AvailabilityStore":
+        """Packs a boolean matrix, e.g. the availability of an ExclusionCalculator, into a store."""
+        store = cls.create(available.shape, path, available=False)
+        for rows in store._blocks():
+            store.bits[rows] = np.packbits(available[rows], axis=1)
+        return store
+
+    @classmethod
+    def open(cls, path: str, cols: int, mode: str = "r") -> "AvailabilityStore":
+        """
+        Memory-maps a store saved with save or created with a path.
+
+        :param path: Path of the .npy file
+        :param cols: Number of columns of the unpacked matrix
+        :param mode: "r" to share the store read-only, "r+" to modify it in place
+        """
+        return cls(np.load(path, mmap_mode=mode), cols)
+
+    def _blocks(self) -> Iterator[slice]:
+        for row in range(0, self.shape[0], self.block_rows):
+            yield slice(row, row + self.block_rows)
+
+    def _packed(self, other: Mask, rows: slice):
+        if isinstance(other, AvailabilityStore):
+            return other.bits[rows]
+        return np.packbits(np.asarray(other[rows], dtype=bool), axis=1)
+
+    def and_(self, other: Mask) -> "AvailabilityStore":
+        """Keeps only the pixels available in other."""
+        for rows in self._blocks():
+            self.bits[rows] &= self._packed(other, rows)
+        return self
+
+    def or_(self, other: Mask) -> "AvailabilityStore":
+        """Makes the pixels available in other available, e.g. to merge the results of tiles."""
+        for rows in self._blocks():
+            self.bits[rows] |= self._packed(other, rows)
+        return self
+
+    def exclude(self, mask: Mask) -> "AvailabilityStore":
+        """Excludes the pixels set in mask, e.g. a mask returned by exclusion_utils.indicate."""
+        for rows in self._blocks():
+            self.bits[rows] &= ~self._packed(mask, rows)
+        return self
+
+    def threshold(self, values: np.ndarray, threshold: float) -> "AvailabilityStore":
+        """Excludes the pixels whose value is not greater than threshold, e.g. within a buffer of a distance raster."""
+        for rows in self._blocks():
+            self.bits[rows] &= np.packbits(np.asarray(values[rows]) > threshold, axis=1)
+        return self
+
+    def count(self, mask: Mask = None) -> int:
+        """Returns the number of available pixels, optionally only those within a mask, e.g. the region's mask."""
+        total = 0
+        for rows in self._blocks():
+            bits = self.bits[rows]
+            if mask is not None:
+                bits = bits & self._packed(mask, rows)
+            total += int(_popcount[bits].sum(dtype=np.int64))
+        return total
+
+    def to_array(self, rows: slice = slice(None)) -> np.ndarray:
+        """Unpacks the store, or some of its rows, to a boolean matrix."""
+        return np.unpackbits(self.bits[rows], axis=1, count=self.shape[1]).astype(bool)
+
+    def copy(self, path: str = None) -> "AvailabilityStore":
+        """Copies the store to memory or to a memory-mapped .npy file."""
+        store = AvailabilityStore.create(self.shape, path, available=False)
+        for rows in self._blocks():
+            store.bits[rows] = self.bits[rows]
+        return store
+
+    def save(self, path: str):
+        """Saves the store to a .npy file, which can be memory-mapped with open."""
+        np.save(path, self.bits)
+
+    def flush(self):
+        """Writes the changes of a memory-mapped store to its file."""
+        if isinstance(self.bits, np.memmap):
+            self.bits.flush()
@@ -0,0 +1,68 @@
+# Smoke check of constraint_planner.py: Writes a small GeoPackage, reads it through read_source and rasterizes its
+# constraints, so a planner that reads or rasterizes no features fails loudly instead of silently excluding nothing.
+# run_benchmarks.py runs the check before measuring any stage.
+#
+# Usage: python benchmarks/check_planner.py
+import os
+import sys
+import tempfile
+
+import geokit as gk
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from constraint_planner import plan_constraint_masks, read_source
+from synthetic_data import origin, random_polygon, srs_epsg, write_features
+
+# Number of polygons of the GeoPackage and size of the region in pixels of pixel_size metres
+feature_count = 20
+region_pixels = 100
+pixel_size = 10
+
+
+def check_planner(directory: str):
+    """
+    Checks that read_source reads every feature of a small GeoPackage and that every constraint using it is rasterized
+    to a non-empty mask.
+
+    :param directory: Directory to write the GeoPackage to
+    """
+    rng = np.random.default_rng(0)
+    x, y = origin
+    size = region_pixels * pixel_size
+    path = os.path.join(directory, "planner_check.gpkg")
+    write_features(
+        path,
+        [
+            random_polygon(rng, x + rng.uniform(0, size), y + rng.uniform(0, size), 50)
+            for _ in range(feature_count)
+        ],
+        {},
+        rng,
+        driver="GPKG",
+        attributes={"kind": ["a", "b"] * (feature_count // 2)},
+    )
+    region = gk.RegionMask.fromMask(
+        gk.Extent(x, y, x + size, y + size, srs=srs_epsg),
+        np.ones((region_pixels, region_pixels), dtype=bool),
+    )
+    excludes = [
+        {"name": "a", "source": path, "where": "kind = 'a'"},
+        {"name": "b", "source": path, "where": "kind = 'b'", "buffer": 20},
+    ]
+
+    memory_dataset, memory_layer = read_source(region, path, excludes)
+    if memory_layer.GetFeatureCount() != feature_count:
+        raise RuntimeError(
+            f"read_source read {memory_layer.GetFeatureCount()} of {feature_count} features of {path}"
+        )
+    for exclude, mask in plan_constraint_masks(region, excludes):
+        if mask.shape != (region_pixels, region_pixels) or not mask.any():
+            raise RuntimeError(f"Constraint {exclude} was rasterized to an empty mask")
+    print("Constraint planner check passed")
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        check_planner(directory)
@@ -0,0 +1,179 @@
+# Local stand-in for the LoD2 download server to test lod2_download.py and buildings-data-acquisition.py without network
+# access. Every file in a directory is served with support for HTTP Range requests, together with a metalink listing
+# them at /metalink.meta4. Like real servers, the stand-in can fail requests, and it can truncate or corrupt responses
+# to test the resumption and verification of downloads.
+#
+# Usage: python benchmarks/lod2_stand_in.py DIRECTORY [--port 8081] [--failure-rate 0.1] [--truncate-rate 0.1]
+#     [--corrupt-rate 0.1] [--no-range] [--no-size]
+# Then set BYWIND_METALINK_URL to http://localhost:8081/metalink.meta4
+import argparse
+import hashlib
+import os
+import random
+import re
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote, urlparse
+from xml.sax.saxutils import escape
+
+metalink_file = """<file name="{name}">
+{size}<hash type="sha-256">{sha256}</hash>
+<url>{url}</url>
+</file>
+"""
+
+
+def create_metalink(directory: str, base_url: str, include_size: bool = True) -> bytes:
+    """Lists every file of a directory with its size and SHA-256 hash in a metalink (RFC 5854)."""
+    files = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not os.path.isfile(path):
+            continue
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(2**20), b""):
+                digest.update(block)
+        files.append(
+            metalink_file.format(
+                name=escape(name),
+                size=f"<size>{os.path.getsize(path)}</size>\n" if include_size else "",
+                sha256=digest.hexdigest(),
+                url=escape(f"{base_url}/files/{quote(name)}"),
+            )
+        )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<metalink xmlns="urn:ietf:params:xml:ns:metalink">\n'
+        + "".join(files)
+        + "</metalink>\n"
+    ).encode()
+
+
+def create_handler(
+    directory: str,
+    base_url: str,
+    failure_rate: float = 0,
+    truncate_rate: float = 0,
+    corrupt_rate: float = 0,
+    support_range: bool = True,
+    include_size: bool = True,
+):
+    class LoD2Handler(BaseHTTPRequestHandler):
+        def send(self, status: int, content: bytes, headers: dict = None):
+            self.send_response(status)
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def do_GET(self):
+            path = unquote(urlparse(self.path).path)
+            if random.random() < failure_rate:
+                self.send(503, b"Service temporarily unavailable")
+                return
+            if path == "/metalink.meta4":
+                self.send(
+                    200,
+                    create_metalink(directory, base_url, include_size),
+                    {"Content-Type": "application/metalink4+xml"},
+                )
+                return
+            name = path[len("/files/") :] if path.startswith("/files/") else ""
+            file_path = os.path.join(directory, name)
+            if not name or os.sep in name or not os.path.isfile(file_path):
+                self.send(404, b"Not found")
+                return
+            with open(file_path, "rb") as f:
+                content = f.read()
+
+            # Only single byte ranges from an offset to the end are supported, as sent by lod2_download.py
+            start = 0
+            match = re.fullmatch(r"bytes=(\d+)-", self.headers.get("Range", ""))
+            if support_range and match:
+                start = int(match.group(1))
+                if start >= len(content):
+                    self.send(
+                        416,
+                        b"Range not satisfiable",
+                        {"Content-Range": f"bytes */{len(content)}"},
+                    )
+                    return
+            body = content[start:]
+
+            if body and random.random() < corrupt_rate:
+                body = bytearray(body)
+                body[random.randrange(len(body))] ^= 0xFF
+                body = bytes(body)
+
+            self.send_response(206 if start else 200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Accept-Ranges", "bytes" if support_range else "none")
+            if start:
+                self.send_header(
+                    "Content-Range", f"bytes {start}-{len(content) - 1}/{len(content)}"
+                )
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if random.random() < truncate_rate:
+                # Announce the whole body, but close the connection halfway through
+                self.wfile.write(body[: len(body) // 2])
+                self.close_connection = True
+                return
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return LoD2Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serves the files of a directory and a metalink of them like the LoD2 download server"
+    )
+    parser.add_argument("directory", help="Directory with the files to serve")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument(
+        "--failure-rate",
+        type=float,
+        default=0,
+        help="Share of requests answered with HTTP 503",
+    )
+    parser.add_argument(
+        "--truncate-rate",
+        type=float,
+        default=0,
+        help="Share of file responses closed after half of the body",
+    )
+    parser.add_argument(
+        "--corrupt-rate",
+        type=float,
+        default=0,
+        help="Share of file responses with a flipped byte",
+    )
+    parser.add_argument(
+        "--no-range",
+        action="store_true",
+        help="Ignore Range requests and always send the whole file",
+    )
+    parser.add_argument(
+        "--no-size", action="store_true", help="Omit the file sizes in the metalink"
+    )
+    arguments = parser.parse_args()
+
+    base_url = f"http://localhost:{arguments.port}"
+    server = ThreadingHTTPServer(
+        ("localhost", arguments.port),
+        create_handler(
+            arguments.directory,
+            base_url,
+            arguments.failure_rate,
+            arguments.truncate_rate,
+            arguments.corrupt_rate,
+            not arguments.no_range,
+            not arguments.no_size,
+        ),
+    )
+    print(f"Serving LoD2 stand-in on {base_url}/metalink.meta4")
+    server.serve_forever()
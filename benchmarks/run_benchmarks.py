@@ -0,0 +1,291 @@
+# Benchmark harness: Generates a synthetic dataset (see synthetic_data.py) in a temporary working directory, runs the
+# preprocessing scripts, the fixed-exclusion phase, the buffer sweep and mapping_constrained_areas.py on it and reports
+# the wall time, the CPU time and the throughput of every stage in pixels/s and features/s.
+# The results of every run are appended as a JSON line to the results file, so runs of different versions can be
+# compared to find regressions.
+#
+# Usage: python benchmarks/run_benchmarks.py [--size-km 20] [--density 1] [--stages fixed sweep ...]
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from osgeo import gdal, ogr
+
+repository = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repository)
+
+from catalog import load_catalog
+from check_planner import check_planner
+from synthetic_data import generate_dataset
+from tiled_exclusion import region_extent
+
+# Command running the preprocessing scripts, which need the by-wind-da environment
+da_python = ["conda", "run", "--no-capture-output", "-n", "by-wind-da", "python"]
+
+stage_names = [
+    "buildings-preprocessing",
+    "geofabrik-preprocessing",
+    "windspeed-preprocessing",
+    "fixed",
+    "sweep",
+    "mapping",
+]
+
+
+def count_features(paths: List[str]) -> int:
+    """Returns the total number of features of vector files, ignoring missing files."""
+    count = 0
+    for path in set(paths):
+        if path.endswith(".tif") or not os.path.exists(path):
+            continue
+        dataset = ogr.Open(path)
+        count += sum(layer.GetFeatureCount() for layer in dataset)
+    return count
+
+
+def raster_pixels(path: str) -> int:
+    dataset = gdal.Open(path)
+    return dataset.RasterXSize * dataset.RasterYSize
+
+
+def git_version() -> str:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=repository,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_stage(
+    name: str, command: List[str], directory: str, pixels: int, features: int
+) -> dict:
+    """Runs a stage in the working directory and measures its wall and CPU time."""
+    print(f"Running {name}: {' '.join(command)}")
+    environment = {**os.environ, "PYTHONPATH": repository}
+    usage_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    process = subprocess.run(command, cwd=directory, env=environment)
+    seconds = time.perf_counter() - start
+    usage_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu_seconds = (usage_after.ru_utime + usage_after.ru_stime) - (
+        usage_before.ru_utime + usage_before.ru_stime
+    )
+    return {
+        "name": name,
+        "returncode": process.returncode,
+        "seconds": seconds,
+        "cpu_seconds": cpu_seconds,
+        # Largest resident set of all child processes so far, in kilobytes on Linux
+        "max_child_rss": usage_after.ru_maxrss,
+        "pixels": pixels,
+        "features": features,
+        "pixels_per_second": pixels / seconds if pixels else None,
+        "features_per_second": features / seconds if features else None,
+    }
+
+
+def run_benchmarks(
+    stages: List[str],
+    size_km: float,
+    density: float,
+    seed: int = 0,
+    directory: str = None,
+) -> Dict:
+    """
+    Runs the benchmark stages on a synthetic dataset.
+
+    :param stages: Names of the stages to run, see stage_names
+    :param size_km: Width and height of the synthetic region in kilometres
+    :param density: Factor applied to the number of features of the synthetic dataset
+    :param seed: Seed of the synthetic dataset
+    :param directory: Working directory, a temporary directory which is removed afterward if None
+    :return: Description of the run including the results of every stage
+    """
+    temporary = directory is None
+    directory = directory or tempfile.mkdtemp(prefix="bywind-benchmark-")
+    try:
+        # Fail before measuring anything if the planner does not rasterize the features it reads
+        check_planner(directory)
+        start = time.perf_counter()
+        generate_dataset(directory, size_km, density, seed)
+        generation_seconds = time.perf_counter() - start
+        shutil.copy(os.path.join(repository, "catalog.json"), directory)
+        os.makedirs(os.path.join(directory, "output"), exist_ok=True)
+
+        catalog = load_catalog(os.path.join(directory, "catalog.json"))
+        options = catalog["region_options"]
+        x_min, y_min, x_max, y_max = region_extent(
+            os.path.join(directory, catalog["region_source"]),
+            options["srs"],
+            options["pixelRes"],
+            options["where"],
+        )
+        pixels = round((x_max - x_min) / options["pixelRes"]) * round(
+            (y_max - y_min) / options["pixelRes"]
+        )
+
+        def sources(set_names):
+            return [
+                os.path.join(directory, exclude["source"])
+                for name in set_names
+                for exclude in catalog["constraint_sets"][name]
+            ]
+
+        scenario_sets = sorted(
+            {
+                name
+                for _, exclusion_sets in catalog["scenarios"]
+                for name in exclusion_sets
+            }
+        )
+        mapping_sets = [
+            "social_political",
+            "physical",
+            "conservation",
+            "technical_economic",
+        ]
+        sweep_pixels = (
+            pixels
+            * len(catalog["variable_exclude_buffers"])
+            * len(catalog["scenarios"])
+        )
+
+        def python(code):
+            return [sys.executable, "-c", code]
+
+        definitions = {
+            "buildings-preprocessing": lambda: (
+                [*da_python, os.path.join(repository, "buildings-preprocessing.py")],
+                0,
+                count_features(
+                    [
+                        os.path.join(directory, "downloads", "intermediate", file)
+                        for file in os.listdir(
+                            os.path.join(directory, "downloads", "intermediate")
+                        )
+                    ]
+                ),
+            ),
+            "geofabrik-preprocessing": lambda: (
+                [*da_python, os.path.join(repository, "geofabrik-preprocessing.py")],
+                0,
+                count_features(
+                    [
+                        os.path.join(folder, file)
+                        for folder, _, files in os.walk(
+                            os.path.join(directory, "downloads", "geofabrik")
+                        )
+                        for file in files
+                        if file.endswith(".shp")
+                    ]
+                ),
+            ),
+            "windspeed-preprocessing": lambda: (
+                [*da_python, os.path.join(repository, "windspeed-preprocessing.py")],
+                raster_pixels(
+                    os.path.join(
+                        directory, "downloads", "windspeed", "windspeed_120.tif"
+                    )
+                ),
+                0,
+            ),
+            "fixed": lambda: (
+                python("import main; main.run_fixed_exclusions()"),
+                pixels,
+                count_features(sources(catalog["fixed_constraint_sets"])),
+            ),
+            "sweep": lambda: (
+                python("import main; main.run_sweep()"),
+                sweep_pixels,
+                count_features(sources(["residential_areas", *scenario_sets])),
+            ),
+            "mapping": lambda: (
+                [
+                    sys.executable,
+                    os.path.join(repository, "mapping_constrained_areas.py"),
+                ],
+                pixels * len(mapping_sets),
+                count_features(sources(mapping_sets)),
+            ),
+        }
+
+        results = []
+        for name in stage_names:
+            if name not in stages:
+                continue
+            if name in ("fixed", "mapping"):
+                # Measure the rasterization instead of the mask cache
+                shutil.rmtree(os.path.join(directory, "cache"), ignore_errors=True)
+            command, stage_pixels, stage_features = definitions[name]()
+            results.append(
+                run_stage(name, command, directory, stage_pixels, stage_features)
+            )
+
+        return {
+            "version": git_version(),
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "size_km": size_km,
+            "density": density,
+            "seed": seed,
+            "region_pixels": pixels,
+            "generation_seconds": generation_seconds,
+            "stages": results,
+        }
+    finally:
+        if temporary:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmarks ByWind on a synthetic dataset"
+    )
+    parser.add_argument("--size-km", type=float, default=20)
+    parser.add_argument("--density", type=float, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stages", nargs="+", choices=stage_names, default=stage_names)
+    parser.add_argument(
+        "--directory",
+        help="Working directory which is kept afterward, a temporary directory is used by default",
+    )
+    parser.add_argument(
+        "--output",
+        default=os.path.join(repository, "output", "ByWind_benchmarks.jsonl"),
+        help="File the results are appended to as a JSON line",
+    )
+    arguments = parser.parse_args()
+
+    run = run_benchmarks(
+        arguments.stages,
+        arguments.size_km,
+        arguments.density,
+        arguments.seed,
+        arguments.directory,
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(arguments.output)), exist_ok=True)
+    with open(arguments.output, "a", encoding="utf-8") as file:
+        file.write(json.dumps(run) + "\n")
+
+    for stage in run["stages"]:
+        print(
+            "{name}: {seconds:.1f} s, {pixels_per_second} pixels/s, {features_per_second} features/s{failed}".format(
+                **stage, failed="" if stage["returncode"] == 0 else " (failed)"
+            )
+        )
@@ -0,0 +1,411 @@
+# Generator of a synthetic, Bavaria-like dataset for benchmarking ByWind without the real geodata
+# For every source of the catalog a layer with the fields its where clauses use is created. Field values are drawn from
+# the literals of the where clauses, so every constraint matches some of the features. Additionally, the inputs of the
+# preprocessing scripts (building chunks, geofabrik regions and the wind atlas image) are created.
+#
+# Usage: python benchmarks/synthetic_data.py OUTPUT_DIRECTORY [--size-km 20] [--density 1] [--seed 0]
+import argparse
+import math
+import os
+import re
+import sys
+from typing import Dict, List, Tuple
+
+import numpy as np
+from osgeo import gdal, ogr, osr
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import load_catalog
+from constraint_planner import where_fields
+
+gdal.UseExceptions()
+ogr.UseExceptions()
+
+# Origin of the synthetic region in EPSG:25832, somewhere in Bavaria
+origin = (600000, 5400000)
+srs_epsg = 25832
+
+# Features per km² of each kind of source at density 1
+feature_densities = {"polygon": 4, "line": 4, "point": 0.005, "building": 80}
+# Sizes of the features in metres
+polygon_radii = (30, 400)
+building_radii = (5, 20)
+line_lengths = (200, 3000)
+
+# Sources which are not polygon layers, matched against the file name
+point_sources = re.compile(r"(^|/)D?VOR\.shp$")
+line_sources = re.compile(r"(_l|VG250_STA)\.shp$")
+building_sources = re.compile(r"Gebäude/")
+
+# Building functions of the chunks, covering all categories of buildings-preprocessing.py
+building_functions = [
+    "31001_1000",
+    "31001_1010",
+    "31001_2071",
+    "31001_3240",
+    "31001_1100",
+    "31001_1220",
+    "31001_2000",
+    "31001_9998",
+]
+geofabrik_regions = ["mittelfranken", "oberbayern", "schwaben"]
+geofabrik_fclasses = {
+    "gis_osm_waterways_free_1": ["stream", "ditch", "river", "canal"],
+    "gis_osm_pois_a_free_1": ["archaeological", "monument", "castle", "restaurant"],
+}
+# Colours of the wind atlas image, some of them within the legend of windspeed-preprocessing.py
+windspeed_colours = [
+    (0, 15, 135),
+    (14, 125, 194),
+    (54, 180, 115),
+    (110, 195, 53),
+    (180, 215, 0),
+    (230, 120, 0),
+]
+
+
+def spatial_reference(epsg: int) -> osr.SpatialReference:
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(epsg)
+    if hasattr(srs, "SetAxisMappingStrategy"):
+        srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    return srs
+
+
+def random_polygon(rng: np.random.Generator, x: float, y: float, radius: float):
+    """Creates an irregular, star-shaped polygon around (x, y)."""
+    vertices = rng.integers(6, 25)
+    angles = np.sort(rng.uniform(0, 2 * math.pi, vertices))
+    radii = radius * rng.uniform(0.5, 1, vertices)
+    ring = ogr.Geometry(ogr.wkbLinearRing)
+    for angle, r in zip(angles, radii):
+        ring.AddPoint_2D(x + r * math.cos(angle), y + r * math.sin(angle))
+    ring.CloseRings()
+    polygon = ogr.Geometry(ogr.wkbPolygon)
+    polygon.AddGeometry(ring)
+    return polygon
+
+
+def random_line(rng: np.random.Generator, x: float, y: float, length: float):
+    """Creates a random walk starting at (x, y)."""
+    vertices = rng.integers(3, 20)
+    line = ogr.Geometry(ogr.wkbLineString)
+    line.AddPoint_2D(x, y)
+    direction = rng.uniform(0, 2 * math.pi)
+    for _ in range(vertices - 1):
+        direction += rng.normal(0, 0.4)
+        x += length / (vertices - 1) * math.cos(direction)
+        y += length / (vertices - 1) * math.sin(direction)
+        line.AddPoint_2D(x, y)
+    return line
+
+
+def source_fields(excludes: List[dict]) -> Dict[str, list]:
+    """
+    Returns the fields the where clauses of the constraints of a source refer to, with the literals they compare with
+    plus a value matching none of them and NULL.
+    """
+    fields = {}
+    for exclude in excludes:
+        where = exclude.get("where")
+        if not where:
+            continue
+        identifiers = re.findall(
+            r"[A-Za-z_][A-Za-z0-9_]*", re.sub(r"'[^']*'", "", where)
+        )
+        literals = re.findall(r"'([^']*)'", where)
+        for name in where_fields(where, identifiers):
+            fields.setdefault(name, {"0000", None}).update(literals)
+    return {name: sorted(values, key=str) for name, values in fields.items()}
+
+
+def write_features(
+    path: str,
+    geometries: list,
+    fields: Dict[str, list],
+    rng: np.random.Generator,
+    epsg: int = srs_epsg,
+    driver: str = "ESRI Shapefile",
+    attributes: Dict[str, list] = None,
+) -> int:
+    """
+    Writes geometries to a new vector file and returns the number of features.
+
+    :param fields: Fields with random values, each drawn from the given list of values
+    :param attributes: Fields with given values, each a list with one value per geometry
+    """
+    attributes = attributes or {}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    ogr_driver = ogr.GetDriverByName(driver)
+    if os.path.exists(path):
+        ogr_driver.DeleteDataSource(path)
+    dataset = ogr_driver.CreateDataSource(path)
+    geometry_type = geometries[0].GetGeometryType() if geometries else ogr.wkbPolygon
+    layer = dataset.CreateLayer(
+        os.path.splitext(os.path.basename(path))[0],
+        srs=spatial_reference(epsg),
+        geom_type=geometry_type,
+    )
+    for name in [*fields, *attributes]:
+        field = ogr.FieldDefn(name, ogr.OFTString)
+        field.SetWidth(80)
+        layer.CreateField(field)
+    definition = layer.GetLayerDefn()
+    layer.StartTransaction()
+    for index, geometry in enumerate(geometries):
+        feature = ogr.Feature(definition)
+        feature.SetGeometry(geometry)
+        for name, values in attributes.items():
+            feature.SetField(name, values[index])
+        for name, values in fields.items():
+            value = values[rng.integers(len(values))]
+            if value is None:
+                feature.SetFieldNull(name)
+            else:
+                feature.SetField(name, value)
+        layer.CreateFeature(feature)
+    layer.CommitTransaction()
+    dataset = None
+    return len(geometries)
+
+
+def random_geometries(
+    rng: np.random.Generator, kind: str, count: int, extent: Tuple[float, ...]
+) -> list:
+    x_min, y_min, x_max, y_max = extent
+    xs = rng.uniform(x_min, x_max, count)
+    ys = rng.uniform(y_min, y_max, count)
+    if kind == "point":
+        geometries = []
+        for x, y in zip(xs, ys):
+            point = ogr.Geometry(ogr.wkbPoint)
+            point.AddPoint_2D(x, y)
+            geometries.append(point)
+        return geometries
+    if kind == "line":
+        return [
+            random_line(rng, x, y, rng.uniform(*line_lengths)) for x, y in zip(xs, ys)
+        ]
+    radii = building_radii if kind == "building" else polygon_radii
+    return [random_polygon(rng, x, y, rng.uniform(*radii)) for x, y in zip(xs, ys)]
+
+
+def source_kind(source: str) -> str:
+    if point_sources.search(source):
+        return "point"
+    if line_sources.search(source):
+        return "line"
+    if building_sources.search(source):
+        return "building"
+    return "polygon"
+
+
+def write_raster(path: str, data: np.ndarray, extent: Tuple[float, ...], epsg=srs_epsg):
+    """Writes a single or multi band array covering the extent to a GeoTIFF."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    bands = data.reshape(-1, *data.shape[-2:])
+    rows, cols = bands.shape[1:]
+    dataset = gdal.GetDriverByName("GTiff").Create(
+        path,
+        cols,
+        rows,
+        len(bands),
+        gdal.GDT_Float32 if data.dtype == np.float32 else gdal.GDT_Byte,
+        options=["COMPRESS=DEFLATE", "TILED=YES"],
+    )
+    dataset.SetGeoTransform(
+        (
+            extent[0],
+            (extent[2] - extent[0]) / cols,
+            0,
+            extent[3],
+            0,
+            -(extent[3] - extent[1]) / rows,
+        )
+    )
+    dataset.SetProjection(spatial_reference(epsg).ExportToWkt())
+    for index, band in enumerate(bands, start=1):
+        dataset.GetRasterBand(index).WriteArray(band)
+    dataset = None
+
+
+def smooth_noise(rng: np.random.Generator, shape: Tuple[int, int], scale: int = 16):
+    """Creates spatially correlated noise from 0 to 1 by upsampling coarse noise."""
+    coarse = rng.uniform(0, 1, (shape[0] // scale + 2, shape[1] // scale + 2))
+    rows = np.arange(shape[0]) / scale
+    cols = np.arange(shape[1]) / scale
+    row_index, col_index = rows.astype(int), cols.astype(int)
+    row_weight, col_weight = (rows % 1)[:, None], (cols % 1)[None, :]
+    top = (
+        coarse[row_index][:, col_index] * (1 - col_weight)
+        + coarse[row_index][:, col_index + 1] * col_weight
+    )
+    bottom = (
+        coarse[row_index + 1][:, col_index] * (1 - col_weight)
+        + coarse[row_index + 1][:, col_index + 1] * col_weight
+    )
+    return (top * (1 - row_weight) + bottom * row_weight).astype(np.float32)
+
+
+def generate_dataset(
+    directory: str,
+    size_km: float = 20,
+    density: float = 1,
+    seed: int = 0,
+    catalog_path: str = None,
+    raster_pixel_size: float = 25,
+) -> Dict[str, int]:
+    """
+    Generates a synthetic dataset in the layout of the repository (./input and ./downloads) below directory.
+
+    :param directory: Directory to create the dataset in, e.g. a temporary working directory
+    :param size_km: Width and height of the region in kilometres, the number of pixels grows quadratically with it
+    :param density: Factor applied to the number of features per km² of every source
+    :param seed: Seed of the random number generator
+    :param catalog_path: Catalog whose sources are generated, defaults to the catalog of the repository
+    :param raster_pixel_size: Pixel size of the raster sources of the constraints in metres
+    :return: Dict of path -> number of features (or pixels for rasters) of every generated file
+    """
+    rng = np.random.default_rng(seed)
+    catalog = load_catalog(
+        catalog_path
+        or os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "catalog.json"
+        )
+    )
+    size = size_km * 1000
+    x, y = origin
+    region_extent = (x, y, x + size, y + size)
+    # Features are also created around the region, as they affect it via their buffers
+    margin = min(size / 4, 5000)
+    feature_extent = (x - margin, y - margin, x + size + margin, y + size + margin)
+    area_km2 = (size + 2 * margin) ** 2 / 1e6
+    summary = {}
+
+    def target(path):
+        return os.path.join(directory, os.path.normpath(path))
+
+    # Region: An irregular polygon selected by the where clause of the catalog and a neighbouring polygon which is not
+    region_path = target(catalog["region_source"])
+    region_where = catalog["region_options"]["where"]
+    region_values = re.findall(r"(\w+)\s*=\s*'([^']*)'", region_where or "")
+    region_attributes = {name: [value, "other"] for name, value in region_values}
+    centre = (x + size / 2, y + size / 2)
+    region = random_polygon(rng, *centre, size / 2)
+    region = region.Intersection(
+        ogr.CreateGeometryFromWkt(
+            "POLYGON (({0} {1}, {2} {1}, {2} {3}, {0} {3}, {0} {1}))".format(
+                *region_extent
+            )
+        )
+    ).Union(random_polygon(rng, *centre, size / 4))
+    neighbour = random_polygon(rng, x + 1.5 * size, centre[1], size / 2)
+    summary[region_path] = write_features(
+        region_path, [region, neighbour], {}, rng, attributes=region_attributes
+    )
+
+    # Sources of the constraints
+    excludes_by_source = {}
+    for excludes in catalog["constraint_sets"].values():
+        for exclude in excludes:
+            excludes_by_source.setdefault(exclude["source"], []).append(exclude)
+    for source, excludes in excludes_by_source.items():
+        path = target(source)
+        if source.endswith(".tif"):
+            value = excludes[0].get("value")
+            rows = cols = int(math.ceil((size + 2 * margin) / raster_pixel_size))
+            noise = smooth_noise(rng, (rows, cols))
+            if isinstance(value, (int, float)):
+                # Binary mask, e.g. of wind speeds below the threshold
+                data = np.where(noise < 0.3, value, value + 1).astype(np.uint8)
+            else:
+                # Continuous values, e.g. slope in degrees
+                data = (noise * 30).astype(np.float32)
+            write_raster(path, data, feature_extent)
+            summary[path] = data.size
+            continue
+        kind = source_kind(source)
+        count = max(1, int(round(feature_densities[kind] * density * area_km2)))
+        geometries = random_geometries(rng, kind, count, feature_extent)
+        summary[path] = write_features(
+            path,
+            geometries,
+            source_fields(excludes),
+            rng,
+            driver="GPKG" if source.endswith(".gpkg") else "ESRI Shapefile",
+        )
+
+    # Inputs of buildings-preprocessing.py, some buildings appear in two chunks like on tile borders
+    building_count = max(1, int(feature_densities["building"] * density * area_km2))
+    chunk_size = max(1, building_count // 4)
+    ids = [f"DEBY_LOD2_{index}" for index in range(building_count)]
+    for chunk, start in enumerate(range(0, building_count, chunk_size)):
+        chunk_ids = ids[start : start + chunk_size + chunk_size // 20]
+        path = os.path.join(
+            directory, "downloads", "intermediate", f"Chunk_{chunk}_{chunk_size}.gpkg"
+        )
+        geometries = random_geometries(rng, "building", len(chunk_ids), feature_extent)
+        summary[path] = write_features(
+            path,
+            geometries,
+            {"GFK": building_functions},
+            rng,
+            driver="GPKG",
+            attributes={"id": chunk_ids},
+        )
+
+    # Inputs of geofabrik-preprocessing.py in EPSG:4326, one directory per region
+    to_wgs84 = osr.CoordinateTransformation(
+        spatial_reference(srs_epsg), spatial_reference(4326)
+    )
+    for region_name in geofabrik_regions:
+        for file, fclasses in geofabrik_fclasses.items():
+            kind = "line" if "waterways" in file else "polygon"
+            count = max(
+                1,
+                int(
+                    feature_densities[kind]
+                    * density
+                    * area_km2
+                    / len(geofabrik_regions)
+                ),
+            )
+            geometries = random_geometries(rng, kind, count, feature_extent)
+            for geometry in geometries:
+                geometry.Transform(to_wgs84)
+            path = os.path.join(
+                directory, "downloads", "geofabrik", region_name, f"{file}.shp"
+            )
+            summary[path] = write_features(
+                path, geometries, {"fclass": fclasses}, rng, epsg=4326
+            )
+
+    # Input of windspeed-preprocessing.py, an RGB image of the wind atlas at 10 m
+    rows = cols = int(math.ceil((size + 2 * margin) / 10))
+    colours = np.array(windspeed_colours, dtype=np.uint8)
+    classes = np.minimum(
+        (smooth_noise(rng, (rows, cols), scale=64) * len(colours)).astype(int),
+        len(colours) - 1,
+    )
+    path = os.path.join(directory, "downloads", "windspeed", "windspeed_120.tif")
+    write_raster(path, np.moveaxis(colours[classes], -1, 0), feature_extent)
+    summary[path] = rows * cols
+
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generates a synthetic dataset for benchmarking ByWind"
+    )
+    parser.add_argument("directory")
+    parser.add_argument("--size-km", type=float, default=20)
+    parser.add_argument("--density", type=float, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    for path, count in generate_dataset(
+        arguments.directory, arguments.size_km, arguments.density, arguments.seed
+    ).items():
+        print(f"{path}: {count}")
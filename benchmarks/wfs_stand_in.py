@@ -0,0 +1,140 @@
+# Local stand-in for a WFS 2.0 server to test wfs_client.py and protected-forest-data-acquisition.py without network
+# access. Every vector file in a directory is served as a layer named like the file (without extension). The stand-in
+# supports GetFeature with RESULTTYPE=hits, paging via COUNT/STARTINDEX and sorting via SORTBY, and can limit the number
+# of features per response and fail requests at random like real servers do.
+#
+# Usage: python benchmarks/wfs_stand_in.py DIRECTORY [--port 8080] [--max-count 500] [--failure-rate 0.1]
+# Then set wfs_url in protected-forest-data-acquisition.py (or BYWIND_WFS_URL) to http://localhost:8080/wfs
+import argparse
+import glob
+import os
+import random
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+import geopandas as gpd
+
+exception_report = """<?xml version="1.0" encoding="UTF-8"?>
+<ows:ExceptionReport xmlns:ows="http://www.opengis.net/ows/1.1" version="2.0.0">
+<ows:Exception exceptionCode="{code}"><ows:ExceptionText>{text}</ows:ExceptionText></ows:Exception>
+</ows:ExceptionReport>
+"""
+
+hits_response = """<?xml version="1.0" encoding="UTF-8"?>
+<wfs:FeatureCollection xmlns:wfs="http://www.opengis.net/wfs/2.0" numberMatched="{count}" numberReturned="0"/>
+"""
+
+
+def load_layers(directory: str) -> dict:
+    """Reads every vector file of a directory, the layer name is the file name without extension."""
+    layers = {}
+    for path in sorted(glob.glob(os.path.join(directory, "*"))):
+        name, extension = os.path.splitext(os.path.basename(path))
+        if extension in (".shp", ".gpkg", ".geojson"):
+            layers[name] = gpd.read_file(path)
+    return layers
+
+
+def create_handler(layers: dict, max_count: int = None, failure_rate: float = 0):
+    lock = threading.Lock()
+
+    class WFSHandler(BaseHTTPRequestHandler):
+        def send(self, status: int, content: bytes):
+            self.send_response(status)
+            self.send_header("Content-Type", "text/xml; subtype=gml/3.2")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def do_GET(self):
+            parameters = {
+                key.upper(): value
+                for key, value in parse_qsl(urlparse(self.path).query)
+            }
+            if random.random() < failure_rate:
+                self.send(503, b"Service temporarily unavailable")
+                return
+            if parameters.get("REQUEST") != "GetFeature":
+                self.send(
+                    400,
+                    exception_report.format(
+                        code="OperationNotSupported", text="Only GetFeature"
+                    ).encode(),
+                )
+                return
+            # Layer names may be qualified by a namespace, e.g. fov_waldfunktionskarte:Erholungswald
+            name = parameters.get("TYPENAMES", "").split(":")[-1]
+            if name not in layers:
+                self.send(
+                    400,
+                    exception_report.format(
+                        code="InvalidParameterValue", text=f"Unknown layer {name}"
+                    ).encode(),
+                )
+                return
+            layer = layers[name]
+            if parameters.get("RESULTTYPE") == "hits":
+                self.send(200, hits_response.format(count=len(layer)).encode())
+                return
+
+            # Layers without the field of SORTBY keep the order of their file, like the object ids of a server
+            field, _, direction = parameters.get("SORTBY", "").partition(" ")
+            if field in layer.columns:
+                layer = layer.sort_values(
+                    field, ascending=direction.upper() != "DESC", kind="stable"
+                )
+            start_index = int(parameters.get("STARTINDEX", 0))
+            count = int(parameters.get("COUNT", len(layer)))
+            if max_count is not None:
+                count = min(count, max_count)
+            page = layer.iloc[start_index : start_index + count]
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "page.gml")
+                # Writing GML is not thread safe in all GDAL versions
+                with lock:
+                    page.to_file(path, driver="GML")
+                with open(path, "rb") as file:
+                    content = file.read()
+            # Mimic the attributes of a WFS 2.0 response
+            content = content.replace(
+                b"<ogr:FeatureCollection",
+                f'<ogr:FeatureCollection numberMatched="{len(layer)}" numberReturned="{len(page)}"'.encode(),
+                1,
+            )
+            self.send(200, content)
+
+        def log_message(self, format, *args):
+            pass
+
+    return WFSHandler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serves vector files as layers of a local WFS stand-in"
+    )
+    parser.add_argument("directory", help="Directory with one vector file per layer")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--max-count", type=int, help="Maximum number of features per response"
+    )
+    parser.add_argument(
+        "--failure-rate",
+        type=float,
+        default=0,
+        help="Share of requests answered with HTTP 503",
+    )
+    arguments = parser.parse_args()
+
+    server = ThreadingHTTPServer(
+        ("localhost", arguments.port),
+        create_handler(
+            load_layers(arguments.directory),
+            arguments.max_count,
+            arguments.failure_rate,
+        ),
+    )
+    print(f"Serving WFS stand-in on http://localhost:{arguments.port}/wfs")
+    server.serve_forever()
@@ -1,7 +1,10 @@
-# Read and join all the chunk geopackage files to a single GeoDataFrame and filter and save them by building function
+# Read all the chunk geopackage files one by one, drop duplicates and append them to GeoPackages by building function
+# The buildings of Bavaria exceed the 2 GB limit of the .shp and .dbf files of a Shapefile, so GeoPackages are written
 import os
+import re
 
 import geopandas as gpd
+import numpy as np
 import pandas as pd
 
 chunk_file_path = "./downloads/intermediate/"
@@ -50,27 +53,66 @@ mixed_function_values = [
     "31001_1223",
 ]
 
-all_function_values = (
-    residential_function_values + health_function_values + mixed_function_values
+# Category of each building function, all other building functions belong to the category "other"
+function_categories = {
+    **{value: "residential" for value in residential_function_values},
+    **{value: "health" for value in health_function_values},
+    **{value: "mixed" for value in mixed_function_values},
+}
+categories = ["residential", "health", "mixed", "other"]
+
+# Read the chunk geopackage files one by one in the order they were created
+gpkg_files = sorted(
+    (f for f in os.listdir(chunk_file_path) if f.endswith(".gpkg")),
+    key=lambda f: int(re.search(r"\d+", f).group()),
 )
 
-# Read and join all the chunk geopackage files to a single GeoDataFrame and drop eventual duplicates
-gpkg_files = [
-    f"{chunk_file_path}{f}" for f in os.listdir(chunk_file_path) if f.endswith(".gpkg")
-]
-gdfs = [gpd.read_file(file) for file in gpkg_files]
-combined_gdf = gpd.GeoDataFrame(pd.concat(gdfs, ignore_index=True)).drop_duplicates()
+# 64-bit hashes of the ids of all buildings written so far, used to drop eventual duplicates across chunks
+seen_ids = set()
+written_categories = set()
+
+for file in gpkg_files:
+    print(f"Processing {file}")
+    chunk_gdf = gpd.read_file(f"{chunk_file_path}{file}")
+
+    # Drop eventual duplicates within the chunk and buildings already written by previous chunks
+    id_hashes = pd.util.hash_array(chunk_gdf["id"].to_numpy(dtype=object))
+    _, first_occurrences = np.unique(id_hashes, return_index=True)
+    keep = np.zeros(len(chunk_gdf), dtype=bool)
+    keep[first_occurrences] = True
+    keep &= np.fromiter(
+        (id_hash not in seen_ids for id_hash in id_hashes.tolist()),
+        dtype=bool,
+        count=len(id_hashes),
+    )
+    seen_ids.update(id_hashes[keep].tolist())
+    chunk_gdf = chunk_gdf[keep]
+
+    # Filter for building functions specified in supplementary material of Risch et al. with a single lookup
+    chunk_categories = chunk_gdf["GFK"].map(function_categories).fillna("other")
 
-# Filter for building functions specified in supplementary material of Risch et al.
-residential_buildings = combined_gdf.query("GFK in @residential_function_values")
-health_buildings = combined_gdf.query("GFK in @health_function_values")
-mixed_buildings = combined_gdf.query("GFK in @mixed_function_values")
-other_buildings = combined_gdf.query("GFK not in @all_function_values")
+    # Append the filtered data to single GeoPackages in results_file_path, footprints of several polygons are
+    # MultiPolygons, so all footprints are written as MultiPolygons
+    for category, category_gdf in chunk_gdf.groupby(chunk_categories):
+        category_gdf.to_file(
+            f"{results_file_path}{category}.gpkg",
+            driver="GPKG",
+            mode="a" if category in written_categories else "w",
+            geometry_type="MultiPolygon",
+            promote_to_multi=True,
+        )
+        written_categories.add(category)
 
-# Save the filtered data to single Shapefiles in results_file_path
-residential_buildings.to_file(
-    f"{results_file_path}residential.shp", driver="ESRI Shapefile"
+# Create empty GeoPackages for categories without any buildings, with the schema of the chunks written by
+# buildings-data-acquisition.py, as there may be no chunk at all
+empty_gdf = gpd.GeoDataFrame(
+    {"id": pd.Series(dtype=str), "GFK": pd.Series(dtype=str)},
+    geometry=gpd.GeoSeries(crs="EPSG:25832"),
 )
-health_buildings.to_file(f"{results_file_path}health.shp", driver="ESRI Shapefile")
-mixed_buildings.to_file(f"{results_file_path}mixed.shp", driver="ESRI Shapefile")
-other_buildings.to_file(f"{results_file_path}other.shp", driver="ESRI Shapefile")
+for category in categories:
+    if category not in written_categories:
+        empty_gdf.to_file(
+            f"{results_file_path}{category}.gpkg",
+            driver="GPKG",
+            geometry_type="MultiPolygon",
+        )
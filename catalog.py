@@ -0,0 +1,143 @@
+# Loader of the declarative constraint catalog (catalog.json), which defines the turbine, the region, the constraint
+# sets, the scenarios and the buffer sweep. Buffers may be given as arithmetic expressions of the turbine parameters,
+# e.g. "3 * height", and sources may refer to {base_path}.
+import ast
+import json
+import operator
+from typing import Dict, List
+
+_binary_operators = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Pow: operator.pow,
+}
+_unary_operators = {ast.UAdd: operator.pos, ast.USub: operator.neg}
+
+# Keys of catalog entries which are only documentation
+_note_keys = {"note"}
+
+
+def evaluate(expression, variables: Dict[str, float]):
+    """
+    Evaluates an arithmetic expression of numbers and variables, e.g. "40 + radius". Numbers are returned unchanged.
+
+    :param expression: Number or expression using +, -, *, /, ** and parentheses
+    :param variables: Values of the names the expression may use
+    """
+    if not isinstance(expression, str):
+        return expression
+
+    def visit(node):
+        if isinstance(node, ast.Expression):
+            return visit(node.body)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return node.value
+        if isinstance(node, ast.Name):
+            if node.id not in variables:
+                raise ValueError(f"Unknown variable {node.id} in {expression!r}")
+            return variables[node.id]
+        if isinstance(node, ast.BinOp) and type(node.op) in _binary_operators:
+            return _binary_operators[type(node.op)](visit(node.left), visit(node.right))
+        if isinstance(node, ast.UnaryOp) and type(node.op) in _unary_operators:
+            return _unary_operators[type(node.op)](visit(node.operand))
+        raise ValueError(f"Unsupported expression {expression!r}")
+
+    return visit(ast.parse(expression, mode="eval"))
+
+
+def expression_variables(expression) -> List[str]:
+    """Returns the names of the variables an expression uses, e.g. ["height"] for "3 * height"."""
+    if not isinstance(expression, str):
+        return []
+    return sorted(
+        {
+            node.id
+            for node in ast.walk(ast.parse(expression, mode="eval"))
+            if isinstance(node, ast.Name)
+        }
+    )
+
+
+def load_constraint(entry: dict, variables: Dict[str, float], base_path: str) -> dict:
+    """Converts a catalog entry into a constraint dict as used by main.py, i.e. with evaluated buffers and paths."""
+    constraint = {key: value for key, value in entry.items() if key not in _note_keys}
+    constraint["source"] = constraint["source"].format(base_path=base_path)
+    if "buffer" in constraint:
+        constraint["buffer"] = evaluate(constraint["buffer"], variables)
+    return constraint
+
+
+def buffer_expressions(path: str = "./catalog.json") -> Dict[str, list]:
+    """
+    Returns the unevaluated buffers of the catalog, e.g. to find the constraints depending on the turbine.
+
+    :return: Dict of constraint set name -> buffer (number, expression or None) of every constraint of the set, in the
+        order of the constraint dicts returned by load_catalog
+    """
+    with open(path, encoding="utf-8") as file:
+        catalog = json.load(file)
+    return {
+        name: [entry.get("buffer") for entry in entries]
+        for name, entries in catalog["constraint_sets"].items()
+    }
+
+
+def load_catalog(path: str = "./catalog.json", turbine: Dict[str, float] = None):
+    """
+    Loads the constraint catalog.
+
+    :param path: Path of the catalog
+    :param turbine: Optional turbine parameters overriding those of the catalog, e.g. {"hub_height": 160}. Derived
+        parameters like height are evaluated with the overridden values
+    :return: Dict with base_path, raster_size, turbine (evaluated parameters), region_source, region_options (keyword
+        arguments of ExclusionCalculator), variable_exclude_buffers (range), fixed_constraint_sets (names),
+        constraint_sets (name -> list of constraint dicts) and scenarios (list of (name, exclusion set names))
+    """
+    with open(path, encoding="utf-8") as file:
+        catalog = json.load(file)
+
+    base_path = catalog["base_path"]
+    raster_size = catalog["raster_size"]
+
+    # Turbine parameters are evaluated in order, so later ones may refer to earlier ones
+    parameters = {**catalog["turbine"], **(turbine or {})}
+    variables = {}
+    for name, expression in parameters.items():
+        variables[name] = evaluate(expression, variables)
+
+    constraint_sets = {
+        name: [load_constraint(entry, variables, base_path) for entry in entries]
+        for name, entries in catalog["constraint_sets"].items()
+    }
+    scenarios = [
+        (scenario["name"], list(scenario["exclusion_sets"]))
+        for scenario in catalog["scenarios"]
+    ]
+    referenced_sets = set(catalog["fixed_constraint_sets"]) | {
+        name for _, exclusion_sets in scenarios for name in exclusion_sets
+    }
+    unknown_sets = referenced_sets - set(constraint_sets)
+    if unknown_sets:
+        raise ValueError(f"Unknown constraint sets in {path}: {sorted(unknown_sets)}")
+
+    sweep = catalog["variable_exclude_buffers"]
+    region = catalog["region"]
+    return {
+        "base_path": base_path,
+        "raster_size": raster_size,
+        "turbine": variables,
+        "region_source": region["source"].format(base_path=base_path),
+        "region_options": {
+            "srs": region["srs"],
+            "pixelRes": raster_size,
+            "where": region.get("where"),
+        },
+        "variable_exclude_buffers": range(
+            sweep["start"], sweep["stop"] + sweep["step"], sweep["step"]
+        ),
+        "fixed_constraint_sets": list(catalog["fixed_constraint_sets"]),
+        "constraint_sets": constraint_sets,
+        "scenarios": scenarios,
+    }
@@ -0,0 +1,129 @@
+# Incremental parser for LoD2 CityGML files, see buildings-data-acquisition.py
+# Buildings are emitted as soon as their bldg:Building element is closed and the processed elements are cleared
+# afterward, so the memory usage does not depend on the size of the file. The footprints of all buildings of a file are
+# then created at once from NumPy arrays with the vectorized constructors of shapely 2.
+import xml.etree.ElementTree as ET
+from typing import BinaryIO, Iterable, Iterator, List, Tuple, Union
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+gml_namespaces = {
+    "bldg": "http://www.opengis.net/citygml/building/1.0",
+    "gml": "http://www.opengis.net/gml",
+}
+
+building_tag = f"{{{gml_namespaces['bldg']}}}Building"
+gml_id_attribute = f"{{{gml_namespaces['gml']}}}id"
+
+
+def ground_surface_polygons(building: ET.Element) -> List[List[str]]:
+    """
+    Returns the polygons of all ground surfaces of a building, each as a list of the posList texts of its exterior and
+    interior rings.
+    """
+    polygons = []
+    for ground_surface in building.iterfind(".//bldg:GroundSurface", gml_namespaces):
+        for polygon in ground_surface.iterfind(".//gml:Polygon", gml_namespaces):
+            exterior = polygon.find("gml:exterior//gml:posList", gml_namespaces)
+            if exterior is None:
+                continue
+            interiors = polygon.iterfind("gml:interior//gml:posList", gml_namespaces)
+            polygons.append([exterior.text, *[ring.text for ring in interiors]])
+    return polygons
+
+
+def iter_buildings(
+    source: Union[str, BinaryIO],
+) -> Iterator[Tuple[str, str, List[List[str]]]]:
+    """
+    Parses a CityGML file incrementally and yields a (gml_id, function, ground surface polygons) record for every
+    building with a function, see ground_surface_polygons for the format of the polygons.
+
+    :param source: Path of a CityGML file or a binary file-like object, e.g. a streamed HTTP response
+    """
+    context = ET.iterparse(source, events=("start", "end"))
+    _, root = next(context)
+    for event, element in context:
+        if event != "end" or element.tag != building_tag:
+            continue
+
+        function_element = element.find(".//bldg:function", gml_namespaces)
+        if function_element is not None:
+            gml_id = element.attrib[gml_id_attribute]
+            polygons = ground_surface_polygons(element)
+            if not polygons:
+                print(f"Skipping building without ground surface: {gml_id}")
+            else:
+                yield gml_id, function_element.text, polygons
+
+        # Drop the building and all previously processed elements
+        element.clear()
+        root.clear()
+
+
+def create_footprints(
+    pos_lists: List[str],
+    ring_polygons: List[int],
+    polygon_buildings: List[int],
+    building_count: int,
+) -> np.ndarray:
+    """
+    Creates the 2D footprints of buildings from the posList texts of their ground surface rings.
+
+    :param pos_lists: posList texts of all rings, with 3D coordinates
+    :param ring_polygons: Index of the polygon of each ring, the first ring of each polygon is its exterior
+    :param polygon_buildings: Index of the building of each polygon
+    :param building_count: Number of buildings
+    :return: Array of Polygons for buildings with a single ground surface polygon and MultiPolygons otherwise
+    """
+    if building_count == 0:
+        return np.empty(0, dtype=object)
+
+    # Parse all coordinates into a single array and drop Z
+    coordinates = [np.fromstring(text, dtype=np.float64, sep=" ") for text in pos_lists]
+    ring_lengths = np.array([len(ring) // 3 for ring in coordinates])
+    coordinates = np.concatenate(coordinates).reshape(-1, 3)[:, :2]
+
+    rings = shapely.linearrings(
+        coordinates, indices=np.repeat(np.arange(len(pos_lists)), ring_lengths)
+    )
+    polygons = shapely.polygons(rings, indices=ring_polygons)
+    multipolygons = shapely.multipolygons(
+        polygons, indices=polygon_buildings, out=np.empty(building_count, dtype=object)
+    )
+    single = np.bincount(polygon_buildings, minlength=building_count) == 1
+    return np.where(single, shapely.get_geometry(multipolygons, 0), multipolygons)
+
+
+def buildings_to_geodataframe(
+    records: Iterable[Tuple[str, str, List[List[str]]]], crs: str = "EPSG:25832"
+) -> gpd.GeoDataFrame:
+    """
+    Collects building records as yielded by iter_buildings column by column and creates their footprints at once.
+
+    :param records: Building records
+    :param crs: Coordinate reference system of the CityGML file
+    :return: GeoDataFrame with the columns id and GFK (the building function)
+    """
+    gml_ids = []
+    building_functions = []
+    pos_lists = []
+    ring_polygons = []
+    polygon_buildings = []
+    for building_index, (gml_id, building_function, polygons) in enumerate(records):
+        gml_ids.append(gml_id)
+        building_functions.append(building_function)
+        for rings in polygons:
+            ring_polygons.extend([len(polygon_buildings)] * len(rings))
+            polygon_buildings.append(building_index)
+            pos_lists.extend(rings)
+
+    return gpd.GeoDataFrame(
+        data={"id": gml_ids, "GFK": building_functions},
+        geometry=create_footprints(
+            pos_lists, ring_polygons, polygon_buildings, len(gml_ids)
+        ),
+        crs=crs,
+    )
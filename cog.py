@@ -0,0 +1,261 @@
+# Cloud-optimized GeoTIFFs of the results: Tiled, DEFLATE compressed GeoTIFFs with internal overviews stored before the
+# full resolution data, so viewers can draw thumbnails and read single districts without reading the whole raster.
+# Availability is stored either as uint8 in the format of ExclusionCalculator.save (100 available, 0 excluded, 255
+# outside the region), which can be used as initialValue of an ExclusionCalculator, or packed to 1 bit per pixel
+# (1 available, 0 excluded) with an internal mask marking the pixels outside the region.
+from typing import Tuple
+
+import numpy as np
+from osgeo import gdal, ogr, osr
+
+gdal.UseExceptions()
+ogr.UseExceptions()
+
+# Overview factors, the smallest overview of Bavaria at 10 m is about 270 x 330 pixels
+overview_levels = [2, 4, 8, 16, 32, 64, 128, 256]
+
+cog_options = [
+    "TILED=YES",
+    "BLOCKXSIZE=512",
+    "BLOCKYSIZE=512",
+    "COMPRESS=DEFLATE",
+    "COPY_SRC_OVERVIEWS=YES",
+    "BIGTIFF=IF_SAFER",
+]
+
+
+def _memory_dataset(region, data: np.ndarray):
+    rows, cols = data.shape
+    dataset = gdal.GetDriverByName("MEM").Create("", cols, rows, 1, gdal.GDT_Byte)
+    dataset.SetGeoTransform(
+        (
+            region.extent.xMin,
+            region.pixelWidth,
+            0,
+            region.extent.yMax,
+            0,
+            -region.pixelHeight,
+        )
+    )
+    dataset.SetProjection(region.srs.ExportToWkt())
+    dataset.GetRasterBand(1).WriteArray(data)
+    return dataset
+
+
+def _build_overviews(dataset, resampling: str):
+    # Overviews smaller than a block are not worth storing
+    size = min(dataset.RasterYSize, dataset.RasterXSize)
+    levels = [level for level in overview_levels if size // level >= 256]
+    if levels:
+        dataset.BuildOverviews(resampling, levels)
+
+
+def _write_copy(dataset, output: str, options: list):
+    # Store the mask band within the GeoTIFF instead of a .msk file next to it
+    internal_mask = gdal.GetConfigOption("GDAL_TIFF_INTERNAL_MASK")
+    gdal.SetConfigOption("GDAL_TIFF_INTERNAL_MASK", "YES")
+    try:
+        gdal.GetDriverByName("GTiff").CreateCopy(output, dataset, options=options)
+    finally:
+        gdal.SetConfigOption("GDAL_TIFF_INTERNAL_MASK", internal_mask)
+
+
+def write_availability_cog(
+    region,
+    available: np.ndarray,
+    output: str,
+    packing: str = "uint8",
+    resampling: str = "NEAREST",
+):
+    """
+    Writes a boolean availability matrix to a cloud-optimized GeoTIFF.
+
+    :param region: geokit RegionMask defining the grid
+    :param available: Boolean availability matrix, pixels outside the region are marked as no data
+    :param output: Path of the GeoTIFF
+    :param packing: "uint8" for the format of ExclusionCalculator.save or "bit" for 1 bit per pixel and an internal mask
+    :param resampling: Resampling of the overviews
+    """
+    if packing == "uint8":
+        data = np.where(available, 100, 0).astype(np.uint8)
+        data[~region.mask] = 255
+        dataset = _memory_dataset(region, data)
+        dataset.GetRasterBand(1).SetNoDataValue(255)
+        options = cog_options
+    elif packing == "bit":
+        dataset = _memory_dataset(region, (available & region.mask).astype(np.uint8))
+        dataset.CreateMaskBand(gdal.GMF_PER_DATASET)
+        dataset.GetRasterBand(1).GetMaskBand().WriteArray(
+            region.mask.astype(np.uint8) * 255
+        )
+        options = [*cog_options, "NBITS=1"]
+    else:
+        raise ValueError(f"Unknown packing: {packing}")
+    # Overviews are built in memory, COPY_SRC_OVERVIEWS stores them before the full resolution data
+    _build_overviews(dataset, resampling)
+    _write_copy(dataset, output, options)
+
+
+def convert_to_cog(source: str, output: str, resampling: str = "NEAREST"):
+    """
+    Converts a GeoTIFF, e.g. written tile by tile, to a cloud-optimized GeoTIFF without reading it into memory. The
+    overviews are added to the source first, which is why it is usually a temporary file.
+
+    :param source: Path of the GeoTIFF to convert, opened for update
+    :param output: Path of the cloud-optimized GeoTIFF
+    :param resampling: Resampling of the overviews
+    """
+    dataset = gdal.Open(source, gdal.GA_Update)
+    _build_overviews(dataset, resampling)
+    _write_copy(dataset, output, cog_options)
+    dataset = None
+
+
+def update_window(
+    path: str, available: np.ndarray, valid: np.ndarray, row: int, col: int
+) -> int:
+    """
+    Overwrites a window of an availability GeoTIFF written by write_availability_cog or convert_to_cog in place,
+    including the pixels of all overviews derived from the window (assuming NEAREST resampling). Rewritten tiles are
+    appended to the file, so it remains a valid tiled GeoTIFF but loses the optimized layout. convert_to_cog restores
+    it.
+
+    :param path: Path of the GeoTIFF
+    :param available: Boolean availability matrix of the window
+    :param valid: Boolean matrix of the pixels of the window within the region, the region itself must not change
+    :param row: Row offset of the window
+    :param col: Column offset of the window
+    :return: Number of available pixels within the window before the update
+    """
+    dataset = gdal.Open(path, gdal.GA_Update)
+    band = dataset.GetRasterBand(1)
+    rows, cols = available.shape
+    previous = band.ReadAsArray(col, row, cols, rows)
+    if band.GetMetadataItem("NBITS", "IMAGE_STRUCTURE") == "1":
+        previous_available = previous == 1
+        data = (available & valid).astype(np.uint8)
+    else:
+        previous_available = previous > 50
+        data = np.where(available, 100, 0).astype(np.uint8)
+        data[~valid] = 255
+    previous_count = np.count_nonzero(previous_available & valid)
+    band.WriteArray(data, xoff=col, yoff=row)
+
+    # Every overview pixel takes the value of the full resolution pixel at its center, like NEAREST resampling
+    for index in range(band.GetOverviewCount()):
+        overview = band.GetOverview(index)
+        y_scale = dataset.RasterYSize / overview.YSize
+        x_scale = dataset.RasterXSize / overview.XSize
+        overview_rows = np.arange(
+            int(row // y_scale),
+            min(int(np.ceil((row + rows) / y_scale)), overview.YSize),
+        )
+        overview_cols = np.arange(
+            int(col // x_scale),
+            min(int(np.ceil((col + cols) / x_scale)), overview.XSize),
+        )
+        source_rows = np.minimum(
+            ((overview_rows + 0.5) * y_scale).astype(int), dataset.RasterYSize - 1
+        )
+        source_cols = np.minimum(
+            ((overview_cols + 0.5) * x_scale).astype(int), dataset.RasterXSize - 1
+        )
+        source = band.ReadAsArray(
+            int(source_cols[0]),
+            int(source_rows[0]),
+            int(source_cols[-1] - source_cols[0] + 1),
+            int(source_rows[-1] - source_rows[0] + 1),
+        )
+        overview.WriteArray(
+            source[np.ix_(source_rows - source_rows[0], source_cols - source_cols[0])],
+            xoff=int(overview_cols[0]),
+            yoff=int(overview_rows[0]),
+        )
+    dataset = None
+    return previous_count
+
+
+def read_window(
+    path: str, bounds: Tuple[float, float, float, float], overview: int = None
+):
+    """
+    Reads the pixels of a raster within the given bounds.
+
+    :param path: Path of the raster, e.g. a result of the sweep
+    :param bounds: (xMin, yMin, xMax, yMax) in the spatial reference system of the raster
+    :param overview: Index of the overview to read from, None for full resolution
+    :return: Tuple of the data, the mask of valid pixels (False outside the region) and the geotransform of the window
+    """
+    dataset = gdal.Open(path)
+    band = dataset.GetRasterBand(1)
+    x_origin, pixel_width, _, y_origin, _, pixel_height = dataset.GetGeoTransform()
+    if overview is not None:
+        band = band.GetOverview(overview)
+        pixel_width *= dataset.RasterXSize / band.XSize
+        pixel_height *= dataset.RasterYSize / band.YSize
+
+    x_min, y_min, x_max, y_max = bounds
+    col = max(0, int(np.floor((x_min - x_origin) / pixel_width)))
+    row = max(0, int(np.floor((y_max - y_origin) / pixel_height)))
+    cols = min(band.XSize, int(np.ceil((x_max - x_origin) / pixel_width))) - col
+    rows = min(band.YSize, int(np.ceil((y_min - y_origin) / pixel_height))) - row
+    if rows <= 0 or cols <= 0:
+        raise ValueError(f"{bounds} does not intersect {path}")
+
+    data = band.ReadAsArray(col, row, cols, rows)
+    valid = band.GetMaskBand().ReadAsArray(col, row, cols, rows) > 0
+    geotransform = (
+        x_origin + col * pixel_width,
+        pixel_width,
+        0,
+        y_origin + row * pixel_height,
+        0,
+        pixel_height,
+    )
+    return data, valid, geotransform
+
+
+def read_feature(path: str, source: str, where: str, overview: int = None):
+    """
+    Reads the pixels of a raster within a feature of a vector source, e.g. a district of VerwaltungsEinheit.shp.
+
+    :param path: Path of the raster
+    :param source: Path of the vector source
+    :param where: Where clause selecting the feature(s), e.g. "art = 'Landkreis' AND name = 'Ebersberg'"
+    :param overview: Index of the overview to read from, None for full resolution
+    :return: Tuple of the data, the mask of valid pixels within the feature(s) and the geotransform of the window
+    """
+    raster_srs = osr.SpatialReference(wkt=gdal.Open(path).GetProjection())
+    if hasattr(raster_srs, "SetAxisMappingStrategy"):
+        raster_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    vector = ogr.Open(source)
+    layer = vector.GetLayer()
+    layer.SetAttributeFilter(where)
+
+    memory = ogr.GetDriverByName("Memory").CreateDataSource("")
+    features = memory.CreateLayer("features", srs=raster_srs)
+    for feature in layer:
+        geometry = feature.GetGeometryRef().Clone()
+        geometry.TransformTo(raster_srs)
+        memory_feature = ogr.Feature(features.GetLayerDefn())
+        memory_feature.SetGeometry(geometry)
+        features.CreateFeature(memory_feature)
+    if features.GetFeatureCount() == 0:
+        raise ValueError(f"No feature of {source} matches {where}")
+    x_min, x_max, y_min, y_max = features.GetExtent()
+
+    data, valid, geotransform = read_window(
+        path, (x_min, y_min, x_max, y_max), overview
+    )
+    rows, cols = data.shape
+    inside = gdal.GetDriverByName("MEM").Create("", cols, rows, 1, gdal.GDT_Byte)
+    inside.SetGeoTransform(geotransform)
+    inside.SetProjection(raster_srs.ExportToWkt())
+    gdal.RasterizeLayer(inside, [1], features, burn_values=[1])
+    return data, valid & (inside.ReadAsArray() > 0), geotransform
+
+
+def availability(data: np.ndarray, path: str) -> np.ndarray:
+    """Converts the data read from a result raster to a boolean availability matrix, independent of its packing."""
+    nbits = gdal.Open(path).GetRasterBand(1).GetMetadataItem("NBITS", "IMAGE_STRUCTURE")
+    return data == 1 if nbits == "1" else data > 50
@@ -0,0 +1,203 @@
+# Attribution of exclusions to constraints: Every constraint is rasterized once and recorded as one bit of a per-pixel
+# bitmask, so the bitmask tells which constraints (and therefore which categories) exclude a pixel. The maps of the
+# categories, their overlaps and how often a constraint or category is the sole reason for an exclusion are all
+# reductions of this single array. The reductions work on the distinct bit patterns and their pixel counts only.
+import json
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from osgeo import gdal
+
+from constraint_planner import plan_constraint_masks
+
+gdal.UseExceptions()
+
+
+def bitmask_dtype(count: int) -> np.dtype:
+    """Returns the smallest unsigned integer type with one bit per constraint, at least uint32."""
+    if count <= 32:
+        return np.dtype(np.uint32)
+    if count <= 64:
+        return np.dtype(np.uint64)
+    raise ValueError(f"{count} constraints do not fit into a 64 bit mask")
+
+
+def attribution_bitmask(
+    region, constraints: List[dict], cache=None, timeline=None
+) -> np.ndarray:
+    """
+    Rasterizes every constraint once and sets bit i of every pixel constraint i excludes.
+
+    :param region: geokit RegionMask defining the grid, e.g. ExclusionCalculator.region
+    :param constraints: Constraint dicts, their position is their bit
+    :param cache: Optional MaskCache
+    :param timeline: Optional profiling.Timeline
+    :return: Bitmask of the dtype returned by bitmask_dtype, 0 outside the region
+    """
+    dtype = bitmask_dtype(len(constraints))
+    bits = np.zeros(region.mask.shape, dtype=dtype)
+    positions = {id(constraint): index for index, constraint in enumerate(constraints)}
+    for constraint, mask in plan_constraint_masks(region, constraints, cache, timeline):
+        print(f"Attributing {constraint}")
+        bit = dtype.type(1) << dtype.type(positions[id(constraint)])
+        np.bitwise_or(bits, bit, out=bits, where=mask)
+    bits[~region.mask] = 0
+    return bits
+
+
+def pattern_counts(
+    bits: np.ndarray, region_mask: np.ndarray, block_rows: int = 1024
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Counts the pixels of the region for every distinct bit pattern, processing the bitmask in blocks of rows.
+
+    :return: Tuple of the distinct patterns and their pixel counts
+    """
+    totals = {}
+    for row in range(0, bits.shape[0], block_rows):
+        patterns, counts = np.unique(
+            bits[row : row + block_rows][region_mask[row : row + block_rows]],
+            return_counts=True,
+        )
+        for pattern, count in zip(patterns.tolist(), counts.tolist()):
+            totals[pattern] = totals.get(pattern, 0) + count
+    patterns = np.array(list(totals), dtype=bits.dtype)
+    return patterns, np.array(list(totals.values()), dtype=np.int64)
+
+
+def category_bits(constraints: List[dict], categories: Dict[str, List[dict]]) -> Dict:
+    """Returns the bits of the constraints of every category as a single bitmask."""
+    positions = {id(constraint): index for index, constraint in enumerate(constraints)}
+    return {
+        name: sum(1 << positions[id(constraint)] for constraint in category)
+        for name, category in categories.items()
+    }
+
+
+def attribution_statistics(
+    patterns: np.ndarray,
+    counts: np.ndarray,
+    constraints: List[dict],
+    categories: Dict[str, List[dict]],
+) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Reduces the pattern counts of an attribution bitmask to statistics in percent of the region.
+
+    :param patterns: Distinct bit patterns, see pattern_counts
+    :param counts: Pixel counts of the patterns
+    :param constraints: Constraint dicts in the order of their bits
+    :param categories: Dict of category name -> constraint dicts, each of them also part of constraints
+    :return: Tuple of
+        - categories: constrained_area and sole_constrained_area (excluded by no other category) of every category
+        - overlap: Area excluded by both categories for every pair of categories, the diagonal is the constrained area
+        - constraints: category, constrained_area and sole_constrained_area (excluded by no other constraint) of every
+          constraint
+    """
+    region_pixels = counts.sum()
+    dtype = patterns.dtype.type
+
+    def percent(selected):
+        return 100 * counts[selected].sum() / region_pixels
+
+    bits = {
+        name: dtype(value)
+        for name, value in category_bits(constraints, categories).items()
+    }
+    category_hits = {name: (patterns & value) != 0 for name, value in bits.items()}
+    category_df = pd.DataFrame(
+        {
+            "constrained_area": [percent(hit) for hit in category_hits.values()],
+            "sole_constrained_area": [
+                percent(category_hits[name] & ((patterns & ~bits[name]) == 0))
+                for name in bits
+            ],
+        },
+        index=list(bits),
+    )
+    overlap_df = pd.DataFrame(
+        [[percent(category_hits[a] & category_hits[b]) for b in bits] for a in bits],
+        index=list(bits),
+        columns=list(bits),
+    )
+
+    category_of = {
+        id(constraint): name
+        for name, category in categories.items()
+        for constraint in category
+    }
+    rows = []
+    for index, constraint in enumerate(constraints):
+        bit = dtype(1) << dtype(index)
+        rows.append(
+            {
+                "constraint": constraint.get("name", constraint["source"]),
+                "category": category_of.get(id(constraint)),
+                "constrained_area": percent((patterns & bit) != 0),
+                "sole_constrained_area": percent(patterns == bit),
+            }
+        )
+    return category_df, overlap_df, pd.DataFrame(rows).set_index("constraint")
+
+
+def category_availability(
+    bits: np.ndarray, constraints: List[dict], category: List[dict]
+) -> np.ndarray:
+    """Returns the boolean availability matrix after excluding only the constraints of one category."""
+    value = bits.dtype.type(
+        category_bits(constraints, {"category": category})["category"]
+    )
+    return (bits & value) == 0
+
+
+def save_bitmask(region, bits: np.ndarray, output: str, constraints: List[dict]):
+    """
+    Saves an attribution bitmask as a GeoTIFF with one uint32 band per 32 constraints and describes the bits in a JSON
+    file next to it (output + ".json").
+    """
+    rows, cols = bits.shape
+    bands = bits.dtype.itemsize // 4
+    dataset = gdal.GetDriverByName("GTiff").Create(
+        output,
+        cols,
+        rows,
+        bands,
+        gdal.GDT_UInt32,
+        options=["COMPRESS=DEFLATE", "TILED=YES", "BIGTIFF=IF_SAFER"],
+    )
+    dataset.SetGeoTransform(
+        (
+            region.extent.xMin,
+            region.pixelWidth,
+            0,
+            region.extent.yMax,
+            0,
+            -region.pixelHeight,
+        )
+    )
+    dataset.SetProjection(region.srs.ExportToWkt())
+    for band in range(bands):
+        # Band 1 holds bits 0 to 31, band 2 bits 32 to 63
+        dataset.GetRasterBand(band + 1).WriteArray(
+            ((bits >> bits.dtype.type(32 * band)) & bits.dtype.type(0xFFFFFFFF)).astype(
+                np.uint32
+            )
+        )
+    dataset = None
+
+    with open(f"{output}.json", "w", encoding="utf-8") as file:
+        json.dump(
+            [
+                {
+                    "bit": index,
+                    "band": index // 32 + 1,
+                    "name": constraint.get("name"),
+                    "source": constraint["source"],
+                    "where": constraint.get("where"),
+                    "buffer": constraint.get("buffer"),
+                }
+                for index, constraint in enumerate(constraints)
+            ],
+            file,
+            indent=1,
+        )
@@ -0,0 +1,210 @@
+# Constraint planner: Many constraints in main.py use the same vector source with different where clauses and buffers,
+# e.g. Basis-DLM/sie02_f.shp. The planner groups the constraints by source, reads each source only once with only the
+# attribute fields its where clauses need, splits the features per constraint in memory and rasterizes the subsets one
+# after another onto a single reused in-memory band, so only one mask per source is held in memory at a time.
+import re
+from collections import OrderedDict
+from contextlib import nullcontext
+from typing import Iterator, List, Tuple
+
+import numpy as np
+from osgeo import gdal, ogr, osr
+
+from exclusion_utils import indicate
+
+gdal.UseExceptions()
+ogr.UseExceptions()
+
+# Words of OGR SQL where clauses that are never field names
+_sql_keywords = {"and", "or", "not", "in", "is", "null", "like", "between"}
+
+
+def where_fields(where: str, field_names: List[str]) -> List[str]:
+    """Returns the fields of a layer a where clause refers to."""
+    if not where:
+        return []
+    # Remove string literals before looking for identifiers
+    identifiers = re.findall(r"[A-Za-z_][A-Za-z0-9_]*", re.sub(r"'[^']*'", "", where))
+    used = {identifier.lower() for identifier in identifiers} - _sql_keywords
+    return [name for name in field_names if name.lower() in used]
+
+
+def group_by_source(excludes: List[dict]) -> "OrderedDict[str, List[dict]]":
+    """Groups constraint dicts by their source, keeping the order of first occurrence."""
+    groups = OrderedDict()
+    for exclude in excludes:
+        groups.setdefault(exclude["source"], []).append(exclude)
+    return groups
+
+
+def _traditional_axis_order(srs: osr.SpatialReference) -> osr.SpatialReference:
+    # GDAL >= 3 respects the authority's axis order, e.g. lat/lon for EPSG:4326, unless told otherwise
+    if hasattr(srs, "SetAxisMappingStrategy"):
+        srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    return srs
+
+
+def read_source(region, source: str, excludes: List[dict], padding: float = 0):
+    """
+    Reads a vector source once into an in-memory layer in the region's spatial reference system. Only features within
+    the region's extent padded by the largest buffer of the excludes and only the fields required by their where clauses
+    are read.
+
+    :param padding: Minimum padding of the region's extent, e.g. for a distance raster
+
+    :return: Tuple of the in-memory datasource (which must be kept alive) and its layer
+    """
+    dataset = ogr.Open(source)
+    layer = dataset.GetLayer()
+    definition = layer.GetLayerDefn()
+    field_names = [
+        definition.GetFieldDefn(i).GetName() for i in range(definition.GetFieldCount())
+    ]
+    required_fields = set()
+    for exclude in excludes:
+        required_fields.update(where_fields(exclude.get("where"), field_names))
+    layer.SetIgnoredFields(
+        [name for name in field_names if name not in required_fields] + ["OGR_STYLE"]
+    )
+
+    region_srs = _traditional_axis_order(region.srs.Clone())
+    source_srs = _traditional_axis_order(layer.GetSpatialRef().Clone())
+    to_region = osr.CoordinateTransformation(source_srs, region_srs)
+
+    # Only read features that might affect the region
+    padding = max([padding, *[exclude.get("buffer") or 0 for exclude in excludes]])
+    extent = region.extent
+    spatial_filter = ogr.CreateGeometryFromWkt(
+        "POLYGON (({0} {1}, {2} {1}, {2} {3}, {0} {3}, {0} {1}))".format(
+            extent.xMin - padding,
+            extent.yMin - padding,
+            extent.xMax + padding,
+            extent.yMax + padding,
+        )
+    )
+    spatial_filter.AssignSpatialReference(region_srs)
+    spatial_filter.TransformTo(source_srs)
+    layer.SetSpatialFilter(spatial_filter)
+
+    memory_dataset = ogr.GetDriverByName("Memory").CreateDataSource("")
+    memory_layer = memory_dataset.CreateLayer(
+        "features", srs=region_srs, geom_type=layer.GetGeomType()
+    )
+    for name in field_names:
+        if name in required_fields:
+            memory_layer.CreateField(
+                definition.GetFieldDefn(definition.GetFieldIndex(name))
+            )
+    memory_definition = memory_layer.GetLayerDefn()
+    for feature in layer:
+        geometry = feature.GetGeometryRef()
+        if geometry is None:
+            continue
+        geometry = geometry.Clone()
+        geometry.Transform(to_region)
+        memory_feature = ogr.Feature(memory_definition)
+        memory_feature.SetGeometryDirectly(geometry)
+        for name in required_fields:
+            memory_feature.SetField(name, feature.GetField(name))
+        memory_layer.CreateFeature(memory_feature)
+    print(f"Read {memory_layer.GetFeatureCount()} features from {source}")
+    return memory_dataset, memory_layer
+
+
+def rasterize_group(region, layer, excludes: List[dict]) -> Iterator[np.ndarray]:
+    """
+    Rasterizes several constraint dicts using the same vector source, which was read once by read_source.
+
+    The features of every constraint are split off and buffered and the constraint is rasterized onto a single in-memory
+    band, which is reused for all constraints.
+
+    :param region: geokit RegionMask defining the grid
+    :param layer: In-memory layer of the source as returned by read_source
+    :param excludes: Constraint dicts using the source
+    :return: Iterator of the boolean masks of the excludes, in the same order
+    """
+    rows, cols = region.mask.shape
+    raster = gdal.GetDriverByName("MEM").Create("", cols, rows, 1, gdal.GDT_Byte)
+    raster.SetGeoTransform(
+        (
+            region.extent.xMin,
+            region.pixelWidth,
+            0,
+            region.extent.yMax,
+            0,
+            -region.pixelHeight,
+        )
+    )
+    raster.SetProjection(region.srs.ExportToWkt())
+    band = raster.GetRasterBand(1)
+
+    for exclude in excludes:
+        # Split the features of the constraint and buffer them
+        layer.SetAttributeFilter(exclude.get("where"))
+        subset = ogr.GetDriverByName("Memory").CreateDataSource("")
+        subset_layer = subset.CreateLayer("subset", srs=layer.GetSpatialRef())
+        buffer = exclude.get("buffer")
+        for feature in layer:
+            geometry = feature.GetGeometryRef()
+            if buffer:
+                geometry = geometry.Buffer(buffer)
+            subset_feature = ogr.Feature(subset_layer.GetLayerDefn())
+            subset_feature.SetGeometry(geometry)
+            subset_layer.CreateFeature(subset_feature)
+        band.Fill(0)
+        gdal.RasterizeLayer(raster, [1], subset_layer, burn_values=[1])
+        subset = None
+        yield band.ReadAsArray() > 0
+    layer.SetAttributeFilter(None)
+
+
+def plan_constraint_masks(
+    region, excludes: List[dict], cache=None, timeline=None
+) -> Iterator[Tuple[dict, np.ndarray]]:
+    """
+    Yields the mask of every constraint dict, reading each vector source only once. Masks available in the cache are
+    taken from it and only the remaining constraints of a source are read and rasterized.
+
+    :param region: geokit RegionMask defining the grid, e.g. ExclusionCalculator.region
+    :param excludes: Constraint dicts as defined in main.py
+    :param cache: Optional MaskCache
+    :param timeline: Optional profiling.Timeline recording the reading and rasterization of every source
+    :return: Iterator of (constraint dict, boolean mask), grouped by source
+    """
+
+    def step(name, **fields):
+        if timeline is None:
+            return nullcontext()
+        return timeline.step(name, source=source, **fields)
+
+    for source, group in group_by_source(excludes).items():
+        missing = []
+        for exclude in group:
+            mask = None
+            if cache is not None:
+                with step("read cached mask", constraint=exclude.get("name")):
+                    mask = cache.get(region, exclude)
+            if mask is None:
+                missing.append(exclude)
+            else:
+                print(f"Using cached mask for {exclude}")
+                yield exclude, mask
+        if not missing:
+            continue
+
+        if source.endswith((".shp", ".gpkg")):
+            print(f"Rasterizing {len(missing)} constraints of {source}")
+            with step("read source", constraints=len(missing)):
+                memory_dataset, memory_layer = read_source(region, source, missing)
+                if timeline is not None:
+                    timeline.add(features=memory_layer.GetFeatureCount())
+            masks = rasterize_group(region, memory_layer, missing)
+        else:
+            masks = (indicate(region, exclude) for exclude in missing)
+        # Masks are rasterized one at a time, while the caller consumes them
+        for exclude in missing:
+            with step("rasterize", constraint=exclude.get("name")):
+                mask = next(masks)
+                if cache is not None:
+                    cache.put(region, exclude, mask)
+            yield exclude, mask
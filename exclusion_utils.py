@@ -0,0 +1,127 @@
+# Helpers for working with exclusions as boolean masks on the grid of a GLAES ExclusionCalculator
+from typing import Tuple
+
+import geokit as gk
+import numpy as np
+
+from cog import write_availability_cog
+
+# Keys of constraint dicts which are not arguments of the exclude methods of GLAES
+catalog_keys = {"name", "update_buffer"}
+
+
+def glaes_arguments(exclude: dict) -> dict:
+    """Returns the keyword arguments of ExclusionCalculator.excludeVectorType/excludeRasterType of a constraint dict."""
+    return {key: value for key, value in exclude.items() if key not in catalog_keys}
+
+
+def apply_exclude(ec, exclude: dict):
+    """
+    Applies a single constraint dict to an ExclusionCalculator, dispatching on the type of its source.
+
+    :param ec: The ExclusionCalculator to exclude from
+    :param exclude: Constraint dict as defined in main.py
+    """
+    if "source" in exclude and exclude["source"].endswith((".shp", ".gpkg")):
+        ec.excludeVectorType(**glaes_arguments(exclude))
+    elif "source" in exclude and exclude["source"].endswith(".tif"):
+        ec.excludeRasterType(**glaes_arguments(exclude))
+    else:
+        print(f"Unknown exclude type ignored: {exclude.get('source')}")
+
+
+def exclude_mask(ec, mask: np.ndarray):
+    """
+    Excludes all pixels of a boolean mask from an ExclusionCalculator, equivalent to excluding the constraint the mask
+    was rasterized from.
+    """
+    ec._availability[mask] = 0
+
+
+def exclusion_counts(ec, mask: np.ndarray) -> Tuple[int, int]:
+    """
+    Counts the pixels of the region a mask would exclude from an ExclusionCalculator.
+
+    :return: Tuple of the number of pixels that are newly excluded and of those that are already excluded
+    """
+    indicated = mask & ec.region.mask
+    newly_excluded = np.count_nonzero(indicated & (ec._availability > 50))
+    return newly_excluded, np.count_nonzero(indicated) - newly_excluded
+
+
+def indicate(region, exclude: dict) -> np.ndarray:
+    """
+    Rasterizes a single constraint dict onto the grid of a region, without applying the region mask.
+
+    :param region: geokit RegionMask defining the grid
+    :param exclude: Constraint dict as defined in main.py
+    :return: Boolean matrix that is True wherever the constraint excludes a pixel
+    """
+    source = exclude["source"]
+    if source.endswith((".shp", ".gpkg")):
+        indicated = region.indicateFeatures(
+            source,
+            where=exclude.get("where"),
+            buffer=exclude.get("buffer"),
+            applyMask=False,
+            noData=0,
+        )
+    elif source.endswith(".tif"):
+        indicated = region.indicateValues(
+            source,
+            value=exclude["value"],
+            buffer=exclude.get("buffer"),
+            applyMask=False,
+            noData=0,
+        )
+    else:
+        raise ValueError(f"Unknown exclude type: {source}")
+    return np.asarray(indicated) > 0.5
+
+
+def availability_mask(ec) -> np.ndarray:
+    """
+    Returns the availability of an ExclusionCalculator as a boolean matrix, False outside the region.
+    GLAES stores availability as values from 0 (excluded) to 100 (available).
+    """
+    return (np.asarray(ec.availability) > 50) & ec.region.mask
+
+
+def percent_available(region, available: np.ndarray) -> float:
+    """Equivalent of ExclusionCalculator.percentAvailable for a boolean availability matrix."""
+    mask = region.mask
+    return 100 * np.count_nonzero(available & mask) / np.count_nonzero(mask)
+
+
+def save_availability(region, available: np.ndarray, output: str, packing="uint8"):
+    """
+    Saves a boolean availability matrix as a cloud-optimized GeoTIFF, see cog.py. The "uint8" packing has the same
+    format as ExclusionCalculator.save, i.e. 100 for available, 0 for excluded and 255 outside the region, so that it
+    can be used as initialValue of an ExclusionCalculator. The "bit" packing stores 1 bit per pixel.
+    """
+    write_availability_cog(region, available, output, packing)
+
+
+def subgrid(region, row_offset: int, col_offset: int, rows: int, cols: int):
+    """
+    Creates a rectangular RegionMask that is aligned to the grid of region. The window may extend beyond the region's
+    extent, e.g. to add a halo around a block of rows.
+
+    :param region: geokit RegionMask defining the grid
+    :param row_offset: Offset of the first row relative to the region's top row, may be negative
+    :param col_offset: Offset of the first column relative to the region's left column, may be negative
+    :param rows: Number of rows of the window
+    :param cols: Number of columns of the window
+    """
+    pixel_width = region.pixelWidth
+    pixel_height = region.pixelHeight
+    x_min = region.extent.xMin + col_offset * pixel_width
+    y_max = region.extent.yMax - row_offset * pixel_height
+    extent = gk.Extent(
+        x_min,
+        y_max - rows * pixel_height,
+        x_min + cols * pixel_width,
+        y_max,
+        srs=region.srs,
+    )
+    return gk.RegionMask.fromMask(extent, np.ones((rows, cols), dtype=bool))
@@ -1,31 +1,63 @@
 # Read all geofabrik shape files for each category and area
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 import geopandas as gpd
-import pandas as pd
 
 # Before running this script, download .shp.zip for all Bavarian subregions from
 # https://download.geofabrik.de/europe/germany/bayern.html and extract them to base_dir first
 base_dir = "./downloads/geofabrik"
+# Alternatively, download the .shp.zip for Germany from https://download.geofabrik.de/europe/germany.html, extract it
+# to germany_dir and set germany_dir below. Features are then limited to the bounding box of Bavaria at read time.
+germany_dir = None
+bavaria_bbox = (8.97, 47.27, 13.84, 50.57)
 results_file_path = "./input/OSM"
 os.makedirs(results_file_path, exist_ok=True)
 
-# File names and adapted queries from Supplementary material
+# Number of regions read concurrently
+read_workers = 8
+
+# File names and adapted filters from Supplementary material
 files_to_read = [
-    ("gis_osm_waterways_free_1", "fclass=='stream' | fclass=='ditch'"),
+    ("gis_osm_waterways_free_1", ["stream", "ditch"]),
     (
         "gis_osm_pois_a_free_1",
-        "fclass in ['archaeological','monument','memorial','castle']",
+        ["archaeological", "monument", "memorial", "castle"],
     ),
 ]
 
-# Read, query and concat the files from every region to a single gdf and save it to the input directory
-for file, query in files_to_read:
-    gdfs = []
-    for region_folder in os.listdir(base_dir):
-        region_gdf = gpd.read_file(f"{base_dir}/{region_folder}/{file}.shp").query(
-            query
-        )
-        gdfs.append(region_gdf)
-    gdf = pd.concat(gdfs)
-    gdf.to_file(f"{results_file_path}/{file}.shp")
+
+def read_region(path: str, fclasses: list, bbox: tuple = None) -> gpd.GeoDataFrame:
+    """
+    Reads the features of the given classes from a geofabrik shape file. The filter is evaluated by OGR while reading
+    and only the fclass column is read besides the geometry.
+
+    :param path: Path of the shape file
+    :param fclasses: Feature classes to read
+    :param bbox: Optional bounding box (in the CRS of the file) to clip the features to
+    """
+    where = "fclass IN ({})".format(", ".join(f"'{c}'" for c in fclasses))
+    gdf = gpd.read_file(path, columns=["fclass"], where=where, bbox=bbox)
+    if bbox is not None:
+        gdf = gdf.clip(bbox)
+    return gdf
+
+
+# Read and filter the files from every region concurrently and append them to a single file in the input directory
+for file, fclasses in files_to_read:
+    if germany_dir is not None:
+        paths = [f"{germany_dir}/{file}.shp"]
+        bbox = bavaria_bbox
+    else:
+        paths = [
+            f"{base_dir}/{region_folder}/{file}.shp"
+            for region_folder in sorted(os.listdir(base_dir))
+        ]
+        bbox = None
+
+    with ThreadPoolExecutor(max_workers=read_workers) as executor:
+        for index, gdf in enumerate(
+            executor.map(lambda path: read_region(path, fclasses, bbox), paths)
+        ):
+            print(f"Writing {len(gdf)} features of {paths[index]}")
+            gdf.to_file(f"{results_file_path}/{file}.shp", mode="a" if index else "w")
@@ -0,0 +1,391 @@
+# Incremental update of the results when some sources change, e.g. after a quarterly data refresh: The features of every
+# vector source are recorded in a snapshot after a full run. The snapshot is compared with the new version of a source
+# to find the added, removed and modified features. Only the windows of the grid within the largest buffer of their
+# constraints around these features are recomputed, in the result of the fixed excludes, in all scenario rasters and in
+# the percentages of the results CSV. Sources without a snapshot and raster sources affect the whole grid.
+#
+# Usage: python incremental_update.py [SOURCE ...] to update the results for the given sources, by default for all
+# sources whose files changed since their snapshot, or python incremental_update.py --snapshot to only record snapshots
+import hashlib
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from osgeo import gdal, ogr, osr
+from scipy.ndimage import find_objects, label
+
+from cog import update_window
+from constraint_planner import plan_constraint_masks
+from exclusion_utils import subgrid
+from mask_cache import source_signature
+from residential_distance import distance_raster
+from source_preparation import source_prefix, vector_extensions
+from tiled_exclusion import Grid, create_tiles, process_tile
+
+gdal.UseExceptions()
+ogr.UseExceptions()
+
+Window = Tuple[int, int, int, int]
+
+
+def snapshot_path(directory: str, source: str) -> str:
+    return os.path.join(directory, f"{source_prefix(source)}.npz")
+
+
+def feature_snapshot(source: str) -> Tuple[np.ndarray, np.ndarray, str]:
+    """
+    Identifies the features of a vector source by a hash of their geometry and attributes.
+
+    :return: Tuple of the hashes, the bounding boxes as (xMin, yMin, xMax, yMax) and the spatial reference system (WKT)
+    """
+    dataset = ogr.Open(source)
+    layer = dataset.GetLayer()
+    keys = []
+    bounds = []
+    for feature in layer:
+        geometry = feature.GetGeometryRef()
+        if geometry is None:
+            continue
+        digest = hashlib.blake2b(geometry.ExportToWkb(), digest_size=8)
+        digest.update(repr(feature.items()).encode())
+        keys.append(int.from_bytes(digest.digest(), "little"))
+        x_min, x_max, y_min, y_max = geometry.GetEnvelope()
+        bounds.append((x_min, y_min, x_max, y_max))
+    return (
+        np.array(keys, dtype=np.uint64),
+        np.array(bounds, dtype=np.float64).reshape(-1, 4),
+        layer.GetSpatialRef().ExportToWkt(),
+    )
+
+
+def save_snapshot(source: str, directory: str):
+    """Records the features of a vector source, see feature_snapshot. Raster sources are only recorded by signature."""
+    if source.endswith(vector_extensions):
+        keys, bounds, srs = feature_snapshot(source)
+    else:
+        keys, bounds, srs = np.zeros(0, dtype=np.uint64), np.zeros((0, 4)), ""
+    os.makedirs(directory, exist_ok=True)
+    path = snapshot_path(directory, source)
+    # np.savez appends .npz to paths without that extension
+    temporary_path = f"{path}.tmp.npz"
+    np.savez(
+        temporary_path,
+        keys=keys,
+        bounds=bounds,
+        srs=np.array(srs),
+        signature=np.array(json.dumps(source_signature(source))),
+    )
+    os.replace(temporary_path, path)
+    print(f"Recorded {len(keys)} features of {source} in {path}")
+
+
+def changed_sources(sources: List[str], directory: str) -> List[str]:
+    """Returns the sources whose files changed since their snapshot, including those without a snapshot."""
+    changed = []
+    for source in sources:
+        path = snapshot_path(directory, source)
+        if not os.path.exists(path):
+            changed.append(source)
+            continue
+        with np.load(path) as snapshot:
+            signature = json.loads(str(snapshot["signature"]))
+        if signature != json.loads(json.dumps(source_signature(source))):
+            changed.append(source)
+    return changed
+
+
+def changed_bounds(source: str, directory: str, srs) -> Optional[np.ndarray]:
+    """
+    Compares a vector source with its snapshot.
+
+    :param source: Path of the source
+    :param directory: Directory of the snapshots
+    :param srs: osr.SpatialReference to return the bounding boxes in
+    :return: (xMin, yMin, xMax, yMax) of every added or removed feature (a modified feature is both), None if the whole
+        source has to be considered changed
+    """
+    path = snapshot_path(directory, source)
+    if not source.endswith(vector_extensions) or not os.path.exists(path):
+        return None
+    with np.load(path) as snapshot:
+        old_keys, old_bounds = snapshot["keys"], snapshot["bounds"]
+        old_srs = str(snapshot["srs"])
+    new_keys, new_bounds, new_srs = feature_snapshot(source)
+
+    removed = old_bounds[~np.isin(old_keys, new_keys)]
+    added = new_bounds[~np.isin(new_keys, old_keys)]
+    print(f"{source}: {len(added)} features added, {len(removed)} removed")
+    return np.concatenate(
+        [transform_bounds(removed, old_srs, srs), transform_bounds(added, new_srs, srs)]
+    )
+
+
+def transform_bounds(bounds: np.ndarray, source_wkt: str, srs) -> np.ndarray:
+    """Transforms bounding boxes by their corners, which is sufficient for the small features of the sources."""
+    if len(bounds) == 0:
+        return bounds
+    source_srs = osr.SpatialReference(wkt=source_wkt)
+    target_srs = srs.Clone()
+    for spatial_reference in (source_srs, target_srs):
+        if hasattr(spatial_reference, "SetAxisMappingStrategy"):
+            spatial_reference.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    transformation = osr.CoordinateTransformation(source_srs, target_srs)
+    corners = bounds[:, [0, 1, 0, 3, 2, 1, 2, 3]].reshape(-1, 2)
+    points = np.array(transformation.TransformPoints(corners.tolist()))[:, :2]
+    points = points.reshape(-1, 4, 2)
+    return np.concatenate([points.min(axis=1), points.max(axis=1)], axis=1)
+
+
+def affected_windows(
+    grid: Grid,
+    excludes: List[dict],
+    bounds: Dict[str, Optional[np.ndarray]],
+    block_size: int = 256,
+    tile_size: int = 4096,
+) -> List[Window]:
+    """
+    Determines the disjoint windows of the grid affected by changes of some sources.
+
+    :param grid: Grid of the results
+    :param excludes: Constraint dicts, only the changed sources used by them are considered
+    :param bounds: Dict of changed source -> bounding boxes of the changed features as returned by changed_bounds
+    :param block_size: Windows are aligned to blocks of this number of pixels, which merges nearby changes
+    :param tile_size: Largest number of rows and columns of a window
+    :return: Windows as (row, col, rows, cols)
+    """
+    rows, cols = grid.shape
+    blocks = np.zeros(
+        (math.ceil(rows / block_size), math.ceil(cols / block_size)), dtype=bool
+    )
+    for source, source_bounds in bounds.items():
+        buffers = [
+            exclude.get("buffer") or 0
+            for exclude in excludes
+            if exclude["source"] == source
+        ]
+        if not buffers:
+            continue
+        if source_bounds is None:
+            print(f"{source} affects the whole grid")
+            blocks[:] = True
+            continue
+        # Features are rasterized up to a pixel beyond their bounds
+        distance = max(buffers) + 2 * grid.pixelWidth
+        x_min, y_max = grid.extent.xMin, grid.extent.yMax
+        col_start = np.floor((source_bounds[:, 0] - distance - x_min) / grid.pixelWidth)
+        col_stop = np.ceil((source_bounds[:, 2] + distance - x_min) / grid.pixelWidth)
+        row_start = np.floor(
+            (y_max - source_bounds[:, 3] - distance) / grid.pixelHeight
+        )
+        row_stop = np.ceil((y_max - source_bounds[:, 1] + distance) / grid.pixelHeight)
+        # Mark the blocks of every window, clipped to the grid
+        block_rows = np.clip([row_start, row_stop], 0, rows).astype(int)
+        block_cols = np.clip([col_start, col_stop], 0, cols).astype(int)
+        for row_from, row_to, col_from, col_to in zip(*block_rows, *block_cols):
+            if row_from < row_to and col_from < col_to:
+                blocks[
+                    row_from // block_size : math.ceil(row_to / block_size),
+                    col_from // block_size : math.ceil(col_to / block_size),
+                ] = True
+
+    # Fill the bounding boxes of connected changes until they do not overlap anymore
+    while True:
+        labels, _ = label(blocks)
+        filled = blocks.copy()
+        for box in find_objects(labels):
+            filled[box] = True
+        if (filled == blocks).all():
+            break
+        blocks = filled
+
+    windows = []
+    for box in find_objects(labels):
+        row = box[0].start * block_size
+        col = box[1].start * block_size
+        box_rows = min(box[0].stop * block_size, rows) - row
+        box_cols = min(box[1].stop * block_size, cols) - col
+        windows.extend(
+            (row + tile_row, col + tile_col, tile_rows, tile_cols)
+            for tile_row, tile_col, tile_rows, tile_cols in create_tiles(
+                (box_rows, box_cols), tile_size
+            )
+        )
+    return windows
+
+
+def update_fixed(
+    grid_options: dict,
+    windows: List[Window],
+    excludes: List[dict],
+    output: str,
+    region_source: str,
+    where: str = None,
+    workers: int = None,
+) -> int:
+    """
+    Recomputes windows of the result of the fixed excludes in parallel, see tiled_exclusion.process_tile.
+
+    :return: Change of the number of available pixels
+    """
+    buffers = [exclude.get("buffer") or 0 for exclude in excludes]
+    halo = int(math.ceil(max(buffers, default=0) / grid_options["pixel_size"])) + 1
+    change = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                process_tile,
+                grid_options,
+                window,
+                excludes,
+                halo,
+                region_source,
+                where,
+            )
+            for window in windows
+        ]
+        for future in as_completed(futures):
+            (row, col, _, _), data, available_pixels, _ = future.result()
+            change += available_pixels - update_window(
+                output, data == 100, data != 255, row, col
+            )
+            print(f"Updated fixed excludes at row {row}, column {col}")
+    return change
+
+
+def scenario_window(
+    grid: Grid,
+    window: Window,
+    initial_result_path: str,
+    residential_areas: List[dict],
+    max_distance: float,
+    exclusion_sets: Dict[str, List[dict]],
+):
+    """
+    Computes the inputs of all scenarios within a window, like the sweep does for the whole grid.
+
+    :return: Tuple of the availability of the fixed excludes, the pixels within the region, the distance to the
+        residential areas and a dict of exclusion set name -> boolean matrix that is True wherever the set allows turbines
+    """
+    row, col, rows, cols = window
+    data = (
+        gdal.Open(initial_result_path)
+        .GetRasterBand(1)
+        .ReadAsArray(col, row, cols, rows)
+    )
+    valid = data != 255
+    available = (data > 50) & valid
+    distance = distance_raster(
+        subgrid(grid, row, col, rows, cols), residential_areas, max_distance
+    )
+    allowed = {}
+    for name, excludes in exclusion_sets.items():
+        buffers = [exclude.get("buffer") or 0 for exclude in excludes]
+        halo = int(math.ceil(max(buffers, default=0) / grid.pixelWidth)) + 1
+        haloed = subgrid(grid, row - halo, col - halo, rows + 2 * halo, cols + 2 * halo)
+        allowed[name] = np.ones((rows, cols), dtype=bool)
+        for _, mask in plan_constraint_masks(haloed, excludes):
+            allowed[name] &= ~mask[halo : halo + rows, halo : halo + cols]
+    return available, valid, distance, allowed
+
+
+def update_scenarios(
+    grid: Grid,
+    windows: List[Window],
+    initial_result_path: str,
+    output_pattern: str,
+    buffers,
+    scenarios: list,
+    exclusion_sets: Dict[str, List[dict]],
+    residential_areas: List[dict],
+) -> Dict[Tuple[float, str], int]:
+    """
+    Recomputes windows of all scenario rasters. The residential buffers are applied via a distance raster, see
+    residential_distance.py.
+
+    :param grid: Grid of the results
+    :param windows: Disjoint windows as returned by affected_windows
+    :param initial_result_path: Path of the result of the fixed excludes, already updated
+    :param output_pattern: Format string of the paths of the scenario rasters with the fields buffer and scenario
+    :param buffers: Distances to residential buildings
+    :param scenarios: List of (scenario name, exclusion set names) as in main.py
+    :param exclusion_sets: Dict of exclusion set name -> list of constraint dicts
+    :param residential_areas: Constraint dicts of the residential areas
+    :return: Dict of (buffer, scenario name) -> change of the number of available pixels
+    """
+    changes = {}
+    for row, col, rows, cols in windows:
+        print(f"Updating scenarios at row {row}, column {col}")
+        available, valid, distance, allowed = scenario_window(
+            grid,
+            (row, col, rows, cols),
+            initial_result_path,
+            residential_areas,
+            max(buffers),
+            exclusion_sets,
+        )
+        for buffer in buffers:
+            unrestricted = available & (distance > buffer)
+            for name, scenario_exclusion_sets in scenarios:
+                scenario_available = unrestricted.copy()
+                for set_name in scenario_exclusion_sets:
+                    scenario_available &= allowed[set_name]
+                previous = update_window(
+                    output_pattern.format(buffer=buffer, scenario=name),
+                    scenario_available,
+                    valid,
+                    row,
+                    col,
+                )
+                changes[(buffer, name)] = (
+                    changes.get((buffer, name), 0)
+                    + np.count_nonzero(scenario_available)
+                    - previous
+                )
+    return changes
+
+
+def region_pixels(path: str, block_rows: int = 4096) -> int:
+    """Counts the pixels within the region of a result in the format of ExclusionCalculator.save."""
+    band = gdal.Open(path).GetRasterBand(1)
+    pixels = 0
+    for row in range(0, band.YSize, block_rows):
+        rows = min(block_rows, band.YSize - row)
+        pixels += np.count_nonzero(band.ReadAsArray(0, row, band.XSize, rows) != 255)
+    return pixels
+
+
+def update_results(
+    results_path: str, changes: Dict[Tuple[float, str], int], pixels: int
+):
+    """Adds the changes of the available pixels to the percentages of the results CSV written by main.run_sweep."""
+    result_df = pd.read_csv(results_path, index_col=0)
+    for (buffer, name), change in changes.items():
+        result_df.at[buffer, name] += 100 * change / pixels
+    result_df.to_csv(results_path)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from main import run_incremental_update, save_snapshots
+
+    parser = argparse.ArgumentParser(
+        description="Updates the results for changed sources"
+    )
+    parser.add_argument(
+        "sources", nargs="*", help="Changed sources, by default all changed files"
+    )
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="Only record the snapshots of all sources, e.g. after running pipeline.py",
+    )
+    arguments = parser.parse_args()
+    if arguments.snapshot:
+        save_snapshots()
+    else:
+        run_incremental_update(arguments.sources)
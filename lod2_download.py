@@ -0,0 +1,211 @@
+# Concurrent, resumable downloader for files listed in a metalink, e.g. the LoD2 CityGML tiles of Bavaria, see
+# buildings-data-acquisition.py
+# Files are downloaded to a .part file, resumed via HTTP Range requests after interruptions, verified against the hashes
+# given in the metalink and only then moved to their final path.
+import hashlib
+import os
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+metalink_namespace = {"": "urn:ietf:params:xml:ns:metalink"}
+
+
+class MetalinkFile(NamedTuple):
+    name: str
+    urls: List[str]
+    # Expected size in bytes, None if unknown
+    size: int
+    # Dict of hashlib algorithm name -> expected hex digest, e.g. {"sha256": "..."}
+    hashes: Dict[str, str]
+
+
+def parse_metalink(xml_string: str) -> List[MetalinkFile]:
+    # Parse the XML file
+    root = ET.fromstring(xml_string)
+
+    # List to store the result tuples
+    result = []
+
+    # Iterate over all 'file' elements in the XML
+    for file_element in root.findall("file", metalink_namespace):
+        size_element = file_element.find("size", metalink_namespace)
+        hashes = {}
+        for hash_element in file_element.findall("hash", metalink_namespace):
+            # Metalink uses IANA names like sha-256, hashlib uses sha256
+            algorithm = hash_element.get("type").replace("-", "").lower()
+            if algorithm in hashlib.algorithms_available:
+                hashes[algorithm] = hash_element.text.strip().lower()
+        result.append(
+            MetalinkFile(
+                name=file_element.get("name"),
+                urls=[
+                    url.text.strip()
+                    for url in file_element.findall("url", metalink_namespace)
+                ],
+                size=int(size_element.text) if size_element is not None else None,
+                hashes=hashes,
+            )
+        )
+
+    return result
+
+
+def create_session(pool_size: int = 8) -> requests.Session:
+    """Creates a session whose connection pool can serve pool_size concurrent downloads."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def verify_file(path: str, file: MetalinkFile) -> bool:
+    """Checks the size and the strongest available hash of a downloaded file against the metalink."""
+    if file.size is not None and os.path.getsize(path) != file.size:
+        return False
+    if not file.hashes:
+        return True
+    algorithm = next(
+        (
+            name
+            for name in ("sha512", "sha384", "sha256", "sha1", "md5")
+            if name in file.hashes
+        ),
+        next(iter(file.hashes)),
+    )
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(2**20), b""):
+            digest.update(block)
+    return digest.hexdigest() == file.hashes[algorithm]
+
+
+def download_file(
+    session: requests.Session,
+    file: MetalinkFile,
+    download_dir: str,
+    retries: int = 5,
+    backoff: float = 1.0,
+    timeout: float = 60,
+) -> str:
+    """
+    Downloads a single file of a metalink, resuming a partial download if there is one.
+
+    :param session: Session to download with
+    :param file: File as returned by parse_metalink
+    :param download_dir: The directory where the file will be saved
+    :param retries: Number of retries after a failed attempt, alternating between the mirrors of the file
+    :param backoff: Seconds to wait before the first retry, doubled for every further retry
+    :param timeout: Timeout of the requests in seconds
+    :return: Path of the downloaded and verified file
+    """
+    file_path = os.path.join(download_dir, file.name)
+    partial_path = f"{file_path}.part"
+
+    # If the file already exists, skip downloading it
+    if os.path.exists(file_path) and verify_file(file_path, file):
+        print(f"Skip downloading: {file_path}")
+        return file_path
+
+    for attempt in range(retries + 1):
+        url = file.urls[attempt % len(file.urls)]
+        try:
+            offset = (
+                os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+            )
+            if file.size is not None and offset > file.size:
+                os.remove(partial_path)
+                offset = 0
+            if offset and offset == file.size:
+                # The previous attempt was interrupted after receiving all bytes
+                response = None
+            else:
+                headers = {"Range": f"bytes={offset}-"} if offset else {}
+                response = session.get(
+                    url, headers=headers, stream=True, timeout=timeout
+                )
+
+            if response is not None and response.status_code == 416:
+                # The partial file may already hold all bytes if the size is not given in the metalink, servers
+                # usually send the total size as Content-Range "bytes */<size>"
+                with response:
+                    total = response.headers.get("Content-Range", "").rpartition("/")[2]
+                if not os.path.exists(partial_path):
+                    # Removed in the meantime, e.g. by cleaning the download directory
+                    raise ValueError(f"Partial download of {file.name} is missing")
+                if total.isdigit() and int(total) != offset:
+                    os.remove(partial_path)
+                    raise ValueError(
+                        f"Partial download of {file.name} has {offset} of {total} bytes"
+                    )
+            elif response is not None:
+                with response:
+                    response.raise_for_status()
+                    resumed = response.status_code == 206 and response.headers.get(
+                        "Content-Range", ""
+                    ).startswith(f"bytes {offset}-")
+                    # Servers without support for Range requests send the whole file
+                    with open(partial_path, "ab" if resumed else "wb") as partial:
+                        for block in response.iter_content(chunk_size=2**20):
+                            partial.write(block)
+
+            if not verify_file(partial_path, file):
+                os.remove(partial_path)
+                raise ValueError(f"Verification of {file.name} failed")
+
+            # Move the file to its final path atomically, so incomplete files never appear there
+            os.replace(partial_path, file_path)
+            print(f"Successfully downloaded: {file.name}")
+            return file_path
+
+        # OSError covers a partial file removed while downloading
+        except (requests.exceptions.RequestException, ValueError, OSError) as e:
+            if attempt == retries:
+                raise
+            wait = backoff * 2**attempt
+            print(
+                f"Failed to download {file.name} from {url}, retrying in {wait}s. Error: {e}"
+            )
+            time.sleep(wait)
+
+
+def download_files(
+    files: List[MetalinkFile],
+    download_dir: str,
+    workers: int = 8,
+    session: requests.Session = None,
+    **kwargs,
+) -> Tuple[Dict[str, str], Dict[str, Exception]]:
+    """
+    Downloads files of a metalink concurrently, see download_file.
+
+    :param files: Files as returned by parse_metalink
+    :param download_dir: The directory where files will be saved
+    :param workers: Maximum number of concurrent downloads
+    :param session: Session to download with, a pooled session is created if None
+    :param kwargs: Further arguments of download_file
+    :return: Dict of file name -> path of the successful downloads and dict of file name -> error of the failed ones
+    """
+    os.makedirs(download_dir, exist_ok=True)
+    session = session or create_session(workers)
+
+    def download(file):
+        try:
+            return file.name, download_file(session, file, download_dir, **kwargs), None
+        except Exception as e:
+            print(f"Failed to download {file.name}. Error: {e}")
+            return file.name, None, e
+
+    downloaded, failed = {}, {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for name, path, error in executor.map(download, files):
+            if error is None:
+                downloaded[name] = path
+            else:
+                failed[name] = error
+    return downloaded, failed
@@ -1,366 +1,488 @@
+import math
+import os
+import shutil
+from contextlib import nullcontext
+
 import pandas as pd
 from glaes import ExclusionCalculator
 
-base_path = "./input"
-hub_height = 120
-diameter = 155
-radius = diameter / 2
-height = hub_height + radius
-
-raster_size = 10
-
-social_political_constraints = [
-    {
-        # Buildings health treatment
-        "source": f"{base_path}/Gebäude/health.shp",
-        "buffer": 3 * height,
-    },
-    {
-        # Airports
-        "source": f"{base_path}/Basis-DLM/ver04_f.shp",
-        "where": "ART in ('5510','5511','5512') OR NTZ in ('2000','3000') AND ZUS IS NULL",
-        "buffer": 6000,
-    },
-    {
-        # Airfields
-        "source": f"{base_path}/Basis-DLM/ver04_f.shp",
-        "where": "ART in ('5520', '5540', '5550') AND (ZUS IS NULL or ZUS = 'None')",
-        "buffer": 1750,
-    },
-    {
-        # Camping
-        "source": f"{base_path}/Basis-DLM/sie02_f.shp",
-        "where": "FKT = '4330'",
-        "buffer": 3 * height,
-    },
-    {
-        # Cemetery
-        "source": f"{base_path}/Basis-DLM/sie02_f.shp",
-        "where": "OBJART = '41009'",
-    },
-    {
-        # Industrial/Commercial
-        "source": f"{base_path}/Basis-DLM/sie02_f.shp",
-        "where": "OBJART ='41002'",
-        "buffer": 2 * height,
-    },
-    {
-        # Military
-        "source": f"{base_path}/Basis-DLM/geb03_f.shp",
-        "where": "ADF = '4720'",
-    },
-    {
-        # Mineral extraction
-        "source": f"{base_path}/Basis-DLM/sie02_f.shp",
-        "where": "OBJART ='41005' OR OBJART ='41004'",
-    },
-    {
-        # Motorways 1
-        "source": f"{base_path}/Basis-DLM/ver01_l.shp",
-        "where": "WDM = '1301'",
-        "buffer": 40 + radius,
-    },
-    {
-        # Motorways 2
-        "source": f"{base_path}/Basis-DLM/ver01_f.shp",
-        "where": "OBJART_TXT = 'AX_Platz' and FKT != '5310'",
-        "buffer": 40 + radius,
-    },
-    {
-        # Outer areas
-        "source": f"{base_path}/Basis-DLM/sie02_f.shp",
-        "where": "OBJART = '41001' OR (OBJART='41007' AND FKT in ('1110', '1120', '1130', '1150', '1160', '1170'))",
-        "buffer": 3 * height,
-    },
-    {
-        # Power lines
-        "source": f"{base_path}/Basis-DLM/sie03_l.shp",
-        "where": "OBJART_TXT = 'AX_Leitung'",
-        "buffer": 2 * radius,
-    },
-    {
-        # Primary roads
-        "source": f"{base_path}/Basis-DLM/ver01_l.shp",
-        "where": "WDM = '1303'",
-        "buffer": 20 + radius,
-    },
-    {
-        # Railways 1
-        "source": f"{base_path}/Basis-DLM/ver03_l.shp",
-        "where": "OBJART_TXT = 'AX_Bahnstrecke'",
-        "buffer": 2 * radius,
-    },
-    {
-        # Railways 2
-        "source": f"{base_path}/Basis-DLM/ver03_f.shp",
-        "buffer": 2 * radius,
-    },
-    {
-        # Railways 3
-        "source": f"{base_path}/Basis-DLM/ver06_f.shp",
-        "where": "OBJART_TXT ='AX_Bahnverkehrsanlage'",
-        "buffer": 2 * radius,
-    },
-    {
-        # Recreational
-        "source": f"{base_path}/Basis-DLM/sie02_f.shp",
-        "where": "OBJART = '41008'",
-    },
-    {
-        # Regional roads
-        "source": f"{base_path}/Basis-DLM/ver01_l.shp",
-        "where": "WDM != '1301' AND WDM != '1303' AND WDM != '1305'",
-        "buffer": radius,
-    },
-    {
-        # Secondary roads
-        "source": f"{base_path}/Basis-DLM/ver01_l.shp",
-        "where": "WDM = '1305'",
-        "buffer": radius,
-    },
-    {
-        # DVOR
-        # Acquired from OSM (see osm-data-acquisition.py)
-        "source": f"{base_path}/DVOR/DVOR.shp",
-        "buffer": 7000,
-    },
-    {
-        # VOR
-        # Acquired from OSM (see osm-data-acquisition.py)
-        "source": f"{base_path}/DVOR/VOR.shp",
-        "buffer": 15000,
-    },
-    {
-        # Historical
-        # Acquired from OSM (see geofabrik-preprocessing.py)
-        "source": f"{base_path}/OSM/gis_osm_pois_a_free_1.shp",
-    },
-    {
-        # Borders
-        # Preprocessed with QGIS: Vector > Geometry Tools > Polygons to Lines
-        "source": f"{base_path}/Grenzen/VG250_STA.shp",
-        "buffer": 100,
-    },
-]
+from catalog import load_catalog
+from constraint_planner import plan_constraint_masks
+from exclusion_utils import (
+    availability_mask,
+    exclude_mask,
+    exclusion_counts,
+    save_availability,
+)
+from incremental_update import (
+    affected_windows,
+    changed_bounds,
+    changed_sources,
+    region_pixels,
+    save_snapshot,
+    update_fixed,
+    update_results,
+    update_scenarios,
+)
+from source_preparation import prepare_sources
+from tiled_exclusion import Grid, region_extent, run_tiled
+from zonal_statistics import save_statistics, zonal_statistics
+from mask_cache import MaskCache
+from patch_statistics import patch_statistics_of_results
+from profiling import Timeline
+from sweep_executor import (
+    create_sweep_tasks,
+    init_worker,
+    prepare_working_directory,
+    run_tasks,
+)
 
+# Turbine, region, constraint sets, scenarios and buffers to evaluate are defined in the catalog, see catalog.py
+catalog_path = "./catalog.json"
+catalog = load_catalog(catalog_path)
 
-physical_constraints = [
-    {
-        # Lakes
-        # Use gew01_f instead of ver04_f as suggested in the supplementary material
-        "source": f"{base_path}/Basis-DLM/gew01_f.shp",
-        "where": "OBJART_TXT='AX_Hafenbecken' OR OBJART_TXT='AX_StehendesGewaesser'",
-        "buffer": 50,
-    },
-    {
-        # Rivers
-        "source": f"{base_path}/Basis-DLM/gew01_f.shp",
-        "where": "OBJART_TXT='AX_Fliessgewaesser' OR OBJART_TXT='AX_Kanal' OR OBJART_TXT='AX_Wasserlauf' OR OBJART_TXT='AX_Gewaesserachse'",
-        "buffer": 50,
-    },
-    {
-        # Stream
-        # Acquired from OSM (see geofabrik-preprocessing.py)
-        "source": f"{base_path}/OSM/gis_osm_waterways_free_1.shp",
-    },
-    {
-        # EU-DEM Slope
-        # Preprocessed with QGIS: Crop raster to extent of Bavaria, calculate slope
-        "source": f"{base_path}/EU-DEM/EU-DEM-Slope-BY.tif",
-        "value": "(17-]",
-    },
-]
+base_path = catalog["base_path"]
+hub_height = catalog["turbine"]["hub_height"]
+diameter = catalog["turbine"]["diameter"]
+radius = catalog["turbine"]["radius"]
+height = catalog["turbine"]["height"]
 
+raster_size = catalog["raster_size"]
 
-conservation_constraints = [
-    {
-        # National park
-        "source": f"{base_path}/nlp_epsg25832_shp/nlp_epsg25832_shp.shp",
-    },
-    {
-        # Nature reserve (NSG)
-        "source": f"{base_path}/nsg_epsg25832_shp/nsg_epsg25832_shp.shp",
-    },
-    {
-        # Birds protected areas (SPA)
-        "source": f"{base_path}/vogelschutz_epsg25832_shp/vogelschutz_epsg25832_shp.shp",
-        "buffer": 10 * height,
-    },
-    {
-        # Alpenplan
-        "source": f"{base_path}/Alpenplan/Alpenplan.shp",
-        "where": "zone = 'C'",
-    },
-    {
-        # Water protection
-        "source": f"{base_path}/Wasserschutz/Wasserschutz.shp",
-        "buffer": 50,
-    },
-    {
-        # Biosphere (core zones)
-        # Acquired from https://geodienste.bfn.de/ogc/wfs/schutzgebiet
-        "source": f"{base_path}/Biosphäre/Kernzone.shp",
-    },
-]
+# Distances to residential buildings to evaluate
+variable_exclude_buffers = catalog["variable_exclude_buffers"]
+# How the distance to residential buildings is applied in the unrestricted_forest_use scenario:
+# "distance_raster" rasterizes the residential areas once, calculates a distance raster and thresholds it for every
+# buffer, "vector" excludes the buffered residential areas with GLAES for every buffer
+residential_buffer_mode = "distance_raster"
 
+# Number of worker processes of the scenario/buffer sweep
+sweep_workers = os.cpu_count()
+# Upper limit for the estimated memory usage of all running sweep tasks in bytes, None for no limit
+sweep_memory_budget = None
 
-technical_economic_constraints = [
-    {
-        # Wind speeds
-        # Preprocessed with QGIS (export to GeoTIFF) and windspeed-preprocessing.py (create a mask of zeros, indicating
-        # areas below the wind speed threshold)
-        "source": f"{base_path}/Windgeschwindigkeit/windspeed_120_4.5m.tif",
-        "value": 0,
-    },
-]
+# Rasterized exclusion masks are cached on disk, so only changed constraints are rasterized again. Set to None to
+# disable caching
+mask_cache_options = {"directory": "./cache/masks", "max_bytes": 50 * 2**30}
 
-forest_functions = [
-    "Bodenschutzwald",
-    "Erholungswald",
-    "Lawinenschutzwald",
-    "regionaler_Klimaschutzwald",
-    "Schutzwald_fuer_Immissionen_Laerm_und_lokales_Klima",
-    "Schutzwald_fuer_Lebensraum_Landschaftsbild_Genressourcen_und_historisch_wertvollen_Waldbestand",
-    "Sichtschutzwald",
-]
+# Apply the fixed excludes tile by tile in parallel, which bounds the peak memory of this phase by the tile size instead
+# of the size of the region, e.g. for raster sizes below 10 m. The sweep over the scenarios and buffers still works on
+# the full grid
+tiled_exclusion = False
+# Number of rows and columns of each tile and number of worker processes of the tiled exclusion
+tile_size = 4096
+tile_workers = os.cpu_count()
 
-protected_forests = [
-    {"source": f"{base_path}/Schutzwald/{function}.shp"}
-    for function in forest_functions
-]
-all_forests = [
-    {
-        # Forest
-        "source": f"{base_path}/Basis-DLM/veg02_f.shp"
-    }
-]
-residential_areas = [
-    {
-        # Buildings residential
-        "source": f"{base_path}/Gebäude/residential.shp",
-        # Custom flag to indicate that a buffer should be added / updated later on
-        "update_buffer": True,
-    },
-    {
-        # Inner areas
-        "source": f"{base_path}/Basis-DLM/sie01_f.shp",
-        # Custom flag to indicate that a buffer should be added / updated later on
-        "update_buffer": True,
-    },
-]
+# Vector sources are clipped to the region (padded by their buffers), transformed to its spatial reference system and
+# simplified before they are rasterized, see source_preparation.py. The tolerance of the simplification is a fraction
+# of the pixel size. Set to None to rasterize the sources as they are
+source_preparation_options = {
+    "directory": "./cache/sources",
+    "tolerance": raster_size / 10,
+}
 
-# The order of scenarios matters: For performance reasons, the unrestricted_forest_use scenario is calculated first and
-# forms the basis for all other scenarios. All other scenarios load the results from unrestricted_forest_use and only
-# exclude further constrained areas.
-scenarios = [
-    (
-        # In the unrestricted forest use scenario, only residential buildings are excluded implicitly
-        "unrestricted_forest_use",
-        None,
-    ),
-    (
-        # In the restricted forest use scenario, additionally protected forests have to be excluded
-        "restricted_forest_use",
-        protected_forests,
-    ),
-    (
-        # In the no_forest_use scenario, protected forests and all forests have to be excluded
-        "no_forest_use",
-        [*protected_forests, *all_forests],
-    ),
-    (
-        # In the unrestricted forest use scenario, technical economic constraints are excluded
-        "unrestricted_forest_use_economic",
-        technical_economic_constraints,
-    ),
-    (
-        # In the restricted forest use scenario, technical economic constraints and protected forests have to be excluded
-        "restricted_forest_use_economic",
-        [*protected_forests, *technical_economic_constraints],
-    ),
-    (
-        # In the no_forest_use scenario, technical economic constraints, protected forests and all forests have to be excluded
-        "no_forest_use_economic",
-        [*protected_forests, *all_forests, *technical_economic_constraints],
-    ),
+# Timelines of the wall time, CPU time, memory increase, features read and newly excluded pixels of every constraint and
+# sweep task are written to this path (as .json and .csv) for each phase. Set to None to disable profiling
+timeline_path = "./output/ByWind_timeline_{phase}"
+
+# Results are written as cloud-optimized GeoTIFFs with overviews, see cog.py. The scenario rasters of the sweep are
+# packed to 1 bit per pixel ("bit") or stored like the result of the fixed excludes ("uint8", 100 available, 0
+# excluded), which remains uint8 as it is the initialValue of the sweep
+scenario_packing = "bit"
+
+# Eligible area per administrative unit of the region's source (VerwaltungsEinheit.shp) for every result raster, see
+# zonal_statistics.py. Each level maps to a where clause selecting its units. Set to None to disable the statistics
+zonal_levels = {"district": "art = 'Landkreis'", "municipality": "art = 'Gemeinde'"}
+# Written as Parquet instead if the path ends with .parquet
+zonal_statistics_path = "./output/ByWind_zonal_statistics.csv"
+zonal_workers = os.cpu_count()
+
+# Turbine types compared by turbine_sweep.py. Parameters not given are taken from the catalog, derived parameters like
+# radius and height are evaluated for every turbine. The distance rasters of the constraints whose buffers depend on the
+# turbine are stored in turbine_field_directory and reused as long as their sources do not change
+turbine_specs = [
+    {"name": "120_155", "hub_height": 120, "diameter": 155},
+    {"name": "140_160", "hub_height": 140, "diameter": 160},
+    {"name": "160_170", "hub_height": 160, "diameter": 170},
 ]
+turbine_field_directory = "./cache/distances"
 
-if __name__ == "__main__":
-    # First run with fixed excludes
-    print(f"Running ExclusionCalculator with fixed excludes")
-    ec = ExclusionCalculator(
-        f"{base_path}/ALKIS-Vereinfacht/VerwaltungsEinheit.shp",
-        srs=25832,
-        pixelRes=raster_size,
-        where="art = 'Bundesland'",
+# Polygons of the patches of available pixels of every result raster are written next to it as a GeoPackage and their
+# statistics to patch_statistics_path (Parquet if the path ends with .parquet), see patch_statistics.py. Patches smaller
+# than the area swept by the rotor are dropped. The number of turbines per patch is estimated from a spacing of 5 x 3
+# rotor diameters, so smaller patches fit no turbine, and the capacity from the rated power of a turbine in MW. Set
+# patch_statistics_path to None to disable
+patch_statistics_path = "./output/ByWind_patch_statistics.csv"
+patch_min_area = math.pi * radius**2
+patch_turbine_area = 5 * diameter * 3 * diameter
+patch_turbine_power = 6.0
+patch_workers = os.cpu_count()
+
+# The features of all sources are recorded in this directory after a full run, so incremental_update.py can recompute
+# only the windows around changed features when sources are updated. Set to None to disable the snapshots
+snapshot_directory = "./cache/snapshots"
+
+region_source = catalog["region_source"]
+region_options = catalog["region_options"]
+
+
+def create_exclusion_calculator(initial_value=True):
+    """Creates an ExclusionCalculator for Bavaria, optionally initialized with a previous result."""
+    return ExclusionCalculator(
+        region_source, initialValue=initial_value, **region_options
     )
-    for exclude in [
-        *social_political_constraints,
-        *physical_constraints,
-        *conservation_constraints,
-    ]:
+
+
+def exclude_masks(ec, excludes, timeline: Timeline = None, prepare: bool = True):
+    """
+    Excludes constraint dicts from an ExclusionCalculator via their masks, see plan_constraint_masks.
+
+    :param ec: The ExclusionCalculator to exclude from
+    :param excludes: Constraint dicts as defined in the catalog
+    :param timeline: Optional Timeline recording every step, including the pixels each constraint excludes
+    :param prepare: Whether to prepare the sources first, False if the excludes were prepared already
+    """
+    # Constraints using the same source are grouped, so every source is read only once
+    if prepare:
+        with timeline.step("prepare sources") if timeline else nullcontext():
+            excludes = prepare_excludes(ec.region, excludes)
+    for exclude, mask in plan_constraint_masks(
+        ec.region, excludes, create_mask_cache(), timeline
+    ):
         print(f"Excluding {exclude}")
-        if "source" in exclude and exclude["source"].endswith(".shp"):
-            ec.excludeVectorType(**exclude)
-        elif "source" in exclude and exclude["source"].endswith(".tif"):
-            ec.excludeRasterType(**exclude)
-        else:
-            print(f"Unknown exclude type ignored: {exclude.source}")
-
-    print(ec.percentAvailable)
-    initial_result_path = f"./output/ByWind_{raster_size}.tif"
-    ec.save(initial_result_path)
-
-    variable_exclude_buffers = range(0, 2100, 100)
+        if timeline is None:
+            exclude_mask(ec, mask)
+            continue
+        with timeline.step(
+            "exclude", constraint=exclude.get("name"), source=exclude["source"]
+        ):
+            newly_excluded, already_excluded = exclusion_counts(ec, mask)
+            timeline.add(
+                newly_excluded=newly_excluded, already_excluded=already_excluded
+            )
+            exclude_mask(ec, mask)
+
+
+def prepare_excludes(region, excludes, padding: float = 0):
+    """
+    Replaces the vector sources of constraint dicts by their prepared versions if source preparation is enabled.
+
+    :param region: geokit RegionMask or tiled_exclusion.Grid the sources are prepared for
+    :param excludes: Constraint dicts as defined in the catalog
+    :param padding: Minimum distance around the region to keep features in, see prepare_source
+    """
+    if not source_preparation_options:
+        return excludes
+    return prepare_sources(
+        region, excludes, padding=padding, **source_preparation_options
+    )
+
+
+def create_timeline():
+    """Creates a Timeline if profiling is enabled via timeline_path, None otherwise."""
+    return Timeline() if timeline_path else None
+
+
+def save_timeline(timeline: Timeline, phase: str):
+    if timeline is not None:
+        timeline.save(timeline_path.format(phase=phase))
+
+
+def create_mask_cache():
+    """Creates the MaskCache configured by mask_cache_options or returns None if caching is disabled."""
+    return MaskCache(**mask_cache_options) if mask_cache_options else None
+
+
+constraint_sets = catalog["constraint_sets"]
+social_political_constraints = constraint_sets["social_political"]
+physical_constraints = constraint_sets["physical"]
+conservation_constraints = constraint_sets["conservation"]
+technical_economic_constraints = constraint_sets["technical_economic"]
+protected_forests = constraint_sets["protected_forests"]
+all_forests = constraint_sets["all_forests"]
+residential_areas = constraint_sets["residential_areas"]
+
+# Sets excluded in the first run for all scenarios
+fixed_excludes = [
+    exclude
+    for name in catalog["fixed_constraint_sets"]
+    for exclude in constraint_sets[name]
+]
+
+# The unrestricted_forest_use scenario is calculated first for every buffer and forms the basis for all other
+# scenarios. All other scenarios only exclude the masks of further exclusion sets from the unrestricted_forest_use
+# result.
+scenarios = catalog["scenarios"]
+
+# Sets of additional exclusions the scenarios are composed of. Each set is rasterized only once into a mask on the
+# shared grid, see scenario_masks.py
+scenario_exclusion_sets = {
+    name: constraint_sets[name]
+    for _, exclusion_sets in scenarios
+    for name in exclusion_sets
+}
+
+initial_result_path = f"./output/ByWind_{raster_size}.tif"
+scenario_output_pattern = f"./output/ByWind_{raster_size}_{{buffer}}_{{scenario}}.tif"
+results_path = "./output/ByWind_results.csv"
+zonal_label_pattern = f"./output/ByWind_{raster_size}_labels_{{level}}.tif"
+turbine_results_path = "./output/ByWind_turbine_results.csv"
+
+
+def run_fixed_exclusions():
+    """Applies the fixed excludes to the region and saves the result to initial_result_path."""
+    timeline = create_timeline()
+    if tiled_exclusion:
+        print(f"Running tiled exclusion with fixed excludes")
+        # Tiles are processed in worker processes, so only the whole run is measured
+        with timeline.step("tiled exclusion") if timeline else nullcontext():
+            grid = Grid(
+                region_extent(
+                    region_source,
+                    region_options["srs"],
+                    raster_size,
+                    region_options["where"],
+                ),
+                raster_size,
+                region_options["srs"],
+            )
+            print(
+                run_tiled(
+                    region_source,
+                    prepare_excludes(grid, fixed_excludes),
+                    initial_result_path,
+                    tile_size=tile_size,
+                    workers=tile_workers,
+                    **region_options,
+                )
+            )
+    else:
+        print(f"Running ExclusionCalculator with fixed excludes")
+        ec = create_exclusion_calculator()
+        exclude_masks(ec, fixed_excludes, timeline)
+        print(ec.percentAvailable)
+        save_availability(ec.region, availability_mask(ec), initial_result_path)
+    save_timeline(timeline, "fixed")
+
+
+def run_sweep():
+    """
+    Runs all scenarios for all buffers based on the result of run_fixed_exclusions and writes the scenario rasters and
+    the results CSV.
+    """
+    ec = create_exclusion_calculator(initial_result_path)
+
+    # Share the region and the fixed excludes with the worker processes of the sweep
+    working_directory = "./output/intermediate"
+    prepare_working_directory(ec, working_directory)
+    # The shared files are removed even if a task fails
+    try:
+        worker_options = {**region_options, "extent": ec.region.extent.xyXY}
+        pixels = ec.region.mask.size
+        exclusion_sets = {
+            name: prepare_excludes(ec.region, excludes)
+            for name, excludes in scenario_exclusion_sets.items()
+        }
+        residential_excludes = prepare_excludes(
+            ec.region, residential_areas, padding=max(variable_exclude_buffers)
+        )
+        del ec
+
+        # Run all scenarios for all buffers in parallel, the unrestricted_forest_use scenario of each buffer forms the
+        # basis for all other scenarios of that buffer
+        tasks = create_sweep_tasks(
+            pixels,
+            variable_exclude_buffers,
+            scenarios,
+            exclusion_sets,
+            residential_excludes,
+            residential_buffer_mode,
+            region_source,
+            initial_result_path,
+            scenario_output_pattern,
+            mask_cache_options,
+            scenario_packing,
+        )
+        timeline = create_timeline()
+        results = run_tasks(
+            tasks,
+            workers=sweep_workers,
+            memory_budget=sweep_memory_budget,
+            initializer=init_worker,
+            initargs=(worker_options, working_directory),
+            timeline=timeline,
+        )
+    finally:
+        shutil.rmtree(working_directory)
+    save_timeline(timeline, "sweep")
+
+    # Results are only written by the main process
     result_df = pd.DataFrame(
         index=variable_exclude_buffers, columns=[name for name, _ in scenarios]
     )
-
-    for name, excludes in scenarios:
+    for name, _ in scenarios:
         for variable_buffer in variable_exclude_buffers:
-            print(
-                f"Running scenario {name} with distance to residential buildings of {variable_buffer}m"
+            result_df.at[variable_buffer, name] = results[(variable_buffer, name)]
+
+    result_df.to_csv(results_path)
+
+
+def result_rasters():
+    """Returns (scenario, buffer, path) of the result of the fixed excludes and of all scenario rasters."""
+    return [("fixed_excludes", None, initial_result_path)] + [
+        (name, buffer, scenario_output_pattern.format(buffer=buffer, scenario=name))
+        for buffer in variable_exclude_buffers
+        for name, _ in scenarios
+    ]
+
+
+def run_zonal_statistics():
+    """Calculates the eligible area per administrative unit of the result of the fixed excludes and all scenarios."""
+    save_statistics(
+        zonal_statistics(
+            result_rasters(),
+            region_source,
+            zonal_levels,
+            zonal_label_pattern,
+            workers=zonal_workers,
+        ),
+        zonal_statistics_path,
+    )
+
+
+def run_patch_statistics():
+    """Writes the patches of the result of the fixed excludes and all scenarios as polygons and their statistics."""
+    save_statistics(
+        patch_statistics_of_results(
+            [
+                (name, buffer, path, f"{os.path.splitext(path)[0]}_patches.gpkg")
+                for name, buffer, path in result_rasters()
+            ],
+            workers=patch_workers,
+            min_area=patch_min_area,
+            turbine_area=patch_turbine_area,
+            turbine_power=patch_turbine_power,
+            tile_size=tile_size,
+        ),
+        patch_statistics_path,
+    )
+
+
+def snapshot_sources():
+    """Returns the paths of all sources of the fixed excludes and the sweep."""
+    excludes = [
+        *fixed_excludes,
+        *residential_areas,
+        *[
+            exclude
+            for excludes in scenario_exclusion_sets.values()
+            for exclude in excludes
+        ],
+    ]
+    return sorted({exclude["source"] for exclude in excludes})
+
+
+def save_snapshots(sources=None):
+    """Records the features of the given sources, by default of all sources, see incremental_update.save_snapshot."""
+    for source in sources or snapshot_sources():
+        save_snapshot(source, snapshot_directory)
+
+
+def run_incremental_update(sources=None):
+    """
+    Updates the result of the fixed excludes, the scenario rasters and the results CSV for changed sources, see
+    incremental_update.py. The residential buffers are applied via a distance raster regardless of
+    residential_buffer_mode.
+
+    :param sources: Paths of the changed sources, by default all sources whose files changed since their snapshot
+    """
+    sources = sources or changed_sources(snapshot_sources(), snapshot_directory)
+    if not sources:
+        print("No source changed since the last snapshot")
+        return
+    timeline = create_timeline()
+    grid_options = {
+        "extent": region_extent(
+            region_source, region_options["srs"], raster_size, region_options["where"]
+        ),
+        "pixel_size": raster_size,
+        "srs": region_options["srs"],
+    }
+    grid = Grid(**grid_options)
+    with timeline.step("compare snapshots") if timeline else nullcontext():
+        bounds = {
+            source: changed_bounds(source, snapshot_directory, grid.srs)
+            for source in sources
+        }
+
+    # Changes of the fixed excludes affect all scenarios, changes of the residential areas affect all scenarios up to
+    # the largest buffer
+    scenario_excludes = [
+        exclude for excludes in scenario_exclusion_sets.values() for exclude in excludes
+    ]
+    residential_excludes = [
+        {**exclude, "buffer": max(variable_exclude_buffers)}
+        for exclude in residential_areas
+    ]
+    fixed_windows = affected_windows(grid, fixed_excludes, bounds, tile_size=tile_size)
+    scenario_windows = affected_windows(
+        grid,
+        [*fixed_excludes, *residential_excludes, *scenario_excludes],
+        bounds,
+        tile_size=tile_size,
+    )
+    pixels = region_pixels(initial_result_path)
+    print(
+        f"Updating {len(fixed_windows)} windows of the fixed excludes and {len(scenario_windows)} windows of the"
+        f" scenarios"
+    )
+
+    if fixed_windows:
+        with timeline.step("fixed excludes") if timeline else nullcontext():
+            change = update_fixed(
+                grid_options,
+                fixed_windows,
+                prepare_excludes(grid, fixed_excludes),
+                initial_result_path,
+                region_source,
+                region_options["where"],
+                workers=tile_workers,
             )
-            # Unrestricted forest use scenario is computed explicitly and at first for performance reasons
-            if name == "unrestricted_forest_use":
-                new_ec = ExclusionCalculator(
-                    f"{base_path}/ALKIS-Vereinfacht/VerwaltungsEinheit.shp",
-                    srs=25832,
-                    pixelRes=raster_size,
-                    where="art = 'Bundesland'",
-                    initialValue=initial_result_path,
-                )
-                for residential_exclude in residential_areas:
-                    # Update buffer
-                    residential_exclude.update({"buffer": variable_buffer})
-                    print(f"Excluding {residential_exclude}")
-                    new_ec.excludeVectorType(**residential_exclude)
-                result_df.at[variable_buffer, name] = new_ec.percentAvailable
-                new_ec.save(
-                    f"./output/ByWind_{raster_size}_{variable_buffer}_{name}.tif"
-                )
+        print(f"Fixed excludes: {100 * change / pixels:+.4f} percentage points")
 
-            else:
-                # All scenarios are based on unrestricted forest use results and only exclude additional areas
-                unrestricted_forest_use_result_path = f"./output/ByWind_{raster_size}_{variable_buffer}_unrestricted_forest_use.tif"
-                new_ec = ExclusionCalculator(
-                    f"{base_path}/ALKIS-Vereinfacht/VerwaltungsEinheit.shp",
-                    srs=25832,
-                    pixelRes=raster_size,
-                    where="art = 'Bundesland'",
-                    initialValue=unrestricted_forest_use_result_path,
-                )
-                for exclude in excludes:
-                    print(f"Excluding {exclude}")
-                    if "source" in exclude and exclude["source"].endswith(".shp"):
-                        new_ec.excludeVectorType(**exclude)
-                    elif "source" in exclude and exclude["source"].endswith(".tif"):
-                        new_ec.excludeRasterType(**exclude)
-                    else:
-                        print(f"Unknown exclude type ignored: {exclude.source}")
-                result_df.at[variable_buffer, name] = new_ec.percentAvailable
-                new_ec.save(
-                    f"./output/ByWind_{raster_size}_{variable_buffer}_{name}.tif"
-                )
+    with timeline.step("scenarios") if timeline else nullcontext():
+        changes = update_scenarios(
+            grid,
+            scenario_windows,
+            initial_result_path,
+            scenario_output_pattern,
+            variable_exclude_buffers,
+            scenarios,
+            {
+                name: prepare_excludes(grid, excludes)
+                for name, excludes in scenario_exclusion_sets.items()
+            },
+            prepare_excludes(
+                grid, residential_areas, padding=max(variable_exclude_buffers)
+            ),
+        )
+    update_results(results_path, changes, pixels)
+    save_timeline(timeline, "incremental")
+    if zonal_levels:
+        run_zonal_statistics()
+    if patch_statistics_path:
+        run_patch_statistics()
+    save_snapshots(sources)
 
-    result_df.to_csv(f"./output/ByWind_results.csv")
+
+if __name__ == "__main__":
+    # First run with fixed excludes, then all scenarios and buffers based on its result. See pipeline.py to only rebuild
+    # the outputs whose inputs changed.
+    run_fixed_exclusions()
+    run_sweep()
+    if zonal_levels:
+        run_zonal_statistics()
+    if patch_statistics_path:
+        run_patch_statistics()
+    if snapshot_directory:
+        save_snapshots()
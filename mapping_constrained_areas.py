@@ -1,14 +1,31 @@
 import pandas as pd
-from glaes import ExclusionCalculator
 
+from constraint_attribution import (
+    attribution_bitmask,
+    attribution_statistics,
+    category_availability,
+    pattern_counts,
+    save_bitmask,
+)
+from exclusion_utils import save_availability
 from main import (
-    base_path,
     conservation_constraints,
+    create_exclusion_calculator,
+    create_mask_cache,
+    create_timeline,
     physical_constraints,
+    prepare_excludes,
     raster_size,
+    region_options,
+    region_source,
+    save_timeline,
     social_political_constraints,
     technical_economic_constraints,
+    tile_size,
+    tile_workers,
+    tiled_exclusion,
 )
+from tiled_exclusion import run_tiled
 
 all_constraint_sets = {
     "social_political": social_political_constraints,
@@ -21,24 +38,52 @@ result_df = pd.DataFrame(
     index=list(all_constraint_sets.keys()), columns=["constrained_area"]
 )
 
-
-for name, constraint_set in all_constraint_sets.items():
-    print(f"Calculating constrained area ({name})")
-    ec = ExclusionCalculator(
-        f"{base_path}/ALKIS-Vereinfacht/VerwaltungsEinheit.shp",
-        srs=25832,
-        pixelRes=raster_size,
-        where="art = 'Bundesland'",
+if tiled_exclusion:
+    # The tiled exclusion bounds the peak memory, but only yields the constrained area of every category
+    for name, constraint_set in all_constraint_sets.items():
+        print(f"Calculating constrained area ({name})")
+        percent_available = run_tiled(
+            region_source,
+            constraint_set,
+            f"./output/ByWind_{raster_size}_{name}.tif",
+            tile_size=tile_size,
+            workers=tile_workers,
+            **region_options,
+        )
+        result_df.at[name, "constrained_area"] = 100 - percent_available
+    result_df.to_csv(f"./output/ByWind_constrained_areas.csv")
+else:
+    # Every constraint is rasterized once into a bitmask recording which constraints exclude each pixel. Masks rasterized
+    # by a previous run of main.py (or of this script) are taken from the mask cache.
+    timeline = create_timeline()
+    region = create_exclusion_calculator().region
+    categories = {
+        name: prepare_excludes(region, constraint_set)
+        for name, constraint_set in all_constraint_sets.items()
+    }
+    constraints = [
+        constraint for category in categories.values() for constraint in category
+    ]
+    bits = attribution_bitmask(region, constraints, create_mask_cache(), timeline)
+    save_bitmask(
+        region, bits, f"./output/ByWind_{raster_size}_attribution.tif", constraints
     )
-    for constraint in constraint_set:
-        print(f"Excluding {constraint}")
-        if constraint["source"].endswith(".shp"):
-            ec.excludeVectorType(**constraint)
-        elif constraint["source"].endswith(".tif"):
-            ec.excludeRasterType(**constraint)
-        else:
-            print(f"Unknown exclude type ignored: {constraint['source']}")
-    ec.save(f"./output/ByWind_{raster_size}_{name}.tif")
-    result_df.at[name, "constrained_area"] = 100 - ec.percentAvailable
 
-result_df.to_csv(f"./output/ByWind_constrained_areas.csv")
+    for name, category in categories.items():
+        print(f"Mapping constrained area ({name})")
+        save_availability(
+            region,
+            category_availability(bits, constraints, category),
+            f"./output/ByWind_{raster_size}_{name}.tif",
+        )
+
+    category_df, overlap_df, constraint_df = attribution_statistics(
+        *pattern_counts(bits, region.mask), constraints, categories
+    )
+    result_df["constrained_area"] = category_df["constrained_area"]
+    # Share of the region excluded by this category only
+    result_df["sole_constrained_area"] = category_df["sole_constrained_area"]
+    result_df.to_csv(f"./output/ByWind_constrained_areas.csv")
+    overlap_df.to_csv(f"./output/ByWind_constrained_areas_overlap.csv")
+    constraint_df.to_csv(f"./output/ByWind_constrained_areas_by_constraint.csv")
+    save_timeline(timeline, "constrained_areas")
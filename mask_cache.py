@@ -0,0 +1,150 @@
+# Persistent cache of rasterized exclusion masks, shared by main.py and mapping_constrained_areas.py
+# Each entry is the mask of a single constraint dict on a specific grid, stored as a compressed 1-bit GeoTIFF aligned to
+# that grid. Entries are evicted in least recently used order once the cache exceeds its maximum size on disk.
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+from osgeo import gdal
+
+from exclusion_utils import indicate
+
+gdal.UseExceptions()
+
+
+def source_signature(source: str, hash_contents: bool = False) -> list:
+    """
+    Identifies the current version of a source, including the sidecar files of Shapefiles (.dbf, .shx, .prj, ...).
+
+    :param source: Path of the vector or raster source
+    :param hash_contents: Whether to hash the file contents instead of using size and modification time
+    """
+    stem, _ = os.path.splitext(source)
+    signature = []
+    for path in sorted(glob.glob(f"{glob.escape(stem)}.*")):
+        if hash_contents:
+            digest = hashlib.sha256()
+            with open(path, "rb") as file:
+                for block in iter(lambda: file.read(2**20), b""):
+                    digest.update(block)
+            signature.append((os.path.basename(path), digest.hexdigest()))
+        else:
+            stat = os.stat(path)
+            signature.append((os.path.basename(path), stat.st_size, stat.st_mtime_ns))
+    if not signature:
+        raise FileNotFoundError(source)
+    return signature
+
+
+def grid_signature(region) -> list:
+    """Identifies the grid of a RegionMask by its extent, pixel size and spatial reference system."""
+    extent = region.extent
+    return [
+        [extent.xMin, extent.yMin, extent.xMax, extent.yMax],
+        [region.pixelWidth, region.pixelHeight],
+        region.srs.ExportToWkt(),
+    ]
+
+
+class MaskCache:
+    def __init__(
+        self, directory: str, max_bytes: int = 50 * 2**30, hash_contents=False
+    ):
+        """
+        :param directory: Directory to store the cached masks in
+        :param max_bytes: Maximum size of all cached masks on disk
+        :param hash_contents: Whether sources are identified by a hash of their contents instead of size and
+            modification time, which is slower but robust against touched or copied files
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hash_contents = hash_contents
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, region, exclude: dict) -> str:
+        """Returns the cache key of a constraint dict on the grid of a region."""
+        description = {
+            "source": exclude["source"],
+            "signature": source_signature(exclude["source"], self.hash_contents),
+            "where": exclude.get("where"),
+            "buffer": exclude.get("buffer"),
+            "value": exclude.get("value"),
+            "grid": grid_signature(region),
+        }
+        return hashlib.sha256(
+            json.dumps(description, sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.tif")
+
+    def get(self, region, exclude: dict):
+        """Returns the cached mask of a constraint dict or None if it isn't cached."""
+        path = self.path(self.key(region, exclude))
+        if not os.path.exists(path):
+            return None
+        mask = gdal.Open(path).ReadAsArray().astype(bool)
+        if mask.shape != region.mask.shape:
+            return None
+        # Mark the entry as recently used
+        os.utime(path)
+        return mask
+
+    def put(self, region, exclude: dict, mask: np.ndarray):
+        """Stores the mask of a constraint dict and evicts the least recently used entries if necessary."""
+        path = self.path(self.key(region, exclude))
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        rows, cols = mask.shape
+        dataset = gdal.GetDriverByName("GTiff").Create(
+            temporary_path,
+            cols,
+            rows,
+            1,
+            gdal.GDT_Byte,
+            options=["NBITS=1", "COMPRESS=DEFLATE", "TILED=YES"],
+        )
+        dataset.SetGeoTransform(
+            (
+                region.extent.xMin,
+                region.pixelWidth,
+                0,
+                region.extent.yMax,
+                0,
+                -region.pixelHeight,
+            )
+        )
+        dataset.SetProjection(region.srs.ExportToWkt())
+        dataset.GetRasterBand(1).WriteArray(mask.astype(np.uint8))
+        dataset = None
+        # Replace atomically, so parallel processes never read partially written entries
+        os.replace(temporary_path, path)
+        self.evict()
+
+    def get_or_create(self, region, exclude: dict) -> np.ndarray:
+        """Returns the mask of a constraint dict, rasterizing and caching it if it isn't cached yet."""
+        mask = self.get(region, exclude)
+        if mask is None:
+            mask = indicate(region, exclude)
+            self.put(region, exclude, mask)
+        else:
+            print(f"Using cached mask for {exclude}")
+        return mask
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits into max_bytes."""
+        entries = []
+        for path in glob.glob(os.path.join(self.directory, "*.tif")):
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Already evicted by another process
+                pass
+            total_bytes -= size
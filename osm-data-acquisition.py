@@ -1,5 +1,8 @@
-# Download and filter airmark beacons from OSM via Overpass
+# Download and filter airmark beacons from OSM, either from a local .osm.pbf extract or via Overpass
+import hashlib
 import os
+import textwrap
+import urllib.request
 
 import overpy
 from geopandas import GeoDataFrame
@@ -8,53 +11,121 @@ from shapely import Point
 results_file_path = "./input/DVOR"
 os.makedirs(results_file_path, exist_ok=True)
 
-api = overpy.Overpass()
+# If this extract exists, the beacons are read from it in a single pass without any request to Overpass. It has to
+# cover the bounding box below, e.g. https://download.geofabrik.de/europe-latest.osm.pbf
+pbf_path = "./downloads/osm/europe-latest.osm.pbf"
+# Responses of Overpass are cached in this directory, keyed by the hash of the query
+overpass_cache_path = "./downloads/overpass"
 
-# Query adapted from Supplementary Material of Risch et al.
 # We choose an area larger than Germany to include airmark beacons that are outside Germany but close enough to affect
-# eligible areas due to the large buffers applied
-dvor = api.query(
-    """
-    [out:json][timeout:250];
-    nwr["airmark"="beacon"](44.653024159812,-0.21972656250000003,56.65622649350222,22.96142578125);
-    out geom;
-    """
-)
+# eligible areas due to the large buffers applied. (south, west, north, east) in EPSG:4326
+bbox = (44.653024159812, -0.21972656250000003, 56.65622649350222, 22.96142578125)
 
-# Structure the results into a list of dicts, inspired by https://stackoverflow.com/a/72677231
-results = [{"id": x.id, "geometry": Point(x.lon, x.lat), **x.tags} for x in dvor.nodes]
+# Filters adapted from Supplementary Material of Risch et al.: A beacon is a VOR (DVOR) if any of the tags has one of the
+# values
+beacon_filters = {
+    "VOR": {
+        "beacon:type": ["VOR", "VOR-DME", "VOR/DME", "VOR;DME", "VOR;TACAN"],
+        "type": ["VOR/DME"],
+        "beacon_t_1": ["VOR", "VOR;TACAN"],
+    },
+    "DVOR": {
+        "beacon:type": ["DVOR", "DVOR/DME", "DVOR;DME", "DVOR;TACAN", "DVORTAC"],
+        "beacon_t_1": ["DVOR", "DVOR-DME", "DVOR/DME", "DVOR;DME"],
+    },
+}
+# Precompiled lookup table of (tag, value) -> beacon classes, so every tag of a beacon is only checked once
+beacon_table = {}
+for beacon_class, tag_values in beacon_filters.items():
+    for tag, values in tag_values.items():
+        for value in values:
+            beacon_table.setdefault((tag, value), set()).add(beacon_class)
+beacon_tags = {tag for tag, _ in beacon_table}
 
-# Split beacons into VOR and DVOR
-# Filters adapted from Supplementary Material of Risch et al.
-filtered_results_vor = [
-    x
-    for x in results
-    if (
-        "beacon:type" in x
-        and x["beacon:type"] in ["VOR", "VOR-DME", "VOR/DME", "VOR;DME", "VOR;TACAN"]
-    )
-    or ("type" in x and x["type"] in ["VOR/DME"])
-    or ("beacon_t_1" in x and x["beacon_t_1"] in ["VOR", "VOR;TACAN"])
-]
-
-filtered_results_dvor = [
-    x
-    for x in results
-    if (
-        "beacon:type" in x
-        and x["beacon:type"]
-        in ["DVOR", "DVOR/DME", "DVOR;DME", "DVOR;TACAN", "DVORTAC"]
+
+def beacon_classes(tags: dict) -> set:
+    """Returns the classes ("VOR", "DVOR") a beacon with the given tags belongs to."""
+    classes = set()
+    for tag in beacon_tags & tags.keys():
+        classes |= beacon_table.get((tag, tags[tag]), set())
+    return classes
+
+
+def read_pbf(path: str) -> list:
+    """Reads all nodes tagged airmark=beacon within bbox from an .osm.pbf extract in a single pass."""
+    import osmium
+
+    south, west, north, east = bbox
+    # Only the blocks of nodes are decoded and the tag filter is applied while reading
+    processor = osmium.FileProcessor(path, osmium.osm.NODE).with_filter(
+        osmium.filter.TagFilter(("airmark", "beacon"))
     )
-    or (
-        "beacon_t_1" in x
-        and x["beacon_t_1"] in ["DVOR", "DVOR-DME", "DVOR/DME", "DVOR;DME"]
+    results = []
+    for node in processor:
+        location = node.location
+        if (
+            location.valid()
+            and south <= location.lat <= north
+            and west <= location.lon <= east
+        ):
+            results.append(
+                {
+                    "id": node.id,
+                    "geometry": Point(location.lon, location.lat),
+                    **{tag.k: tag.v for tag in node.tags},
+                }
+            )
+    return results
+
+
+def query_overpass(query: str) -> overpy.Result:
+    """Queries Overpass, or returns the cached response of a previous run of the same query."""
+    api = overpy.Overpass()
+    query = textwrap.dedent(query).strip()
+    cache_path = os.path.join(
+        overpass_cache_path, f"{hashlib.sha256(query.encode()).hexdigest()}.json"
     )
-]
+    if os.path.exists(cache_path):
+        print(f"Using cached Overpass response {cache_path}")
+        with open(cache_path, "rb") as file:
+            return api.parse_json(file.read())
+
+    os.makedirs(overpass_cache_path, exist_ok=True)
+    with urllib.request.urlopen(api.url, query.encode("utf-8")) as response:
+        data = response.read()
+    # Raises on invalid JSON and on errors reported by Overpass, e.g. timeouts, so only valid responses are cached
+    result = api.parse_json(data)
+    with open(f"{cache_path}.tmp", "wb") as file:
+        file.write(data)
+    os.replace(f"{cache_path}.tmp", cache_path)
+    return result
+
+
+if os.path.exists(pbf_path):
+    print(f"Reading beacons from {pbf_path}")
+    results = read_pbf(pbf_path)
+else:
+    # Query adapted from Supplementary Material of Risch et al.
+    dvor = query_overpass("""
+        [out:json][timeout:250];
+        nwr["airmark"="beacon"]({},{},{},{});
+        out geom;
+        """.format(*bbox))
+    # Structure the results into a list of dicts, inspired by https://stackoverflow.com/a/72677231
+    results = [
+        {"id": x.id, "geometry": Point(x.lon, x.lat), **x.tags} for x in dvor.nodes
+    ]
+
+# Split beacons into VOR and DVOR
+filtered_results = {beacon_class: [] for beacon_class in beacon_filters}
+for result in results:
+    for beacon_class in beacon_classes(result):
+        filtered_results[beacon_class].append(result)
 
 # Save filtered results to ShapeFiles
-GeoDataFrame(filtered_results_vor, crs="epsg:4326").to_file(
+GeoDataFrame(filtered_results["VOR"], crs="epsg:4326").to_file(
     f"{results_file_path}/VOR.shp"
 )
-GeoDataFrame(filtered_results_dvor, crs="epsg:4326").to_file(
+GeoDataFrame(filtered_results["DVOR"], crs="epsg:4326").to_file(
     f"{results_file_path}/DVOR.shp"
 )
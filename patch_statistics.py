@@ -0,0 +1,285 @@
+# Patch statistics of the results: The available pixels of a result raster are split into patches, i.e. 4-connected
+# components like the polygons of gdal.Polygonize. Patches are labelled tile by tile and the labels touching at the seams
+# of the tiles are merged with a union-find, so only one tile is held in memory at a time. Patches smaller than a
+# minimum area are dropped. The remaining patches are polygonized tile by tile, the pieces of patches spanning several
+# tiles are dissolved, and written to a GeoPackage together with their area, perimeter, compactness, whether they fit a
+# turbine and an estimate of the number of turbines they fit.
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from osgeo import gdal, ogr, osr
+from scipy.ndimage import label
+
+from cog import availability
+from tiled_exclusion import create_tiles
+
+gdal.UseExceptions()
+ogr.UseExceptions()
+
+patch_fields = {
+    "patch_id": ogr.OFTInteger64,
+    "area_m2": ogr.OFTReal,
+    "perimeter_m": ogr.OFTReal,
+    "compactness": ogr.OFTReal,
+    "fits_turbine": ogr.OFTInteger,
+    "turbines": ogr.OFTInteger,
+    "capacity_mw": ogr.OFTReal,
+}
+
+
+def read_tile(path: str, tile: Tuple[int, int, int, int]) -> np.ndarray:
+    """
+    Reads the availability of a tile of a result raster with a halo of one pixel.
+
+    :return: Boolean matrix of (rows + 2, cols + 2), False outside the raster and outside the region
+    """
+    row, col, rows, cols = tile
+    dataset = gdal.Open(path)
+    band = dataset.GetRasterBand(1)
+    row_from, col_from = max(row - 1, 0), max(col - 1, 0)
+    row_to = min(row + rows + 1, dataset.RasterYSize)
+    col_to = min(col + cols + 1, dataset.RasterXSize)
+    window = (col_from, row_from, col_to - col_from, row_to - row_from)
+    available = np.zeros((rows + 2, cols + 2), dtype=bool)
+    available[
+        row_from - row + 1 : row_to - row + 1, col_from - col + 1 : col_to - col + 1
+    ] = availability(band.ReadAsArray(*window), path) & (
+        band.GetMaskBand().ReadAsArray(*window) > 0
+    )
+    return available
+
+
+def tile_patches(path: str, tile: Tuple[int, int, int, int]) -> dict:
+    """
+    Labels the patches of a tile and measures them.
+
+    :return: Dict of the number of labels, the pixels, the vertical and horizontal edges to unavailable pixels of every
+        label (indexed by label - 1) and the labels of the top, bottom, left and right border of the tile
+    """
+    available = read_tile(path, tile)
+    core = available[1:-1, 1:-1]
+    labels, count = label(core)
+    vertical_edges = (core & ~available[1:-1, :-2]).astype(np.uint8) + (
+        core & ~available[1:-1, 2:]
+    )
+    horizontal_edges = (core & ~available[:-2, 1:-1]).astype(np.uint8) + (
+        core & ~available[2:, 1:-1]
+    )
+    flat = labels.ravel()
+    return {
+        "count": count,
+        "pixels": np.bincount(flat, minlength=count + 1)[1:],
+        "vertical_edges": np.bincount(
+            flat, weights=vertical_edges.ravel(), minlength=count + 1
+        )[1:],
+        "horizontal_edges": np.bincount(
+            flat, weights=horizontal_edges.ravel(), minlength=count + 1
+        )[1:],
+        "top": labels[0].copy(),
+        "bottom": labels[-1].copy(),
+        "left": labels[:, 0].copy(),
+        "right": labels[:, -1].copy(),
+    }
+
+
+def _find(parent: np.ndarray, node: int) -> int:
+    while parent[node] != node:
+        parent[node] = parent[parent[node]]
+        node = parent[node]
+    return node
+
+
+def merge_seam(parent: np.ndarray, first: np.ndarray, second: np.ndarray):
+    """Merges the labels of adjacent pixels on both sides of a seam, given as global labels (0 for no patch)."""
+    touching = (first > 0) & (second > 0)
+    for a, b in np.unique(np.stack([first[touching], second[touching]]), axis=1).T:
+        root_a, root_b = _find(parent, a), _find(parent, b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+
+
+def patch_statistics(
+    path: str,
+    output: str,
+    min_area: float = 0,
+    turbine_area: float = None,
+    turbine_power: float = None,
+    tile_size: int = 4096,
+) -> pd.DataFrame:
+    """
+    Splits the available pixels of a result raster into patches and writes the patches as polygons to a GeoPackage.
+
+    :param path: Path of a result raster, see cog.py
+    :param output: Path of the GeoPackage
+    :param min_area: Patches smaller than this area in m² are dropped, e.g. the area swept by the rotor
+    :param turbine_area: Area in m² required by one turbine to estimate the number of turbines of a patch, patches
+        smaller than this fit no turbine. None to skip the estimate
+    :param turbine_power: Rated power of a turbine in MW to estimate the capacity of a patch
+    :param tile_size: Number of rows and columns of each tile
+    :return: DataFrame of the statistics of every patch, the same as the attributes of the polygons
+    """
+    dataset = gdal.Open(path)
+    x_origin, pixel_width, _, y_origin, _, pixel_height = dataset.GetGeoTransform()
+    pixel_height = abs(pixel_height)
+    tiles = create_tiles((dataset.RasterYSize, dataset.RasterXSize), tile_size)
+
+    # Label every tile, labels of the tiles are made unique by an offset
+    patches = [tile_patches(path, tile) for tile in tiles]
+    offsets = np.cumsum([0] + [tile["count"] for tile in patches])
+
+    def global_labels(index: int, labels: np.ndarray) -> np.ndarray:
+        return np.where(labels > 0, labels + offsets[index], 0)
+
+    parent = np.arange(offsets[-1] + 1)
+    positions = {tile[:2]: index for index, tile in enumerate(tiles)}
+    for index, (row, col, rows, cols) in enumerate(tiles):
+        below = positions.get((row + rows, col))
+        if below is not None:
+            merge_seam(
+                parent,
+                global_labels(index, patches[index]["bottom"]),
+                global_labels(below, patches[below]["top"]),
+            )
+        right = positions.get((row, col + cols))
+        if right is not None:
+            merge_seam(
+                parent,
+                global_labels(index, patches[index]["right"]),
+                global_labels(right, patches[right]["left"]),
+            )
+    roots = parent
+    while True:
+        next_roots = roots[roots]
+        if (next_roots == roots).all():
+            break
+        roots = next_roots
+
+    def merged(key: str) -> np.ndarray:
+        values = np.concatenate([[0], *[tile[key] for tile in patches]])
+        return np.bincount(roots, weights=values, minlength=len(roots))
+
+    area = merged("pixels") * pixel_width * pixel_height
+    perimeter = (
+        merged("vertical_edges") * pixel_height
+        + merged("horizontal_edges") * pixel_width
+    )
+    kept = np.flatnonzero((roots == np.arange(len(roots))) & (area > 0))
+    kept = kept[area[kept] >= min_area]
+    patch_of_root = np.zeros(len(roots), dtype=np.int64)
+    patch_of_root[kept] = np.arange(1, len(kept) + 1)
+    patch_of_label = patch_of_root[roots]
+
+    statistics = pd.DataFrame(
+        {
+            "patch_id": np.arange(1, len(kept) + 1),
+            "area_m2": area[kept],
+            "perimeter_m": perimeter[kept],
+            # Polsby-Popper score of the pixel outline, pi / 4 for a square
+            "compactness": 4 * np.pi * area[kept] / perimeter[kept] ** 2,
+        }
+    )
+    if turbine_area is not None:
+        statistics["fits_turbine"] = area[kept] >= turbine_area
+        statistics["turbines"] = (area[kept] // turbine_area).astype(int)
+        if turbine_power is not None:
+            statistics["capacity_mw"] = statistics["turbines"] * turbine_power
+    print(f"{path}: {len(kept)} patches of at least {min_area} m²")
+
+    # Patches are complete within a tile if they appear in no other tile
+    tile_counts = np.zeros(len(kept) + 1, dtype=np.int64)
+    for index in range(len(tiles)):
+        tile_counts[
+            np.unique(patch_of_label[offsets[index] + 1 : offsets[index + 1] + 1])
+        ] += 1
+
+    srs = osr.SpatialReference(wkt=dataset.GetProjection())
+    driver = ogr.GetDriverByName("GPKG")
+    if os.path.exists(output):
+        driver.DeleteDataSource(output)
+    output_dataset = driver.CreateDataSource(output)
+    layer = output_dataset.CreateLayer("patches", srs=srs, geom_type=ogr.wkbPolygon)
+    for name in statistics.columns:
+        field = ogr.FieldDefn(name, patch_fields[name])
+        if statistics[name].dtype == bool:
+            field.SetSubType(ogr.OFSTBoolean)
+        layer.CreateField(field)
+    # Patch ids are consecutive, so the attributes of a patch are at index patch_id - 1
+    attributes = {name: statistics[name].to_numpy() for name in statistics.columns}
+
+    def write_patch(patch: int, geometry: ogr.Geometry):
+        feature = ogr.Feature(layer.GetLayerDefn())
+        feature.SetGeometry(geometry)
+        for name, values in attributes.items():
+            feature.SetField(name, values[patch - 1].item())
+        layer.CreateFeature(feature)
+
+    pieces: Dict[int, List[ogr.Geometry]] = {}
+    layer.StartTransaction()
+    for index, (row, col, rows, cols) in enumerate(tiles):
+        labels, _ = label(read_tile(path, (row, col, rows, cols))[1:-1, 1:-1])
+        tile_patch = patch_of_label[global_labels(index, labels)]
+        if not tile_patch.any():
+            continue
+        raster = gdal.GetDriverByName("MEM").Create("", cols, rows, 1, gdal.GDT_Int32)
+        raster.SetGeoTransform(
+            (
+                x_origin + col * pixel_width,
+                pixel_width,
+                0,
+                y_origin - row * pixel_height,
+                0,
+                -pixel_height,
+            )
+        )
+        band = raster.GetRasterBand(1)
+        band.WriteArray(tile_patch.astype(np.int32))
+        memory = ogr.GetDriverByName("Memory").CreateDataSource("")
+        polygons = memory.CreateLayer("polygons", srs=srs)
+        polygons.CreateField(ogr.FieldDefn("patch_id", ogr.OFTInteger))
+        # Pixels of no patch (0) are masked by the band itself
+        gdal.Polygonize(band, band, polygons, 0)
+        for polygon in polygons:
+            patch = polygon.GetField("patch_id")
+            geometry = polygon.GetGeometryRef().Clone()
+            if tile_counts[patch] == 1:
+                write_patch(patch, geometry)
+            else:
+                pieces.setdefault(patch, []).append(geometry)
+    for patch, geometries in pieces.items():
+        collection = ogr.Geometry(ogr.wkbMultiPolygon)
+        for geometry in geometries:
+            collection.AddGeometry(geometry)
+        write_patch(patch, collection.UnionCascaded())
+    layer.CommitTransaction()
+    output_dataset = None
+    return statistics
+
+
+def patch_statistics_of_results(
+    results: List[Tuple[str, float, str, str]], workers: int = None, **options
+) -> pd.DataFrame:
+    """
+    Calculates the patches of several result rasters in parallel, see patch_statistics.
+
+    :param results: List of (scenario, buffer, path of the result raster, path of the GeoPackage)
+    :param workers: Number of worker processes, each processing one result raster at a time
+    :param options: Further keyword arguments of patch_statistics, e.g. min_area
+    :return: Long format DataFrame with one row per scenario, buffer and patch
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(patch_statistics, path, output, **options)
+            for _, _, path, output in results
+        ]
+        frames = [
+            future.result().assign(scenario=scenario, buffer=buffer)
+            for (scenario, buffer, _, _), future in zip(results, futures)
+        ]
+    statistics = pd.concat(frames, ignore_index=True)
+    return statistics[
+        ["scenario", "buffer"]
+        + [name for name in statistics.columns if name not in ("scenario", "buffer")]
+    ]
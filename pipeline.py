@@ -0,0 +1,484 @@
+# Incremental, make-style build of the whole pipeline: from the downloads through the preprocessed inputs and the
+# exclusion masks to the scenario rasters and the CSVs. Every node of the build graph declares its input files, its
+# parameters (e.g. the constraint dicts of the catalog) and its outputs. A node is only rebuilt if one of its outputs is
+# missing or if the hash of the contents of its inputs and of its parameters differs from its last successful build.
+# A new Basis-DLM vintage therefore only rebuilds the masks of the Basis-DLM constraints, the rasters depending on them
+# and the CSVs, while unchanged masks are taken from the mask cache.
+#
+# Usage: python pipeline.py [--dry-run] [--force NODE ...] [TARGET ...]
+# The default target is "results". Run with --list to show all nodes.
+import argparse
+import glob
+import hashlib
+import json
+import os
+import runpy
+import subprocess
+import sys
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import main
+from constraint_planner import group_by_source, plan_constraint_masks
+
+# File storing the content hashes of the inputs and the signatures of the last successful build of every node
+state_path = "./.pipeline-state.json"
+
+# Commands running the scripts of each conda environment, see environment.yml and environment-da.yml
+environment_commands = {
+    "by-wind": [sys.executable],
+    "by-wind-da": ["conda", "run", "--no-capture-output", "-n", "by-wind-da", "python"],
+}
+
+# Constraint sets whose constrained areas are mapped, see mapping_constrained_areas.py
+mapping_constraint_sets = [
+    "social_political",
+    "physical",
+    "conservation",
+    "technical_economic",
+]
+
+
+@dataclass
+class Node:
+    name: str
+    # Builds the outputs, None for nodes that only group other nodes
+    action: Optional[Callable[[], Any]]
+    # Files, directories or glob patterns whose contents the outputs depend on. Shapefiles include their sidecar files.
+    inputs: List[str] = field(default_factory=list)
+    # Files or directories that are built
+    outputs: List[str] = field(default_factory=list)
+    # JSON serializable parameters the outputs depend on
+    parameters: Any = None
+    # Nodes that have to be up to date before this node is built, e.g. the producers of its inputs
+    dependencies: List[str] = field(default_factory=list)
+
+
+def expand_input(path: str) -> List[str]:
+    """Returns all files of an input: the files of a directory, the matches of a pattern or a file with its sidecars."""
+    if os.path.isdir(path):
+        return sorted(
+            os.path.join(directory, name)
+            for directory, _, names in os.walk(path)
+            for name in names
+        )
+    if glob.has_magic(path):
+        return sorted(glob.glob(path))
+    stem, _ = os.path.splitext(path)
+    return sorted(glob.glob(f"{glob.escape(stem)}.*"))
+
+
+class BuildState:
+    def __init__(self, path: str = state_path):
+        """
+        :param path: Path of the state file, created on the first successful build
+        """
+        self.path = path
+        self.state = {"files": {}, "nodes": {}}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                self.state = json.load(file)
+
+    def file_hash(self, path: str) -> str:
+        """Returns the SHA-256 of a file, which is only computed again if its size or modification time changed."""
+        stat = os.stat(path)
+        cached = self.state["files"].get(path)
+        if cached is not None and cached[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(2**20), b""):
+                digest.update(block)
+        self.state["files"][path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def signature(self, node: Node) -> str:
+        """Hashes the parameters of a node and the contents of all of its input files."""
+        inputs = {}
+        for path in node.inputs:
+            files = expand_input(path)
+            inputs[path] = [(file, self.file_hash(file)) for file in files] or None
+        description = {"parameters": node.parameters, "inputs": inputs}
+        return hashlib.sha256(
+            json.dumps(description, sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+    def is_up_to_date(self, node: Node) -> bool:
+        return all(os.path.exists(output) for output in node.outputs) and self.state[
+            "nodes"
+        ].get(node.name) == self.signature(node)
+
+    def record(self, node: Node):
+        """Stores the signature of a successfully built node."""
+        self.state["nodes"][node.name] = self.signature(node)
+        self.save()
+
+    def save(self):
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump(self.state, file, indent=1, sort_keys=True)
+        os.replace(temporary_path, self.path)
+
+
+def run_script(script: str, environment: str):
+    """Runs a script of the repository in the given conda environment."""
+    subprocess.run([*environment_commands[environment], script], check=True)
+
+
+def script_node(
+    script: str,
+    environment: str,
+    inputs: List[str] = (),
+    outputs: List[str] = (),
+    dependencies: List[str] = (),
+) -> Node:
+    """Creates a node running a script. The script itself is an input, so changing it rebuilds its outputs."""
+    return Node(
+        name=script,
+        action=lambda: run_script(script, environment),
+        inputs=[script, *inputs],
+        outputs=list(outputs),
+        dependencies=list(dependencies),
+    )
+
+
+_region = None
+
+
+def shared_region():
+    """Returns the region of the ExclusionCalculator of main.py, which is only created once per run."""
+    global _region
+    if _region is None:
+        _region = main.create_exclusion_calculator().region
+    return _region
+
+
+def cache_masks(excludes: List[dict]):
+    """Rasterizes all constraint dicts of a source that are not cached yet into the mask cache."""
+    region = shared_region()
+    excludes = main.prepare_excludes(region, excludes)
+    for _ in plan_constraint_masks(region, excludes, main.create_mask_cache()):
+        pass
+
+
+def create_nodes() -> Dict[str, Node]:
+    """Creates the build graph from the catalog and the configuration of main.py."""
+    constraint_sets = main.constraint_sets
+    region_parameters = {
+        "region_source": main.region_source,
+        "region_options": main.region_options,
+    }
+    nodes = [
+        # Acquisition and preprocessing of the inputs, see the readme. Downloads have no local inputs besides their
+        # script, so they are only run again if their outputs are missing, their script changed or they are forced.
+        script_node(
+            "osm-data-acquisition.py",
+            "by-wind-da",
+            # The local extract replacing the Overpass query, if any
+            inputs=["./downloads/osm/*.osm.pbf"],
+            outputs=["./input/DVOR/DVOR.shp", "./input/DVOR/VOR.shp"],
+        ),
+        script_node(
+            "protected-forest-data-acquisition.py",
+            "by-wind-da",
+            outputs=[
+                exclude["source"] for exclude in constraint_sets["protected_forests"]
+            ],
+        ),
+        script_node(
+            "buildings-data-acquisition.py",
+            "by-wind-da",
+            outputs=["./downloads/intermediate"],
+        ),
+        script_node(
+            "buildings-preprocessing.py",
+            "by-wind-da",
+            inputs=["./downloads/intermediate"],
+            outputs=[
+                f"./input/Gebäude/{category}.gpkg"
+                for category in ("residential", "health", "mixed", "other")
+            ],
+            dependencies=["buildings-data-acquisition.py"],
+        ),
+        script_node(
+            "geofabrik-preprocessing.py",
+            "by-wind-da",
+            inputs=["./downloads/geofabrik"],
+            outputs=[
+                "./input/OSM/gis_osm_waterways_free_1.shp",
+                "./input/OSM/gis_osm_pois_a_free_1.shp",
+            ],
+        ),
+        script_node(
+            "windspeed-preprocessing.py",
+            "by-wind-da",
+            inputs=["./downloads/windspeed/windspeed_120.tif"],
+            # The masks are read by the wind speed constraint of the catalog
+            outputs=[
+                "./downloads/windspeed/windspeed_120_classes.tif",
+                "./input/Windgeschwindigkeit/windspeed_120_4.5m.tif",
+                "./input/Windgeschwindigkeit/windspeed_120_4.8m.tif",
+            ],
+        ),
+    ]
+
+    # Inputs built by one of the nodes above
+    producers = {}
+    for node in nodes:
+        for output in node.outputs:
+            producers[os.path.normpath(output)] = node.name
+
+    def producers_of(excludes: List[dict]) -> List[str]:
+        return sorted(
+            {
+                producers[os.path.normpath(exclude["source"])]
+                for exclude in excludes
+                if os.path.normpath(exclude["source"]) in producers
+            }
+        )
+
+    # One node per source and grid rasterizing all constraints of the source into the mask cache, so that unchanged
+    # sources are neither read nor rasterized again
+    mask_nodes = {}
+    if main.mask_cache_options:
+        all_excludes = [
+            exclude for excludes in constraint_sets.values() for exclude in excludes
+        ]
+        for source, excludes in group_by_source(all_excludes).items():
+            if any(exclude.get("update_buffer") for exclude in excludes):
+                # Residential areas are buffered by the sweep itself
+                continue
+            node = Node(
+                name=f"masks:{source}",
+                action=lambda excludes=excludes: cache_masks(excludes),
+                inputs=[source, main.region_source],
+                parameters={"excludes": excludes, **region_parameters},
+                dependencies=producers_of(excludes),
+            )
+            nodes.append(node)
+            mask_nodes[source] = node.name
+
+    def mask_nodes_of(excludes: List[dict]) -> List[str]:
+        return sorted(
+            {
+                mask_nodes[exclude["source"]]
+                for exclude in excludes
+                if exclude["source"] in mask_nodes
+            }
+        )
+
+    fixed_excludes = main.fixed_excludes
+    nodes.append(
+        Node(
+            name="fixed",
+            action=main.run_fixed_exclusions,
+            inputs=[
+                main.region_source,
+                *sorted({exclude["source"] for exclude in fixed_excludes}),
+            ],
+            outputs=[main.initial_result_path],
+            parameters={"excludes": fixed_excludes, **region_parameters},
+            dependencies=producers_of(fixed_excludes) + mask_nodes_of(fixed_excludes),
+        )
+    )
+
+    mapping_excludes = [
+        exclude for name in mapping_constraint_sets for exclude in constraint_sets[name]
+    ]
+    nodes.append(
+        Node(
+            name="mapping",
+            action=lambda: runpy.run_path("mapping_constrained_areas.py"),
+            inputs=[
+                main.region_source,
+                *sorted({exclude["source"] for exclude in mapping_excludes}),
+            ],
+            outputs=[
+                *[
+                    f"./output/ByWind_{main.raster_size}_{name}.tif"
+                    for name in mapping_constraint_sets
+                ],
+                "./output/ByWind_constrained_areas.csv",
+            ],
+            parameters={"excludes": mapping_excludes, **region_parameters},
+            dependencies=producers_of(mapping_excludes)
+            + mask_nodes_of(mapping_excludes),
+        )
+    )
+
+    scenario_excludes = [
+        exclude
+        for excludes in main.scenario_exclusion_sets.values()
+        for exclude in excludes
+    ]
+    sweep_excludes = [*main.residential_areas, *scenario_excludes]
+    nodes.append(
+        Node(
+            name="sweep",
+            action=main.run_sweep,
+            inputs=[
+                main.initial_result_path,
+                *sorted({exclude["source"] for exclude in sweep_excludes}),
+            ],
+            outputs=[
+                *[
+                    main.scenario_output_pattern.format(buffer=buffer, scenario=name)
+                    for buffer in main.variable_exclude_buffers
+                    for name, _ in main.scenarios
+                ],
+                main.results_path,
+            ],
+            parameters={
+                "buffers": list(main.variable_exclude_buffers),
+                "scenarios": main.scenarios,
+                "scenario_exclusion_sets": main.scenario_exclusion_sets,
+                "residential_areas": main.residential_areas,
+                "residential_buffer_mode": main.residential_buffer_mode,
+                "scenario_packing": main.scenario_packing,
+                **region_parameters,
+            },
+            dependencies=[
+                "fixed",
+                *producers_of(sweep_excludes),
+                *mask_nodes_of(scenario_excludes),
+            ],
+        )
+    )
+    if main.zonal_levels:
+        nodes.append(
+            Node(
+                name="zonal",
+                action=main.run_zonal_statistics,
+                inputs=[
+                    main.region_source,
+                    main.initial_result_path,
+                    *[
+                        main.scenario_output_pattern.format(
+                            buffer=buffer, scenario=name
+                        )
+                        for buffer in main.variable_exclude_buffers
+                        for name, _ in main.scenarios
+                    ],
+                ],
+                outputs=[main.zonal_statistics_path],
+                parameters={
+                    "levels": main.zonal_levels,
+                    "buffers": list(main.variable_exclude_buffers),
+                    "scenarios": main.scenarios,
+                },
+                dependencies=["fixed", "sweep"],
+            )
+        )
+    if main.patch_statistics_path:
+        results = main.result_rasters()
+        nodes.append(
+            Node(
+                name="patches",
+                action=main.run_patch_statistics,
+                inputs=[path for _, _, path in results],
+                outputs=[
+                    main.patch_statistics_path,
+                    *[
+                        f"{os.path.splitext(path)[0]}_patches.gpkg"
+                        for _, _, path in results
+                    ],
+                ],
+                parameters={
+                    "min_area": main.patch_min_area,
+                    "turbine_area": main.patch_turbine_area,
+                    "turbine_power": main.patch_turbine_power,
+                },
+                dependencies=["fixed", "sweep"],
+            )
+        )
+    nodes.append(
+        Node(
+            name="results",
+            action=None,
+            dependencies=[
+                "sweep",
+                "mapping",
+                *(["zonal"] if main.zonal_levels else []),
+                *(["patches"] if main.patch_statistics_path else []),
+            ],
+        )
+    )
+    return {node.name: node for node in nodes}
+
+
+def build_order(nodes: Dict[str, Node], targets: List[str]) -> List[Node]:
+    """Returns the targets and all of their dependencies, each after its dependencies."""
+    order = []
+    visiting = set()
+    visited = set()
+
+    def visit(name):
+        if name in visited:
+            return
+        if name in visiting:
+            raise ValueError(f"Dependency cycle at {name}")
+        if name not in nodes:
+            raise KeyError(f"Unknown node {name}")
+        visiting.add(name)
+        for dependency in nodes[name].dependencies:
+            visit(dependency)
+        visiting.remove(name)
+        visited.add(name)
+        order.append(nodes[name])
+
+    for target in targets:
+        visit(target)
+    return order
+
+
+def build(
+    targets: List[str],
+    force: List[str] = (),
+    dry_run: bool = False,
+    state: BuildState = None,
+) -> List[str]:
+    """
+    Brings the targets up to date, rebuilding only the nodes whose outputs are missing or whose inputs or parameters
+    changed since their last build.
+
+    :param targets: Names of the nodes to build
+    :param force: Names of nodes to rebuild regardless of their state
+    :param dry_run: Only report the nodes that are out of date. Nodes depending on them might be rebuilt as well
+    :param state: Build state, loaded from state_path if None
+    :return: Names of the rebuilt (or, in a dry run, out of date) nodes
+    """
+    nodes = create_nodes()
+    state = state or BuildState()
+    rebuilt = []
+    for node in build_order(nodes, targets):
+        if node.action is None:
+            continue
+        if node.name not in force and state.is_up_to_date(node):
+            print(f"Up to date: {node.name}")
+            continue
+        rebuilt.append(node.name)
+        if dry_run:
+            print(f"Out of date: {node.name}")
+            continue
+        print(f"Building: {node.name}")
+        node.action()
+        state.record(node)
+    state.save()
+    return rebuilt
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Incrementally builds the outputs of ByWind"
+    )
+    parser.add_argument("targets", nargs="*", default=["results"])
+    parser.add_argument("--force", nargs="+", default=[], metavar="NODE")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--list", action="store_true")
+    arguments = parser.parse_args()
+
+    if arguments.list:
+        for name, node in create_nodes().items():
+            print(f"{name}: {', '.join(node.dependencies) or '-'}")
+    else:
+        build(arguments.targets, arguments.force, arguments.dry_run)
@@ -0,0 +1,112 @@
+# Timeline instrumentation of the exclusion runs: Records the wall time, CPU time and memory of every step, e.g.
+# reading and rasterizing a source or excluding a constraint, together with counts like the number of features read or
+# the number of newly excluded pixels. The timeline is written as JSON and CSV next to the results.
+import csv
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+
+def peak_rss() -> int:
+    """Returns the peak resident set size of the current process in bytes, None if unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is given in kilobytes on Linux and in bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def current_rss() -> int:
+    """Returns the current resident set size of the current process in bytes, None if unknown."""
+    try:
+        # Second field of statm is the number of resident pages, only available on Linux
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _difference(end: int, start: int) -> int:
+    return None if end is None or start is None else end - start
+
+
+class Timeline:
+    def __init__(self):
+        self.steps = []
+        self._open_steps = []
+
+    @contextmanager
+    def step(self, name: str, **fields) -> Iterator[dict]:
+        """
+        Measures a step. Counts can be added to the step with add while it is running.
+
+        :param name: Name of the step, e.g. "rasterize" or "exclude"
+        :param fields: Further fields of the step, e.g. the name of the constraint
+        :return: Context manager yielding the record of the step
+        """
+        record = {"step": name, **fields}
+        # Unix time, which is comparable between processes
+        record["start_time"] = time.time()
+        self._open_steps.append(record)
+        rss_start, peak_start = current_rss(), peak_rss()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield record
+        finally:
+            record["wall_seconds"] = time.perf_counter() - wall_start
+            record["cpu_seconds"] = time.process_time() - cpu_start
+            rss_end = current_rss()
+            record["rss_bytes"] = rss_end
+            # Memory the step kept allocated, e.g. the mask of a constraint
+            record["rss_increase_bytes"] = _difference(rss_end, rss_start)
+            # By how much the step raised the peak of the whole process, 0 if it stayed below an earlier peak
+            record["peak_rss_increase_bytes"] = _difference(peak_rss(), peak_start)
+            self._open_steps.remove(record)
+            self.steps.append(record)
+
+    def add(self, **counts):
+        """Adds counts, e.g. features=1000, to the innermost running step. Does nothing if no step is running."""
+        if not self._open_steps:
+            return
+        record = self._open_steps[-1]
+        for key, value in counts.items():
+            record[key] = record.get(key, 0) + value
+
+    def extend(self, records: list):
+        """Adds steps measured elsewhere, e.g. in worker processes."""
+        self.steps.extend(records)
+
+    def save(self, path_prefix: str):
+        """Writes the timeline to path_prefix.json and path_prefix.csv."""
+        with open(f"{path_prefix}.json", "w", encoding="utf-8") as file:
+            json.dump(self.steps, file, indent=1, default=str)
+
+        columns = []
+        for record in self.steps:
+            columns.extend(key for key in record if key not in columns)
+        with open(f"{path_prefix}.csv", "w", newline="", encoding="utf-8") as file:
+            writer = csv.DictWriter(file, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(self.steps)
+
+
+def timed_call(function, args, **fields):
+    """
+    Calls function(*args) and measures it like Timeline.step, e.g. in a worker process.
+
+    :return: Tuple of the result and the record of the call
+    """
+    timeline = Timeline()
+    with timeline.step(function.__name__, **fields):
+        result = function(*args)
+    return result, timeline.steps[0]
@@ -1,15 +1,17 @@
 # Read all layers from forest functions mapping WFS and save the content of each layer in a single Shapefile
 import os
 
-import geopandas as gpd
+from wfs_client import download_layers
 
 results_file_path = "./input/Schutzwald"
 os.makedirs(results_file_path, exist_ok=True)
 
-wfs_url = "https://www.fovgis.bayern.de/arcgis/services/fov/waldfunktionskarte/MapServer/WFSServer"
-wfs_parameters = (
-    "SERVICE=WFS&REQUEST=GetFeature&VERSION=2.0.0&SRSNAME=urn:ogc:def:crs:EPSG::25832"
+# Can be set to a local stand-in, see benchmarks/wfs_stand_in.py
+wfs_url = os.environ.get(
+    "BYWIND_WFS_URL",
+    "https://www.fovgis.bayern.de/arcgis/services/fov/waldfunktionskarte/MapServer/WFSServer",
 )
+wfs_parameters = {"VERSION": "2.0.0", "SRSNAME": "urn:ogc:def:crs:EPSG::25832"}
 
 layer_names = [
     "Bodenschutzwald",
@@ -21,9 +23,17 @@ layer_names = [
     "Sichtschutzwald",
 ]
 
-for name in layer_names:
-    # Add parameters to wfs url and include the layer name to download
-    url = f"{wfs_url}?{wfs_parameters}&TYPENAMES=fov_waldfunktionskarte:{name}"
-    # Read wfs layer to GeoDataFrame and write it to Shapefile
-    gdf = gpd.read_file(url)
-    gdf.to_file(f"{results_file_path}/{name}.shp")
+# The layers are requested in pages of page_size features, at most workers requests at a time. Pages are cached in
+# ./downloads/wfs, so an interrupted run only requests the missing pages
+page_size = 1000
+workers = 4
+
+download_layers(
+    wfs_url,
+    [f"fov_waldfunktionskarte:{name}" for name in layer_names],
+    [f"{results_file_path}/{name}.shp" for name in layer_names],
+    parameters=wfs_parameters,
+    page_size=page_size,
+    workers=workers,
+    cache_dir="./downloads/wfs",
+)
@@ -0,0 +1,69 @@
+# Distance raster for the residential buffer sweep: rasterize the residential sources once, compute the Euclidean
+# distance to them on the grid of the region and derive every buffer variant by thresholding that distance
+import numpy as np
+from scipy.ndimage import distance_transform_edt
+
+from availability_store import AvailabilityStore
+from exclusion_utils import indicate, subgrid
+
+
+def distance_raster(
+    region, excludes: list, max_distance: float, block_rows: int = 2048
+) -> np.ndarray:
+    """
+    Calculates the Euclidean distance from the center of every pixel of the region's grid to the center of the nearest
+    pixel covered by any of the given excludes (rasterized without buffer).
+
+    The grid is processed in blocks of rows. Each block carries a halo of max_distance, so features outside the block or
+    outside the region are still taken into account. Distances larger than max_distance are set to infinity.
+
+    Thresholding the result approximates excludeVectorType with a buffer up to half a pixel diagonal, i.e.
+    `distance > buffer` is the availability after excluding the excludes with the given buffer.
+
+    :param region: geokit RegionMask defining the grid, e.g. ExclusionCalculator.region
+    :param excludes: Constraint dicts to calculate the distance to, any buffer is ignored
+    :param max_distance: Largest buffer (in meters) the distance raster will be thresholded with
+    :param block_rows: Number of rows processed at once, limits the peak memory usage
+    :return: float32 matrix with the shape of the region's mask containing distances in meters
+    """
+    pixel_size = region.pixelWidth
+    halo = int(np.ceil(max_distance / pixel_size)) + 1
+    rows, cols = region.mask.shape
+    distance = np.full((rows, cols), np.inf, dtype=np.float32)
+
+    for row in range(0, rows, block_rows):
+        block_height = min(block_rows, rows - row)
+        print(f"Calculating distance raster for rows {row} to {row + block_height}")
+        grid = subgrid(
+            region, row - halo, -halo, block_height + 2 * halo, cols + 2 * halo
+        )
+
+        sources = np.zeros(grid.mask.shape, dtype=bool)
+        for exclude in excludes:
+            sources |= indicate(
+                grid, {"source": exclude["source"], "where": exclude.get("where")}
+            )
+        if not sources.any():
+            continue
+
+        block_distance = distance_transform_edt(
+            ~sources, sampling=(region.pixelHeight, pixel_size)
+        )[halo : halo + block_height, halo : halo + cols]
+        block_distance[block_distance > max_distance] = np.inf
+        distance[row : row + block_height] = block_distance
+
+    return distance
+
+
+def buffered_availability(
+    available: AvailabilityStore, distance: np.ndarray, buffer: float, path: str = None
+) -> AvailabilityStore:
+    """
+    Excludes all pixels within buffer of the sources of a distance raster from an availability.
+
+    :param available: Availability, e.g. the result of the fixed excludes, it is not modified
+    :param distance: Distance raster as returned by distance_raster
+    :param buffer: Buffer in meters
+    :param path: Optional path of a .npy file to memory-map the result to
+    """
+    return available.copy(path).threshold(distance, buffer)
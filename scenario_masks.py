@@ -0,0 +1,48 @@
+# Masks of the additional exclusions of the scenarios in main.py. Every exclusion set is rasterized only once and then
+# combined with the availability of each buffer by a logical AND. Masks and availability are bit-packed, see
+# availability_store.py
+from availability_store import AvailabilityStore
+from exclusion_utils import indicate
+
+
+def create_exclusion_set_masks(region, exclusion_sets: dict, cache=None) -> dict:
+    """
+    Rasterizes every exclusion set once into a boolean mask on the region's grid.
+
+    :param region: geokit RegionMask defining the grid, e.g. ExclusionCalculator.region
+    :param exclusion_sets: Dict of exclusion set name -> list of constraint dicts
+    :param cache: Optional MaskCache to take the masks of the single constraints from
+    :return: Dict of exclusion set name -> AvailabilityStore that is available wherever the set allows turbines
+    """
+    masks = {}
+    for name, excludes in exclusion_sets.items():
+        print(f"Rasterizing exclusion set {name}")
+        allowed = AvailabilityStore.create(region.mask.shape)
+        for exclude in excludes:
+            print(f"Excluding {exclude}")
+            if cache is None:
+                allowed.exclude(indicate(region, exclude))
+            else:
+                allowed.exclude(cache.get_or_create(region, exclude))
+        masks[name] = allowed
+    return masks
+
+
+def scenario_availability(
+    available: AvailabilityStore,
+    exclusion_set_masks: dict,
+    exclusion_sets: list,
+    path: str = None,
+) -> AvailabilityStore:
+    """
+    Combines an availability with the cached masks of the exclusion sets of a scenario.
+
+    :param available: Availability the scenario is based on, it is not modified
+    :param exclusion_set_masks: Masks as returned by create_exclusion_set_masks
+    :param exclusion_sets: Names of the exclusion sets to exclude additionally
+    :param path: Optional path of a .npy file to memory-map the result to
+    """
+    result = available.copy(path)
+    for name in exclusion_sets:
+        result.and_(exclusion_set_masks[name])
+    return result
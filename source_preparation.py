@@ -0,0 +1,167 @@
+# Preparation of the vector sources before rasterizing: Many sources are much larger than the region, e.g. the borders
+# of Germany or the DVOR/VOR beacons queried for a bounding box larger than Germany. Every source is clipped to the
+# region's extent padded by the largest buffer of its constraints, transformed to the region's spatial reference system
+# and simplified with a tolerance well below the pixel size. The result is stored as a GeoPackage with a spatial index
+# and replaces the source in the constraint dicts, so buffering and rasterizing process fewer and simpler vertices.
+import hashlib
+import json
+import os
+import re
+from typing import List
+
+from osgeo import gdal, ogr
+
+from constraint_planner import group_by_source, read_source
+from mask_cache import source_signature
+
+gdal.UseExceptions()
+ogr.UseExceptions()
+
+# Extensions of the vector sources that are prepared, raster sources are used as they are
+vector_extensions = (".shp", ".gpkg")
+
+
+def _digest(description: dict) -> str:
+    return hashlib.sha256(
+        json.dumps(description, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def prepared_path(
+    region, source: str, excludes: List[dict], directory: str, tolerance, padding
+) -> str:
+    """
+    Returns the path of a prepared version of a source. The path consists of the version of the source, which changes
+    whenever the source changes, and a variant for the grid, the where clauses, the padding and the tolerance, so
+    callers preparing different constraints of the same source do not replace each other's variants.
+    """
+    version = _digest({"source": source, "signature": source_signature(source)})
+    variant = _digest(
+        {
+            "extent": list(region.extent.xyXY),
+            "srs": region.srs.ExportToWkt(),
+            "where": sorted(str(exclude.get("where")) for exclude in excludes),
+            "padding": padding,
+            "tolerance": tolerance,
+        }
+    )
+    return os.path.join(
+        directory, f"{source_prefix(source)}_{version[:16]}_{variant[:16]}.gpkg"
+    )
+
+
+def source_prefix(source: str) -> str:
+    # Sources with the same file name in different directories get different prefixes
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return f"{stem}_{hashlib.sha256(source.encode()).hexdigest()[:8]}"
+
+
+def prepare_source(
+    region,
+    source: str,
+    excludes: List[dict],
+    directory: str,
+    tolerance: float,
+    padding: float = 0,
+) -> str:
+    """
+    Clips, transforms and simplifies a vector source for the given constraint dicts and stores it as a GeoPackage.
+    An existing prepared version is reused if neither the source nor the grid changed.
+
+    :param region: geokit RegionMask or tiled_exclusion.Grid defining the extent and the spatial reference system
+    :param source: Path of the vector source
+    :param excludes: Constraint dicts using the source, their where clauses and buffers determine the fields and the
+        extent to keep
+    :param directory: Directory to store the prepared sources in
+    :param tolerance: Tolerance of the simplification in units of the region's spatial reference system
+    :param padding: Minimum distance around the region's extent to keep features in, e.g. the largest distance of a
+        distance raster
+    :return: Path of the prepared GeoPackage
+    """
+    # Keep features within the largest buffer of the extent plus a margin of two pixels for the rasterization
+    padding = max(
+        [padding, *[exclude.get("buffer") or 0 for exclude in excludes]]
+    ) + 2 * max(region.pixelWidth, region.pixelHeight)
+    path = prepared_path(region, source, excludes, directory, tolerance, padding)
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(directory, exist_ok=True)
+    memory_dataset, memory_layer = read_source(region, source, excludes, padding)
+    extent = region.extent
+    clip = ogr.CreateGeometryFromWkt(
+        "POLYGON (({0} {1}, {2} {1}, {2} {3}, {0} {3}, {0} {1}))".format(
+            extent.xMin - padding,
+            extent.yMin - padding,
+            extent.xMax + padding,
+            extent.yMax + padding,
+        )
+    )
+
+    temporary_path = f"{path}.tmp.gpkg"
+    if os.path.exists(temporary_path):
+        os.remove(temporary_path)
+    dataset = ogr.GetDriverByName("GPKG").CreateDataSource(temporary_path)
+    layer = dataset.CreateLayer(
+        "features",
+        srs=memory_layer.GetSpatialRef(),
+        geom_type=ogr.wkbUnknown,
+        options=["SPATIAL_INDEX=YES"],
+    )
+    memory_definition = memory_layer.GetLayerDefn()
+    field_names = []
+    for index in range(memory_definition.GetFieldCount()):
+        layer.CreateField(memory_definition.GetFieldDefn(index))
+        field_names.append(memory_definition.GetFieldDefn(index).GetName())
+
+    definition = layer.GetLayerDefn()
+    layer.StartTransaction()
+    written = 0
+    for feature in memory_layer:
+        geometry = feature.GetGeometryRef()
+        if not clip.Contains(geometry):
+            geometry = geometry.Intersection(clip)
+        if tolerance:
+            geometry = geometry.SimplifyPreserveTopology(tolerance)
+        if geometry is None or geometry.IsEmpty():
+            continue
+        prepared_feature = ogr.Feature(definition)
+        prepared_feature.SetGeometry(geometry)
+        for name in field_names:
+            prepared_feature.SetField(name, feature.GetField(name))
+        layer.CreateFeature(prepared_feature)
+        written += 1
+    layer.CommitTransaction()
+    dataset = None
+    os.replace(temporary_path, path)
+    print(f"Prepared {written} features of {source} in {path}")
+
+    # Remove all variants of previous versions of the source, variants of the current version are kept
+    version = os.path.basename(path)[: -len("_0123456789abcdef.gpkg")]
+    prefix = re.compile(
+        rf"^{re.escape(source_prefix(source))}_[0-9a-f]{{16}}(_[0-9a-f]{{16}})?\.gpkg$"
+    )
+    for name in os.listdir(directory):
+        if prefix.match(name) and not name.startswith(f"{version}_"):
+            os.remove(os.path.join(directory, name))
+    return path
+
+
+def prepare_sources(
+    region, excludes: List[dict], directory: str, tolerance: float, padding: float = 0
+) -> List[dict]:
+    """
+    Prepares the vector sources of constraint dicts, see prepare_source.
+
+    :return: Copies of the constraint dicts whose vector sources are replaced by the prepared GeoPackages
+    """
+    prepared = {}
+    for source, group in group_by_source(excludes).items():
+        if source.endswith(vector_extensions):
+            prepared[source] = prepare_source(
+                region, source, group, directory, tolerance, padding
+            )
+    return [
+        {**exclude, "source": prepared.get(exclude["source"], exclude["source"])}
+        for exclude in excludes
+    ]
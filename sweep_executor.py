@@ -0,0 +1,312 @@
+# Parallel executor for the scenario/buffer sweep of main.py
+# The sweep is a dependency graph: The exclusion set masks and the residential distance raster only depend on the fixed
+# excludes, every unrestricted_forest_use raster depends on them and every other scenario depends on the
+# unrestricted_forest_use raster of its buffer. The graph is scheduled on a process pool, large matrices are exchanged
+# between the processes via memory-mapped .npy files in a working directory. Availability is exchanged bit-packed, see
+# availability_store.py.
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, List, Tuple
+
+import geokit as gk
+import numpy as np
+
+from availability_store import AvailabilityStore
+from exclusion_utils import (
+    availability_mask,
+    glaes_arguments,
+    percent_available,
+    save_availability,
+)
+from mask_cache import MaskCache
+from profiling import timed_call
+from residential_distance import buffered_availability, distance_raster
+from scenario_masks import create_exclusion_set_masks, scenario_availability
+
+
+@dataclass
+class Task:
+    # Unique key of the task, also used as key of its result
+    key: Hashable
+    function: Callable
+    args: Tuple = ()
+    # Keys of the tasks that have to be finished before this task can start
+    dependencies: List[Hashable] = field(default_factory=list)
+    # Estimated peak memory usage in bytes
+    memory: int = 0
+
+
+def run_tasks(
+    tasks: List[Task],
+    workers: int,
+    memory_budget: int = None,
+    initializer: Callable = None,
+    initargs: Tuple = (),
+    timeline=None,
+) -> Dict[Hashable, Any]:
+    """
+    Runs a dependency graph of tasks on a process pool. A task is started as soon as all of its dependencies are
+    finished, a worker is idle and its estimated memory fits into the memory budget together with all running tasks.
+    A task exceeding the memory budget on its own is only started when no other task is running.
+
+    :param tasks: Tasks to run, the results are collected in the main process only
+    :param workers: Maximum number of worker processes
+    :param memory_budget: Maximum sum of the estimated memory of all running tasks in bytes, None for no limit
+    :param initializer: Callable to initialize each worker process with
+    :param initargs: Arguments of the initializer
+    :param timeline: Optional profiling.Timeline the measurements of every task are added to
+    :return: Dict of task key -> return value of the task's function
+    """
+    pending = {task.key: task for task in tasks}
+    for task in tasks:
+        unknown = [key for key in task.dependencies if key not in pending]
+        if unknown:
+            raise ValueError(f"Task {task.key} depends on unknown tasks {unknown}")
+
+    results = {}
+    running = {}
+    running_memory = 0
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=initializer, initargs=initargs
+    ) as executor:
+        while pending or running:
+            for key, task in list(pending.items()):
+                if len(running) >= workers:
+                    break
+                if any(dependency not in results for dependency in task.dependencies):
+                    continue
+                if (
+                    running
+                    and memory_budget is not None
+                    and running_memory + task.memory > memory_budget
+                ):
+                    continue
+                if timeline is None:
+                    future = executor.submit(task.function, *task.args)
+                else:
+                    future = executor.submit(
+                        timed_call, task.function, task.args, task=repr(task.key)
+                    )
+                running[future] = task
+                running_memory += task.memory
+                del pending[key]
+
+            if not running:
+                raise RuntimeError(
+                    f"Tasks {list(pending)} can not be scheduled, check their dependencies"
+                )
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                task = running.pop(future)
+                running_memory -= task.memory
+                if future.exception() is not None:
+                    # Pending tasks are never submitted, submitted tasks that did not start yet are cancelled here, as
+                    # cancel_futures of Executor.shutdown requires Python 3.9. The executor waits for the started ones
+                    for other in running:
+                        other.cancel()
+                # Raises the exception of a failed task
+                result = future.result()
+                if timeline is not None:
+                    result, record = result
+                    timeline.extend([record])
+                results[task.key] = result
+                print(f"Finished {task.key}")
+
+    return results
+
+
+# State of a worker process, set by init_worker
+_worker_region = None
+_worker_options = None
+
+
+def init_worker(region_options: dict, working_directory: str):
+    """
+    Initializes a worker process with a lightweight RegionMask, whose mask is memory-mapped from the working directory.
+
+    :param region_options: srs, pixelRes and where of the region as well as its extent as (xMin, yMin, xMax, yMax)
+    :param working_directory: Directory containing the .npy files shared between the processes
+    """
+    global _worker_region, _worker_options
+    _worker_options = {**region_options, "working_directory": working_directory}
+    mask = np.load(os.path.join(working_directory, "region_mask.npy"), mmap_mode="r")
+    extent = gk.Extent(*region_options["extent"], srs=region_options["srs"])
+    _worker_region = gk.RegionMask.fromMask(extent, mask)
+
+
+def _shared_path(name: str) -> str:
+    return os.path.join(_worker_options["working_directory"], f"{name}.npy")
+
+
+def _load_shared(name: str) -> np.ndarray:
+    return np.load(_shared_path(name), mmap_mode="r")
+
+
+def _load_store(name: str) -> AvailabilityStore:
+    return AvailabilityStore.open(_shared_path(name), _worker_region.mask.shape[1])
+
+
+def exclusion_set_task(name: str, excludes: list, cache_options: dict = None):
+    cache = MaskCache(**cache_options) if cache_options else None
+    masks = create_exclusion_set_masks(_worker_region, {name: excludes}, cache)
+    masks[name].save(_shared_path(f"exclusion_set_{name}"))
+
+
+def distance_task(residential_areas: list, max_distance: float):
+    distance = distance_raster(_worker_region, residential_areas, max_distance)
+    np.save(_shared_path("residential_distance"), distance)
+
+
+def unrestricted_task(
+    buffer: float,
+    mode: str,
+    residential_areas: list,
+    region_source: str,
+    initial_result_path: str,
+    output_path: str,
+    packing: str = "uint8",
+) -> float:
+    store_path = _shared_path(f"unrestricted_{buffer}")
+    if mode == "distance_raster":
+        store = buffered_availability(
+            _load_store("fixed_availability"),
+            _load_shared("residential_distance"),
+            buffer,
+            store_path,
+        )
+    else:
+        from glaes import ExclusionCalculator
+
+        ec = ExclusionCalculator(
+            region_source,
+            srs=_worker_options["srs"],
+            pixelRes=_worker_options["pixelRes"],
+            where=_worker_options["where"],
+            initialValue=initial_result_path,
+        )
+        for residential_exclude in residential_areas:
+            ec.excludeVectorType(
+                **{**glaes_arguments(residential_exclude), "buffer": buffer}
+            )
+        store = AvailabilityStore.from_array(availability_mask(ec), store_path)
+    store.flush()
+    available = store.to_array()
+    save_availability(_worker_region, available, output_path, packing)
+    return percent_available(_worker_region, available)
+
+
+def scenario_task(
+    buffer: float, exclusion_sets: list, output_path: str, packing: str = "uint8"
+) -> float:
+    available = scenario_availability(
+        _load_store(f"unrestricted_{buffer}"),
+        {name: _load_store(f"exclusion_set_{name}") for name in exclusion_sets},
+        exclusion_sets,
+    ).to_array()
+    save_availability(_worker_region, available, output_path, packing)
+    return percent_available(_worker_region, available)
+
+
+def prepare_working_directory(ec, working_directory: str):
+    """Writes the region mask and the availability of the fixed excludes to the working directory."""
+    os.makedirs(working_directory, exist_ok=True)
+    np.save(os.path.join(working_directory, "region_mask.npy"), ec.region.mask)
+    AvailabilityStore.from_array(
+        availability_mask(ec), os.path.join(working_directory, "fixed_availability.npy")
+    ).flush()
+
+
+def create_sweep_tasks(
+    pixels: int,
+    buffers,
+    scenarios: list,
+    exclusion_sets: dict,
+    residential_areas: list,
+    mode: str,
+    region_source: str,
+    initial_result_path: str,
+    output_pattern: str,
+    cache_options: dict = None,
+    packing: str = "uint8",
+) -> List[Task]:
+    """
+    Creates the dependency graph of the sweep.
+
+    :param pixels: Number of pixels of the grid, used to estimate the memory usage of the tasks
+    :param buffers: Distances to residential buildings to evaluate
+    :param scenarios: List of (scenario name, exclusion set names) as in main.py
+    :param exclusion_sets: Dict of exclusion set name -> list of constraint dicts
+    :param residential_areas: Constraint dicts of the residential areas
+    :param mode: "distance_raster" or "vector", see main.residential_buffer_mode
+    :param region_source: Path of the region's vector source, required for the "vector" mode
+    :param initial_result_path: Path of the result of the fixed excludes, required for the "vector" mode
+    :param output_pattern: Format string of the output paths with the fields buffer and scenario
+    :param cache_options: Keyword arguments of a MaskCache for the exclusion set masks, None to disable caching
+    :param packing: Packing of the scenario rasters, "uint8" or "bit", see cog.py
+    :return: Tasks, the keys of the scenario tasks are (buffer, scenario name)
+    """
+    # Rough peak memory per pixel: GLAES uses float matrices for rasterizing, the distance transform uses float64
+    # distances and int32 indices, combining bit-packed availability requires an eighth of a byte only. Writing a raster
+    # unpacks it and copies it to memory together with its overviews
+    tasks = [
+        Task(
+            key=("exclusion_set", name),
+            function=exclusion_set_task,
+            args=(name, excludes, cache_options),
+            memory=10 * pixels,
+        )
+        for name, excludes in exclusion_sets.items()
+    ]
+    if mode == "distance_raster":
+        tasks.append(
+            Task(
+                key="residential_distance",
+                function=distance_task,
+                args=(residential_areas, max(buffers)),
+                memory=6 * pixels,
+            )
+        )
+
+    # The scenario without additional exclusion sets, i.e. unrestricted_forest_use, is the basis of all others
+    base_scenario = next(name for name, sets in scenarios if not sets)
+    for buffer in buffers:
+        for name, scenario_exclusion_sets in scenarios:
+            output_path = output_pattern.format(buffer=buffer, scenario=name)
+            if not scenario_exclusion_sets:
+                tasks.append(
+                    Task(
+                        key=(buffer, name),
+                        function=unrestricted_task,
+                        args=(
+                            buffer,
+                            mode,
+                            residential_areas,
+                            region_source,
+                            initial_result_path,
+                            output_path,
+                            packing,
+                        ),
+                        dependencies=(
+                            ["residential_distance"]
+                            if mode == "distance_raster"
+                            else []
+                        ),
+                        memory=(5 if mode == "distance_raster" else 14) * pixels,
+                    )
+                )
+            else:
+                tasks.append(
+                    Task(
+                        key=(buffer, name),
+                        function=scenario_task,
+                        args=(buffer, scenario_exclusion_sets, output_path, packing),
+                        dependencies=[
+                            (buffer, base_scenario),
+                            *[("exclusion_set", s) for s in scenario_exclusion_sets],
+                        ],
+                        memory=4 * pixels,
+                    )
+                )
+    return tasks
@@ -0,0 +1,201 @@
+# Tiled exclusion engine: Splits the grid of the region into tiles, applies the excludes to every tile independently and
+# in parallel and stitches the tiles into a single GeoTIFF. Each tile carries a halo equal to the largest buffer of the
+# excludes, so features outside of a tile still affect it. The peak memory depends on the tile size, not on the size of
+# the region.
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Tuple
+
+import geokit as gk
+import numpy as np
+from osgeo import gdal, ogr, osr
+
+from cog import convert_to_cog
+from constraint_planner import plan_constraint_masks
+from exclusion_utils import indicate, subgrid
+
+gdal.UseExceptions()
+
+
+class Grid:
+    """Lightweight description of the grid of a region, which can be used with subgrid without creating its mask."""
+
+    def __init__(self, extent: Tuple[float, float, float, float], pixel_size, srs):
+        self.extent = gk.Extent(*extent, srs=srs)
+        self.srs = self.extent.srs
+        self.pixelWidth = pixel_size
+        self.pixelHeight = pixel_size
+        self.shape = (
+            round((extent[3] - extent[1]) / pixel_size),
+            round((extent[2] - extent[0]) / pixel_size),
+        )
+
+
+def region_extent(source: str, srs: int, pixel_size, where: str = None):
+    """
+    Calculates the extent of the region in the given srs, fitted to multiples of the pixel size like geokit does, without
+    rasterizing the region.
+    """
+    dataset = ogr.Open(source)
+    layer = dataset.GetLayer()
+    layer.SetAttributeFilter(where)
+    target_srs = osr.SpatialReference()
+    target_srs.ImportFromEPSG(srs)
+    if hasattr(target_srs, "SetAxisMappingStrategy"):
+        target_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    x_min = y_min = math.inf
+    x_max = y_max = -math.inf
+    for feature in layer:
+        geometry = feature.GetGeometryRef().Clone()
+        geometry.TransformTo(target_srs)
+        feature_x_min, feature_x_max, feature_y_min, feature_y_max = (
+            geometry.GetEnvelope()
+        )
+        x_min, y_min = min(x_min, feature_x_min), min(y_min, feature_y_min)
+        x_max, y_max = max(x_max, feature_x_max), max(y_max, feature_y_max)
+    return (
+        math.floor(x_min / pixel_size) * pixel_size,
+        math.floor(y_min / pixel_size) * pixel_size,
+        math.ceil(x_max / pixel_size) * pixel_size,
+        math.ceil(y_max / pixel_size) * pixel_size,
+    )
+
+
+def create_tiles(
+    shape: Tuple[int, int], tile_size: int
+) -> List[Tuple[int, int, int, int]]:
+    """Splits a grid of the given shape into tiles of (row, col, rows, cols)."""
+    rows, cols = shape
+    return [
+        (row, col, min(tile_size, rows - row), min(tile_size, cols - col))
+        for row in range(0, rows, tile_size)
+        for col in range(0, cols, tile_size)
+    ]
+
+
+def process_tile(
+    grid_options: dict,
+    tile: Tuple[int, int, int, int],
+    excludes: List[dict],
+    halo: int,
+    region_source: str,
+    region_where: str = None,
+    initial_value: str = None,
+):
+    """
+    Applies the excludes to a single tile.
+
+    :param grid_options: Keyword arguments of Grid
+    :param tile: (row, col, rows, cols) of the tile within the grid
+    :param excludes: Constraint dicts as defined in main.py
+    :param halo: Width of the halo around the tile in pixels
+    :param region_source: Path of the region's vector source
+    :param region_where: Where clause selecting the region
+    :param initial_value: Optional path of a previous result on the same grid, e.g. saved by ExclusionCalculator.save
+    :return: Tuple of the tile, its availability matrix (100 for available, 0 for excluded, 255 outside the region),
+        the number of available pixels and the number of pixels within the region
+    """
+    grid = Grid(**grid_options)
+    row, col, rows, cols = tile
+    core = subgrid(grid, row, col, rows, cols)
+    mask = indicate(core, {"source": region_source, "where": region_where})
+    if not mask.any():
+        return tile, np.full((rows, cols), 255, dtype=np.uint8), 0, 0
+
+    available = mask.copy()
+    if initial_value is not None:
+        available &= gdal.Open(initial_value).ReadAsArray(col, row, cols, rows) > 50
+    haloed = subgrid(grid, row - halo, col - halo, rows + 2 * halo, cols + 2 * halo)
+    for exclude, exclude_mask in plan_constraint_masks(haloed, excludes):
+        available &= ~exclude_mask[halo : halo + rows, halo : halo + cols]
+
+    data = np.where(available, 100, 0).astype(np.uint8)
+    data[~mask] = 255
+    return tile, data, np.count_nonzero(available), np.count_nonzero(mask)
+
+
+def run_tiled(
+    region_source: str,
+    excludes: List[dict],
+    output: str,
+    srs: int,
+    pixelRes,
+    where: str = None,
+    initial_value: str = None,
+    tile_size: int = 4096,
+    workers: int = None,
+) -> float:
+    """
+    Applies the excludes to the region tile by tile in parallel and writes the result to a cloud-optimized GeoTIFF in the
+    same format as ExclusionCalculator.save.
+
+    :param region_source: Path of the region's vector source
+    :param excludes: Constraint dicts as defined in main.py
+    :param output: Path of the resulting GeoTIFF
+    :param srs: EPSG code of the grid
+    :param pixelRes: Pixel size of the grid
+    :param where: Where clause selecting the region
+    :param initial_value: Optional path of a previous result on the same grid
+    :param tile_size: Number of rows and columns of each tile, without the halo
+    :param workers: Number of worker processes, defaults to the number of CPUs
+    :return: Percentage of the region that remains available, like ExclusionCalculator.percentAvailable
+    """
+    grid_options = {
+        "extent": region_extent(region_source, srs, pixelRes, where),
+        "pixel_size": pixelRes,
+        "srs": srs,
+    }
+    grid = Grid(**grid_options)
+    rows, cols = grid.shape
+    buffers = [exclude.get("buffer") or 0 for exclude in excludes]
+    halo = int(math.ceil(max(buffers, default=0) / pixelRes)) + 1
+    tiles = create_tiles(grid.shape, tile_size)
+    print(
+        f"Processing {len(tiles)} tiles of {tile_size} pixels with a halo of {halo} pixels"
+    )
+
+    # Tiles are written to a temporary GeoTIFF, which is converted to a cloud-optimized GeoTIFF when all are done
+    temporary_output = f"{output}.tmp.tif"
+    dataset = gdal.GetDriverByName("GTiff").Create(
+        temporary_output,
+        cols,
+        rows,
+        1,
+        gdal.GDT_Byte,
+        options=["COMPRESS=DEFLATE", "TILED=YES", "BIGTIFF=IF_SAFER"],
+    )
+    dataset.SetGeoTransform(
+        (grid.extent.xMin, pixelRes, 0, grid.extent.yMax, 0, -pixelRes)
+    )
+    dataset.SetProjection(grid.srs.ExportToWkt())
+    band = dataset.GetRasterBand(1)
+    band.SetNoDataValue(255)
+
+    available_pixels = 0
+    region_pixels = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                process_tile,
+                grid_options,
+                tile,
+                excludes,
+                halo,
+                region_source,
+                where,
+                initial_value,
+            )
+            for tile in tiles
+        ]
+        for future in as_completed(futures):
+            (row, col, _, _), data, tile_available, tile_region = future.result()
+            band.WriteArray(data, xoff=col, yoff=row)
+            available_pixels += tile_available
+            region_pixels += tile_region
+            print(f"Finished tile at row {row}, column {col}")
+    dataset = None
+    convert_to_cog(temporary_output, output)
+    os.remove(temporary_output)
+
+    return 100 * available_pixels / region_pixels
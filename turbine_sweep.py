@@ -0,0 +1,222 @@
+# Turbine sweep: Evaluates the fixed excludes for several turbine types at once. Only the constraints whose buffers are
+# expressions of the turbine parameters (e.g. "3 * height" or "40 + radius") change between turbines. All other fixed
+# constraints are excluded once. The constraints sharing a buffer expression are rasterized into one distance raster
+# (see residential_distance.py), which is thresholded with the buffer of every turbine instead of buffering the vector
+# sources again. Like the distance raster of the sweep, thresholding approximates the buffers up to half a pixel
+# diagonal.
+import hashlib
+import json
+import os
+from contextlib import nullcontext
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from availability_store import AvailabilityStore
+from catalog import buffer_expressions, evaluate, expression_variables, load_catalog
+from mask_cache import source_signature
+from residential_distance import distance_raster
+
+
+def split_turbine_dependent(
+    constraint_sets: Dict[str, List[dict]],
+    expressions: Dict[str, list],
+    set_names: List[str],
+    turbine_parameters: List[str],
+) -> Tuple[List[dict], Dict[str, List[dict]]]:
+    """
+    Splits the constraints of some constraint sets by whether their buffer depends on the turbine.
+
+    :param constraint_sets: Constraint sets as returned by load_catalog
+    :param expressions: Unevaluated buffers as returned by buffer_expressions
+    :param set_names: Names of the constraint sets to split, e.g. the fixed constraint sets
+    :param turbine_parameters: Names of the turbine parameters, e.g. ["hub_height", "diameter", "radius", "height"]
+    :return: Tuple of the independent constraint dicts and a dict of buffer expression -> dependent constraint dicts
+    """
+    independent = []
+    dependent = {}
+    for name in set_names:
+        for constraint, expression in zip(constraint_sets[name], expressions[name]):
+            if set(expression_variables(expression)) & set(turbine_parameters):
+                dependent.setdefault(expression, []).append(constraint)
+            else:
+                independent.append(constraint)
+    return independent, dependent
+
+
+def distance_field_path(
+    region, expression: str, excludes: List[dict], max_distance: float, directory: str
+) -> str:
+    """Returns the path of a distance raster, which changes whenever its sources, the grid or max_distance change."""
+    description = {
+        "expression": expression,
+        "sources": [
+            [
+                exclude["source"],
+                source_signature(exclude["source"]),
+                exclude.get("where"),
+            ]
+            for exclude in excludes
+        ],
+        "extent": list(region.extent.xyXY),
+        "srs": region.srs.ExportToWkt(),
+        "pixel_size": [region.pixelWidth, region.pixelHeight],
+        "max_distance": max_distance,
+    }
+    key = hashlib.sha256(
+        json.dumps(description, sort_keys=True, default=str).encode()
+    ).hexdigest()
+    return os.path.join(directory, f"distance_{key[:16]}.npy")
+
+
+def distance_fields(
+    region,
+    dependent: Dict[str, List[dict]],
+    max_distances: Dict[str, float],
+    directory: str,
+    timeline=None,
+) -> Dict[str, str]:
+    """
+    Calculates a distance raster for every buffer expression, reusing those of previous runs.
+
+    :param region: geokit RegionMask defining the grid
+    :param dependent: Dict of buffer expression -> constraint dicts, see split_turbine_dependent
+    :param max_distances: Dict of buffer expression -> largest buffer of all turbines
+    :param directory: Directory to store the distance rasters in
+    :param timeline: Optional profiling.Timeline
+    :return: Dict of buffer expression -> path of the distance raster (.npy)
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for expression, excludes in dependent.items():
+        path = distance_field_path(
+            region, expression, excludes, max_distances[expression], directory
+        )
+        if not os.path.exists(path):
+            print(f"Calculating distance raster for buffer {expression}")
+            with (
+                timeline.step("distance raster", buffer=expression)
+                if timeline
+                else nullcontext()
+            ):
+                distance = distance_raster(region, excludes, max_distances[expression])
+                np.save(path, distance)
+                del distance
+        paths[expression] = path
+    return paths
+
+
+def turbine_availability(
+    independent: AvailabilityStore,
+    fields: Dict[str, str],
+    variables: Dict[str, float],
+) -> AvailabilityStore:
+    """
+    Derives the availability of a turbine by thresholding the distance rasters with its buffers.
+
+    :param independent: Availability after excluding the constraints independent of the turbine, it is not modified
+    :param fields: Dict of buffer expression -> path of the distance raster
+    :param variables: Evaluated turbine parameters, e.g. load_catalog(turbine=...)["turbine"]
+    """
+    available = independent.copy()
+    for expression, path in fields.items():
+        available.threshold(
+            np.load(path, mmap_mode="r"), evaluate(expression, variables)
+        )
+    return available
+
+
+if __name__ == "__main__":
+    from exclusion_utils import availability_mask, percent_available, save_availability
+    from main import (
+        catalog,
+        catalog_path,
+        create_exclusion_calculator,
+        create_timeline,
+        exclude_masks,
+        prepare_excludes,
+        raster_size,
+        save_timeline,
+        turbine_field_directory,
+        turbine_results_path,
+        turbine_specs,
+    )
+
+    timeline = create_timeline()
+    fixed_sets = catalog["fixed_constraint_sets"]
+    expressions = buffer_expressions(catalog_path)
+    turbine_parameters = list(catalog["turbine"])
+    _, dependent = split_turbine_dependent(
+        catalog["constraint_sets"], expressions, fixed_sets, turbine_parameters
+    )
+    turbines = {
+        spec["name"]: load_catalog(
+            catalog_path,
+            turbine={key: value for key, value in spec.items() if key != "name"},
+        )["turbine"]
+        for spec in turbine_specs
+    }
+    max_distances = {
+        expression: max(
+            evaluate(expression, variables) for variables in turbines.values()
+        )
+        for expression in dependent
+    }
+
+    ec = create_exclusion_calculator()
+    region = ec.region
+    # Every source is prepared once for all of its fixed constraints, padded by the largest buffer of all turbines, and
+    # split into the independent and dependent constraints afterward. Preparing the groups separately would prepare
+    # sources like sie02_f.shp once per group
+    fixed_constraints = [
+        constraint
+        for name in fixed_sets
+        for constraint in catalog["constraint_sets"][name]
+    ]
+    with timeline.step("prepare sources") if timeline else nullcontext():
+        prepared = iter(
+            prepare_excludes(
+                region,
+                fixed_constraints,
+                padding=max(max_distances.values(), default=0),
+            )
+        )
+    prepared_sets = {
+        name: [next(prepared) for _ in catalog["constraint_sets"][name]]
+        for name in fixed_sets
+    }
+    independent, dependent = split_turbine_dependent(
+        prepared_sets, expressions, fixed_sets, turbine_parameters
+    )
+
+    print(
+        f"Running ExclusionCalculator with {len(independent)} turbine independent excludes"
+    )
+    exclude_masks(ec, independent, timeline, prepare=False)
+    independent_available = AvailabilityStore.from_array(availability_mask(ec))
+    del ec
+
+    fields = distance_fields(
+        region, dependent, max_distances, turbine_field_directory, timeline
+    )
+
+    rows = []
+    for name, variables in turbines.items():
+        print(f"Evaluating turbine {name}")
+        with timeline.step("turbine", turbine=name) if timeline else nullcontext():
+            available = turbine_availability(
+                independent_available, fields, variables
+            ).to_array()
+            save_availability(
+                region, available, f"./output/ByWind_{raster_size}_turbine_{name}.tif"
+            )
+        rows.append(
+            {
+                "turbine": name,
+                **variables,
+                "percent_available": percent_available(region, available),
+            }
+        )
+    pd.DataFrame(rows).set_index("turbine").to_csv(turbine_results_path)
+    save_timeline(timeline, "turbines")
@@ -0,0 +1,208 @@
+# Paged WFS 2.0 client for large layers, e.g. the forest functions mapping in protected-forest-data-acquisition.py
+# Every layer is requested in pages of COUNT features via STARTINDEX, so server limits on the number of features per
+# response do not truncate it. The features are sorted by their object id, so the pages neither overlap nor miss
+# features.
+# Pages of all layers are fetched concurrently, cached on disk and appended to the output file in order as soon as they
+# arrive, so only a few pages are held in memory and an interrupted run resumes with the missing pages.
+import hashlib
+import json
+import math
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import geopandas as gpd
+import pyogrio
+import requests
+
+from lod2_download import create_session
+
+_number_matched = re.compile(rb'numberMatched="(\d+)"')
+_number_returned = re.compile(rb'numberReturned="(\d+)"')
+
+
+def get_feature(
+    session: requests.Session,
+    url: str,
+    parameters: Dict[str, str],
+    retries: int = 5,
+    backoff: float = 1.0,
+    timeout: float = 300,
+) -> bytes:
+    """Sends a GetFeature request and returns the response, retrying failed requests and exception reports."""
+    for attempt in range(retries + 1):
+        try:
+            response = session.get(
+                url,
+                params={"SERVICE": "WFS", "REQUEST": "GetFeature", **parameters},
+                timeout=timeout,
+            )
+            response.raise_for_status()
+            if b"ExceptionReport" in response.content[:1000]:
+                raise ValueError(response.text[:1000])
+            return response.content
+        except (requests.exceptions.RequestException, ValueError) as e:
+            if attempt == retries:
+                raise
+            wait = backoff * 2**attempt
+            print(f"GetFeature {parameters} failed, retrying in {wait}s. Error: {e}")
+            time.sleep(wait)
+
+
+def feature_count(
+    session: requests.Session, url: str, parameters: Dict[str, str]
+) -> int:
+    """Returns the number of features of a layer via a GetFeature request with RESULTTYPE=hits."""
+    content = get_feature(session, url, {**parameters, "RESULTTYPE": "hits"})
+    match = _number_matched.search(content)
+    if match is None:
+        raise ValueError(
+            f"{url} did not report the number of features: {content[:200]}"
+        )
+    return int(match.group(1))
+
+
+def page_path(
+    cache_dir: str,
+    url: str,
+    parameters: Dict[str, str],
+    start_index: int,
+    page_size: int,
+) -> str:
+    """Returns the path of a cached page, the pages of different servers or parameters are cached separately."""
+    digest = hashlib.sha256(
+        json.dumps({"url": url, "parameters": parameters}, sort_keys=True).encode()
+    ).hexdigest()
+    layer = re.sub(r"\W", "_", parameters["TYPENAMES"])
+    return os.path.join(
+        cache_dir, f"{layer}_{digest[:16]}", f"{start_index:09d}_{page_size}.gml"
+    )
+
+
+def fetch_page(
+    session: requests.Session,
+    url: str,
+    parameters: Dict[str, str],
+    start_index: int,
+    page_size: int,
+    cache_dir: str,
+) -> str:
+    """
+    Fetches one page of a layer unless it is cached already.
+
+    :return: Path of the cached page
+    """
+    path = page_path(cache_dir, url, parameters, start_index, page_size)
+    if os.path.exists(path):
+        return path
+    content = get_feature(
+        session,
+        url,
+        {**parameters, "COUNT": str(page_size), "STARTINDEX": str(start_index)},
+    )
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Pages are written to a temporary file first, so an interrupted run never leaves incomplete pages in the cache
+    with open(f"{path}.tmp", "wb") as file:
+        file.write(content)
+    os.replace(f"{path}.tmp", path)
+    return path
+
+
+def returned_features(path: str) -> int:
+    """Returns the number of features of a cached page."""
+    with open(path, "rb") as file:
+        match = _number_returned.search(file.read(2000))
+    if match is not None:
+        return int(match.group(1))
+    return pyogrio.read_info(path)["features"]
+
+
+def download_layers(
+    url: str,
+    type_names: List[str],
+    outputs: List[str],
+    parameters: Dict[str, str] = None,
+    page_size: int = 1000,
+    sort_by: str = "OBJECTID",
+    workers: int = 4,
+    cache_dir: str = "./downloads/wfs",
+    session: requests.Session = None,
+):
+    """
+    Downloads layers of a WFS page by page and writes each layer to a file.
+
+    :param url: URL of the WFS
+    :param type_names: Names of the layers (feature types)
+    :param outputs: Paths of the output files of the layers, e.g. Shapefiles
+    :param parameters: Further parameters of the GetFeature requests, e.g. {"VERSION": "2.0.0", "SRSNAME": ...}
+    :param page_size: Number of features per page, at most the limit of the server
+    :param sort_by: Object id field to sort the features by, servers only guarantee the same order of the features for
+        every page if it is sorted. None to keep the order of the server
+    :param workers: Maximum number of concurrent requests
+    :param cache_dir: Directory to cache the pages in, remove it to download the layers again
+    :param session: Session to send the requests with, a pooled session is created if None
+    """
+    parameters = {"VERSION": "2.0.0", **(parameters or {})}
+    if sort_by is not None:
+        parameters["SORTBY"] = sort_by
+    session = session or create_session(workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        layer_parameters = [
+            {**parameters, "TYPENAMES": type_name} for type_name in type_names
+        ]
+        counts = list(
+            executor.map(
+                lambda layer: feature_count(session, url, layer), layer_parameters
+            )
+        )
+        # Submit the pages of all layers at once, they are written layer by layer and page by page
+        pages = [
+            [
+                executor.submit(
+                    fetch_page,
+                    session,
+                    url,
+                    layer,
+                    start_index,
+                    page_size,
+                    cache_dir,
+                )
+                for start_index in range(0, count, page_size)
+            ]
+            for layer, count in zip(layer_parameters, counts)
+        ]
+        for type_name, output, count, futures in zip(
+            type_names, outputs, counts, pages
+        ):
+            print(
+                f"Downloading {count} features of {type_name} in {math.ceil(count / page_size)} pages"
+            )
+            if not futures:
+                # An empty layer has no page to take the CRS from, so it is taken from the request
+                if "SRSNAME" not in parameters:
+                    print(
+                        f"{type_name} is empty, {output} has no CRS as no SRSNAME was requested"
+                    )
+                gpd.GeoDataFrame(
+                    geometry=gpd.GeoSeries([], crs=parameters.get("SRSNAME"))
+                ).to_file(output)
+            written = 0
+            for index, future in enumerate(futures):
+                path = future.result()
+                returned = returned_features(path)
+                if returned < page_size and index < len(futures) - 1:
+                    os.remove(path)
+                    raise ValueError(
+                        f"{url} returned {returned} features per page, set page_size to at most {returned}"
+                    )
+                page = gpd.read_file(path)
+                # The first page creates the output, all further pages are appended
+                page.to_file(output, mode="a" if index else "w")
+                written += len(page)
+            if written != count:
+                raise ValueError(
+                    f"Expected {count} features of {type_name}, got {written}"
+                )
+            print(f"Wrote {written} features of {type_name} to {output}")
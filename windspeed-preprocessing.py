@@ -1,7 +1,10 @@
 # Convert WMS image from the Bavarian Windatlas to binary GeoTIFFs indicating whether wind speed is above a given
-# threshold, e.g., 4.5 or 4.8 m/s
+# threshold, e.g., 4.5 or 4.8 m/s, and to a GeoTIFF of wind speed classes
 # For further info on the Bavarian Windatlas WMS see:
 # https://www.lfu.bayern.de/umweltdaten/geodatendienste/index_detail.htm?id=0cdaec03-b7ce-4333-8288-53663eb1da35&profil=WMS
+import os
+from contextlib import ExitStack
+
 import numpy as np
 import rasterio
 
@@ -10,61 +13,92 @@ import rasterio
 # using the filename below and move it to the input path below
 input_path = "./downloads/windspeed/windspeed_120.tif"
 output_path = "./downloads/windspeed/"
+# The masks are written to the input directory read by the catalog, e.g. Windgeschwindigkeit/windspeed_120_4.5m.tif
+mask_path = "./input/Windgeschwindigkeit/"
+os.makedirs(mask_path, exist_ok=True)
 
-# Create a blocklist for wind speeds up to 4.5 m/s
+# Wind speed classes of the legend, each given as the upper bound of the class in m/s and its colour
 # See the legend for further details
 # https://www.lfu.bayern.de/gdi/legende/energieatlas/windatlas2021/windgeschwindigkeit_120m.png
-blocklist_45 = [
-    (0, 15, 135),  # bis 3.5 m/s
-    (3, 42, 149),  # > 3.5 - 3.6 m/s
-    (7, 70, 164),  # > 3.6 - 3.7 m/s
-    (10, 97, 179),  # > 3.7 - 3.8 m/s
-    (14, 125, 194),  # > 3.8 - 3.9 m/s
-    (8, 156, 208),  # > 3.9 - 4.0 m/s
-    (0, 187, 238),  # > 4.0 - 4.1 m/s
-    (82, 232, 221),  # > 4.1 - 4.2 m/s
-    (36, 210, 161),  # > 4.2 - 4.3 m/s
-    (45, 195, 137),  # > 4.3 - 4.4 m/s
-    (54, 180, 115),  # > 4.4 - 4.5 m/s
-]
-# Create a blocklist for wind speeds up to 4.8 m/s by extending blocklist for wind speeds up to 4.5 m/s
-blocklist_48 = blocklist_45 + [
-    (110, 195, 53),  # > 4.5 - 4.6 m/s
-    (150, 205, 15),  # > 4.6 - 4.7 m/s
-    (180, 215, 0),  # > 4.7 - 4.8 m/s
+# Colours not listed here belong to classes above 4.8 m/s
+windspeed_classes = [
+    (3.5, (0, 15, 135)),  # bis 3.5 m/s
+    (3.6, (3, 42, 149)),  # > 3.5 - 3.6 m/s
+    (3.7, (7, 70, 164)),  # > 3.6 - 3.7 m/s
+    (3.8, (10, 97, 179)),  # > 3.7 - 3.8 m/s
+    (3.9, (14, 125, 194)),  # > 3.8 - 3.9 m/s
+    (4.0, (8, 156, 208)),  # > 3.9 - 4.0 m/s
+    (4.1, (0, 187, 238)),  # > 4.0 - 4.1 m/s
+    (4.2, (82, 232, 221)),  # > 4.1 - 4.2 m/s
+    (4.3, (36, 210, 161)),  # > 4.2 - 4.3 m/s
+    (4.4, (45, 195, 137)),  # > 4.3 - 4.4 m/s
+    (4.5, (54, 180, 115)),  # > 4.4 - 4.5 m/s
+    (4.6, (110, 195, 53)),  # > 4.5 - 4.6 m/s
+    (4.7, (150, 205, 15)),  # > 4.6 - 4.7 m/s
+    (4.8, (180, 215, 0)),  # > 4.7 - 4.8 m/s
 ]
 
-blocklists = [("4.5m", blocklist_45), ("4.8m", blocklist_48)]
+# Create a mask for each threshold, indicating whether the wind speed is above the threshold
+thresholds = [4.5, 4.8]
 
+# The class raster stores the upper bound of each class in 0.1 m/s, 0 indicates classes above 4.8 m/s
+class_unknown = 0
 
-with rasterio.Env():
-    with rasterio.open(input_path) as src:
-        r = src.read(1)
-        g = src.read(2)
-        b = src.read(3)
 
-        height, width = r.shape
+def pack_rgb(r: np.ndarray, g: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Packs RGB values into a single integer key per pixel."""
+    return (r.astype(np.uint32) << 16) | (g.astype(np.uint32) << 8) | b
 
-        for name, blocklist in blocklists:
-            # Initially create a mask of ones
-            mask = np.ones((height, width), dtype=np.uint8)
 
-            # Apply blocklist
-            for color in blocklist:
-                r_val, g_val, b_val = color
-                match = (r == r_val) & (g == g_val) & (b == b_val)
-                mask[match] = 0  # Set mask to 0 where blocklist matches
+# Lookup table mapping packed RGB keys to wind speed classes
+class_lut = np.full(2**24, class_unknown, dtype=np.uint8)
+for upper_bound, (r_val, g_val, b_val) in windspeed_classes:
+    class_lut[pack_rgb(np.uint8(r_val), np.uint8(g_val), np.uint8(b_val))] = round(
+        upper_bound * 10
+    )
 
-            # show(mask)
+# Lookup tables mapping wind speed classes to masks of ones, indicating areas above the threshold
+max_upper_bound = max(upper_bound for upper_bound, _ in windspeed_classes)
+mask_luts = {}
+for threshold in thresholds:
+    if threshold > max_upper_bound:
+        raise ValueError(
+            f"Threshold {threshold} m/s exceeds the highest known class ({max_upper_bound} m/s)"
+        )
+    mask_lut = np.ones(256, dtype=np.uint8)
+    for upper_bound, _ in windspeed_classes:
+        if upper_bound <= threshold:
+            mask_lut[round(upper_bound * 10)] = 0
+    mask_luts[threshold] = mask_lut
+
+
+with rasterio.Env():
+    with rasterio.open(input_path) as src, ExitStack() as stack:
+        # Prepare output profile
+        profile = src.profile.copy()
+        # Only one band is required
+        profile.update({"count": 1})
 
-            # Prepare output profile
-            profile = src.profile.copy()
-            # Only one band is required
-            profile.update({"count": 1})
+        class_dst = stack.enter_context(
+            rasterio.open(f"{output_path}windspeed_120_classes.tif", "w", **profile)
+        )
+        # Set nbits=1 to reduce file size, see https://gis.stackexchange.com/a/338424
+        mask_dsts = {
+            threshold: stack.enter_context(
+                rasterio.open(
+                    f"{mask_path}windspeed_120_{threshold}m.tif",
+                    "w",
+                    nbits=1,
+                    **profile,
+                )
+            )
+            for threshold in thresholds
+        }
 
-            # Write the output to GeoTIFF
-            # Set nbits=1 to reduce file size, see https://gis.stackexchange.com/a/338424
-            with rasterio.open(
-                f"{output_path}windspeed_120_{name}.tif", "w", nbits=1, **profile
-            ) as dst:
-                dst.write(mask, 1)
+        # Classify the raster in a single pass along its block structure and write all outputs per window
+        for _, window in src.block_windows(1):
+            r, g, b = src.read((1, 2, 3), window=window)
+            classes = class_lut[pack_rgb(r, g, b)]
+            class_dst.write(classes, 1, window=window)
+            for threshold, dst in mask_dsts.items():
+                dst.write(mask_luts[threshold][classes], 1, window=window)
@@ -0,0 +1,172 @@
+# Zonal statistics of the results per administrative unit: All units of a level, e.g. all districts, are rasterized once
+# into a label raster on the grid of the results. The eligible area of every unit is then counted for every result
+# raster with a single bincount over the labels, instead of running an ExclusionCalculator per unit.
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from osgeo import gdal, ogr
+
+from cog import availability
+
+gdal.UseExceptions()
+ogr.UseExceptions()
+
+
+def label_raster(
+    reference: str, source: str, where: str, output: str, name_field: str = "name"
+) -> pd.DataFrame:
+    """
+    Rasterizes the units of a vector source into a label raster on the grid of a reference raster. Label 0 marks pixels
+    that belong to no unit.
+
+    :param reference: Path of a raster defining the grid, e.g. the result of the fixed excludes
+    :param source: Path of the vector source, e.g. VerwaltungsEinheit.shp
+    :param where: Where clause selecting the units of one level, e.g. "art = 'Landkreis'"
+    :param output: Path of the label raster
+    :param name_field: Field with the name of a unit
+    :return: DataFrame of the label and name of every unit
+    """
+    grid = gdal.Open(reference)
+    layer = ogr.Open(source).GetLayer()
+    layer.SetAttributeFilter(where)
+    if layer.GetFeatureCount() >= 2**16:
+        raise ValueError(f"{source} has more units than fit into a uint16 label raster")
+
+    # Copy the units to memory together with their label, which is burned into the raster
+    memory = ogr.GetDriverByName("Memory").CreateDataSource("")
+    units = memory.CreateLayer("units", srs=layer.GetSpatialRef())
+    units.CreateField(ogr.FieldDefn("label", ogr.OFTInteger))
+    names = []
+    for feature in layer:
+        unit = ogr.Feature(units.GetLayerDefn())
+        unit.SetGeometry(feature.GetGeometryRef().Clone())
+        unit.SetField("label", len(names) + 1)
+        units.CreateFeature(unit)
+        names.append(feature.GetField(name_field))
+
+    dataset = gdal.GetDriverByName("GTiff").Create(
+        output,
+        grid.RasterXSize,
+        grid.RasterYSize,
+        1,
+        gdal.GDT_UInt16,
+        options=["COMPRESS=DEFLATE", "TILED=YES", "BIGTIFF=IF_SAFER"],
+    )
+    dataset.SetGeoTransform(grid.GetGeoTransform())
+    dataset.SetProjection(grid.GetProjection())
+    # The units are transformed to the spatial reference system of the raster while rasterizing
+    gdal.RasterizeLayer(dataset, [1], units, options=["ATTRIBUTE=label"])
+    dataset = None
+    return pd.DataFrame({"label": range(1, len(names) + 1), "name": names})
+
+
+def zonal_counts(
+    path: str, label_paths: List[str], sizes: List[int], block_rows: int = 4096
+) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Counts the pixels of every unit within the region and the available pixels of every unit of a result raster,
+    processing the rasters in blocks of rows.
+
+    :param path: Path of a result raster, see cog.py
+    :param label_paths: Paths of label rasters on the grid of the result raster
+    :param sizes: Number of labels (including 0) of every label raster
+    :param block_rows: Number of rows read at once
+    :return: Tuple of the region pixels and the available pixels indexed by label for every label raster
+    """
+    dataset = gdal.Open(path)
+    band = dataset.GetRasterBand(1)
+    label_datasets = [gdal.Open(label_path) for label_path in label_paths]
+    counts = [(np.zeros(size, np.int64), np.zeros(size, np.int64)) for size in sizes]
+    cols = dataset.RasterXSize
+    for row in range(0, dataset.RasterYSize, block_rows):
+        rows = min(block_rows, dataset.RasterYSize - row)
+        valid = band.GetMaskBand().ReadAsArray(0, row, cols, rows) > 0
+        available = availability(band.ReadAsArray(0, row, cols, rows), path) & valid
+        for labels, (region_pixels, available_pixels), size in zip(
+            label_datasets, counts, sizes
+        ):
+            block = labels.ReadAsArray(0, row, cols, rows)
+            region_pixels += np.bincount(block[valid], minlength=size)
+            available_pixels += np.bincount(block[available], minlength=size)
+    return counts
+
+
+def zonal_statistics(
+    results: List[Tuple[str, float, str]],
+    source: str,
+    levels: Dict[str, str],
+    label_pattern: str,
+    name_field: str = "name",
+    workers: int = None,
+) -> pd.DataFrame:
+    """
+    Calculates the eligible area of every administrative unit for every result raster.
+
+    :param results: List of (scenario, buffer, path) of the result rasters, all on the same grid
+    :param source: Path of the vector source of the units, e.g. VerwaltungsEinheit.shp
+    :param levels: Dict of level name -> where clause selecting the units of the level, e.g. "art = 'Landkreis'"
+    :param label_pattern: Format string of the paths of the label rasters with the field level
+    :param name_field: Field with the name of a unit
+    :param workers: Number of worker processes, each processing one result raster at a time
+    :return: Long format DataFrame with one row per level, unit, scenario and buffer
+    """
+    reference = results[0][2]
+    transform = gdal.Open(reference).GetGeoTransform()
+    pixel_km2 = abs(transform[1] * transform[5]) / 1e6
+
+    label_paths = []
+    units = []
+    for level, where in levels.items():
+        print(f"Rasterizing units ({level})")
+        label_path = label_pattern.format(level=level)
+        level_units = label_raster(reference, source, where, label_path, name_field)
+        label_paths.append(label_path)
+        units.append(level_units)
+    sizes = [len(level_units) + 1 for level_units in units]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(zonal_counts, path, label_paths, sizes)
+            for _, _, path in results
+        ]
+        frames = []
+        for (scenario, buffer, path), future in zip(results, futures):
+            print(f"Calculating zonal statistics of {path}")
+            for level, level_units, (region_pixels, available_pixels) in zip(
+                levels, units, future.result()
+            ):
+                labels = level_units["label"].to_numpy()
+                frames.append(
+                    level_units.assign(
+                        level=level,
+                        scenario=scenario,
+                        buffer=buffer,
+                        region_km2=region_pixels[labels] * pixel_km2,
+                        available_km2=available_pixels[labels] * pixel_km2,
+                        percent_available=100
+                        * available_pixels[labels]
+                        / np.maximum(region_pixels[labels], 1),
+                    )
+                )
+    return pd.concat(frames, ignore_index=True)[
+        [
+            "level",
+            "label",
+            "name",
+            "scenario",
+            "buffer",
+            "region_km2",
+            "available_km2",
+            "percent_available",
+        ]
+    ]
+
+
+def save_statistics(statistics: pd.DataFrame, output: str):
+    """Writes statistics, e.g. the zonal statistics, to a CSV file or, if output ends with .parquet, to a Parquet file."""
+    if output.endswith(".parquet"):
+        statistics.to_parquet(output, index=False)
+    else:
+        statistics.to_csv(output, index=False)